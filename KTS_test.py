@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from src.qube_pm_api_client.cassette import QubePMPLRecordingTransport, QubePMPLReplayTransport
 from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession
 
 @pytest.fixture
@@ -13,9 +14,23 @@ def base_url() -> str:
     # fetch from .env
     return os.getenv("KTS_URL")
 
+# KTS_CASSETTE: with KTS_URL set, record the run into this cassette; without it, replay the cassette offline
+# (no credentials needed: they are all scrubbed from the recording).
+@pytest.fixture(scope="module")
+def transport():
+    cassette = os.getenv("KTS_CASSETTE")
+    if not cassette:
+        yield None
+    elif os.getenv("KTS_URL"):
+        with QubePMPLRecordingTransport(cassette) as recording:
+            yield recording
+    else:
+        # Invoice numbers are generated per run, so replay falls back to recording order.
+        yield QubePMPLReplayTransport(cassette, strict=False)
+
 @pytest.fixture
-def session(base_url: str) -> QubePMPLAPISession:
-    client = QubePMPLAPIClient(base_url=base_url, username=os.getenv("KTS_USERNAME"), password=os.getenv("KTS_PASSWORD"), group=os.getenv("KTS_GROUP"))
+def session(base_url: str, transport) -> QubePMPLAPISession:
+    client = QubePMPLAPIClient(base_url=base_url, username=os.getenv("KTS_USERNAME"), password=os.getenv("KTS_PASSWORD"), group=os.getenv("KTS_GROUP"), transport=transport)
     return client.get_session()
 
 def test_get_users(session: QubePMPLAPISession):
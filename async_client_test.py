@@ -0,0 +1,229 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+from conftest import LOGIN_OK
+from src.qube_pm_api_client.async_client import (
+    QubePMPLAsyncAPIClient,
+    QubePMPLAsyncAPISession,
+)
+from src.qube_pm_api_client.async_transport import QubePMPLAsyncTransport
+from src.qube_pm_api_client.main import QubePMPLInvoice
+
+LOGIN_ERROR = b"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><LoginResponse><status error-code="123" error-message="Bad creds"/></LoginResponse></soapenv:Body></soapenv:Envelope>"""
+
+
+# Echoes the SOAPAction and request body back, chunked when the path asks for it.
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if b"<password>bad</password>" in body:
+            payload = LOGIN_ERROR
+        elif b"Login-Overload-4" in body:
+            payload = LOGIN_OK
+        else:
+            payload = self.headers["SOAPAction"].encode() + b"\n" + body
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        if self.path.endswith("chunked/"):
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(payload), 100):
+                chunk = payload[i : i + 100]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/qubews/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_session_methods_build_same_requests(server_url):
+    async def run():
+        async with QubePMPLAsyncTransport() as transport:
+            session = QubePMPLAsyncAPISession("sess-1", base_url=server_url, transport=transport)
+            users = await session.get_users("U1", exact=True)
+            heading = await session.get_fund_heading("P1", "Admin Charge")
+            close = await session.close_report()
+            with pytest.raises(ValueError):
+                await session.get_fund()
+            return users, heading, close
+
+    users, heading, close = asyncio.run(run())
+    assert users.status_code == 200
+    assert users.text.startswith("http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia")
+    assert b'<reference exact="true">U1</reference>' in users.content
+    assert b"sess-1" in users.content
+    assert b"<fund-type>Admin Charge</fund-type>" in heading.content
+    assert close.text.startswith("http://qube.qubeglobal.com/ns/webservice/CloseReport")
+
+
+def test_async_client_get_session_and_post_invoice(server_url):
+    invoice = QubePMPLInvoice(
+        supplier_ref="SUP1",
+        invoice_number="INV-1",
+        nett=100.0,
+        vat=20.0,
+        gross=120.0,
+        invoice_date="2024-06-01",
+        period_start="2024-05-01",
+        period_finish="2024-05-31",
+        prompt_payment_due="2024-06-01",
+        payment_due="2024-06-01",
+        vat_code="1",
+    )
+
+    async def run():
+        async with QubePMPLAsyncAPIClient(server_url, "u", "p", "g") as client:
+            session = await client.get_session()
+            assert session.transport is client.transport
+            return await session.post_invoice(invoice, "P1", "user", "1181")
+
+    response = asyncio.run(run())
+    assert b"<gross>120.00</gross>" in response.content
+    assert b"PUR:Invoice.ws" in response.content
+
+
+def test_async_client_get_session_raises_on_login_error(server_url):
+    async def run():
+        async with QubePMPLAsyncAPIClient(server_url, "u", "bad", "g") as client:
+            await client.get_session()
+
+    with pytest.raises(Exception) as exc:
+        asyncio.run(run())
+    assert "Session creation failed" in str(exc.value)
+
+
+def test_async_transport_shares_connections_across_many_calls(server_url):
+    async def run():
+        transport = QubePMPLAsyncTransport(max_connections_per_host=8)
+        session = QubePMPLAsyncAPISession("s1", base_url=server_url, transport=transport)
+        responses = await asyncio.gather(*(session.get_properties(f"P{i}") for i in range(200)))
+        await transport.aclose()
+        return responses, transport.stats()
+
+    responses, stats = asyncio.run(run())
+    assert all(b">P%d<" % i in r.content for i, r in enumerate(responses))
+    assert stats.requests == 200
+    assert stats.connections_opened <= 8
+
+
+def test_async_transport_serves_successive_event_loops(server_url):
+    transport = QubePMPLAsyncTransport(max_connections_per_host=2)
+    session = QubePMPLAsyncAPISession("s1", base_url=server_url, transport=transport)
+
+    async def run(first):
+        return await asyncio.gather(*(session.get_properties(f"P{i}") for i in range(first, first + 10)))
+
+    # Each asyncio.run() has its own loop; the first loop's semaphores and connections must not leak into it.
+    for first in (0, 10):
+        responses = asyncio.run(run(first))
+        assert all(b">P%d<" % (first + i) in r.content for i, r in enumerate(responses))
+    asyncio.run(transport.aclose())
+    assert transport.stats().requests == 20
+    assert transport.stats().connections_opened <= 4
+
+
+def test_async_transport_reads_chunked_responses(server_url):
+    async def run():
+        async with QubePMPLAsyncTransport() as transport:
+            session = QubePMPLAsyncAPISession(
+                "s1", base_url=server_url + "chunked/", transport=transport
+            )
+            return await session.get_users()
+
+    response = asyncio.run(run())
+    assert response.content.endswith(b"</soapenv:Envelope>")
+    assert b"<user-lookup>" in response.content
+
+
+# Raw asyncio server: reads each request and answers with reply(count) (None: close without answering),
+# then closes the connection if close_after is set. Counts requests and connections.
+
+
+async def raw_server(reply, close_after=False):
+    seen = {"requests": 0, "connections": 0}
+
+    async def handle(reader, writer):
+        seen["connections"] += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = int(head.lower().split(b"content-length:", 1)[1].split(b"\r\n", 1)[0])
+                await reader.readexactly(length)
+                seen["requests"] += 1
+                response = reply(seen["requests"])
+                if response is None:
+                    break
+                writer.write(response)
+                await writer.drain()
+                if close_after:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/qubews/", seen
+
+
+def ok(body=b"<ok/>", headers=b""):
+    return b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n%s" % (len(body), headers, body)
+
+
+def test_async_transport_never_resends_after_writing():
+    async def run():
+        server, url, seen = await raw_server(lambda n: None)
+        async with server, QubePMPLAsyncTransport() as transport:
+            with pytest.raises(ConnectionError, match="closed without a response"):
+                await transport.post(url, b"<post-journal/>", {"SOAPAction": "post"})
+        return seen
+
+    assert asyncio.run(run()) == {"requests": 1, "connections": 1}
+
+
+def test_async_transport_drops_idle_connections_closed_by_server():
+    async def run():
+        server, url, seen = await raw_server(lambda n: ok(), close_after=True)
+        async with server, QubePMPLAsyncTransport() as transport:
+            first = await transport.post(url, b"<a/>", {"SOAPAction": "a"})
+            await asyncio.sleep(0.05)
+            second = await transport.post(url, b"<b/>", {"SOAPAction": "b"})
+        return first, second, seen, transport.stats()
+
+    first, second, seen, stats = asyncio.run(run())
+    assert first.content == second.content == b"<ok/>"
+    assert seen == {"requests": 2, "connections": 2}
+    assert stats.connections_opened == 2
+
+
+def test_async_transport_requires_a_sized_body_on_keep_alive():
+    unsized = b"HTTP/1.1 200 OK\r\n\r\n<ok/>"
+    closing = b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n<ok/>"
+
+    async def run():
+        server, url, _ = await raw_server(lambda n: unsized if n == 1 else closing, close_after=True)
+        async with server, QubePMPLAsyncTransport() as transport:
+            with pytest.raises(ConnectionError, match="no Content-Length"):
+                await transport.post(url, b"<a/>", {"SOAPAction": "a"})
+            return await transport.post(url, b"<b/>", {"SOAPAction": "b"})
+
+    assert asyncio.run(run()).content == b"<ok/>"
@@ -0,0 +1,144 @@
+import pytest
+
+from src.qube_pm_api_client.batch import DATE_ORDER, QubePMPLInvoiceBatch, to_pence
+from src.qube_pm_api_client.builder import QubePMPLRequestBuilder
+from src.qube_pm_api_client.bulk import QubePMPLBulkPoster
+from src.qube_pm_api_client.journal import CONFIRMED, QubePMPLPostingJournal
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession, QubePMPLInvoice
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.standin import QubePMPLStandInServer
+
+
+def make_row(number, nett="100.00", vat="20.00", gross="120.00", **dates):
+    row = {
+        "supplier_ref": "SUP1",
+        "invoice_number": number,
+        "nett": nett,
+        "vat": vat,
+        "gross": gross,
+        "invoice_date": "2024-06-01",
+        "period_start": "2024-05-01",
+        "period_finish": "2024-05-31",
+        "prompt_payment_due": "2024-06-14",
+        "payment_due": "2024-06-30",
+        "vat_code": "1",
+    }
+    row.update(dates)
+    return row
+
+
+def test_to_pence_is_exact():
+    assert to_pence("0.10") == 10
+    assert to_pence(0.1 + 0.2) == 30
+    assert to_pence(19.99) == 1999
+    assert to_pence("2.005") == 201
+    assert to_pence(12) == 1200
+    with pytest.raises(ValueError, match="Invalid amount"):
+        to_pence("12,50")
+
+
+def test_rows_read_back_like_invoices_with_interned_references():
+    batch = QubePMPLInvoiceBatch.from_rows(
+        [make_row("INV-1"), make_row("INV-2", "0.10", "0.02", "0.12") | {"supplier_ref": "".join(["SU", "P1"])}]
+    )
+    assert len(batch) == 2
+    assert batch.gross.typecode == "q" and list(batch.gross) == [12000, 12]
+    assert batch.supplier_ref[0] is batch.supplier_ref[1]
+    row = batch[-1]
+    assert (row.invoice_number, row.nett, row.vat, row.gross) == ("INV-2", 0.1, 0.02, 0.12)
+    assert (row.invoice_date, row.payment_due, row.invoice_link, row.lines) == ("2024-06-01", "2024-06-30", "", None)
+    assert row.to_invoice().__dict__ == QubePMPLInvoice(**make_row("INV-2", 0.1, 0.02, 0.12)).__dict__
+    assert [r.invoice_number for r in batch] == ["INV-1", "INV-2"]
+    with pytest.raises(IndexError):
+        batch[2]
+
+
+def test_validate_reports_totals_and_dates_in_row_order():
+    batch = QubePMPLInvoiceBatch.from_rows(
+        [
+            make_row("OK-0"),
+            make_row("SUM-1", gross="120.01"),
+            make_row("DATE-2", period_finish="2024-04-30"),
+            make_row("MISSING-3", payment_due="", invoice_date="01/06/2024"),
+            make_row("DUE-4", prompt_payment_due="2024-07-01"),
+            make_row("OK-5", "0.10", "0.20", "0.30"),
+        ]
+    )
+    errors = batch.validate()
+    assert [(e.index, e.invoice_number, e.field) for e in errors] == [
+        (1, "SUM-1", "gross"),
+        (3, "MISSING-3", "invoice_date"),
+        (3, "MISSING-3", "payment_due"),
+    ]
+    assert errors[0].message == "nett 100.00 + vat 20.00 is not gross 120.01"
+    # Date orderings Qube doesn't enforce are only checked on request.
+    errors = batch.validate(date_order=DATE_ORDER)
+    assert [(e.index, e.field) for e in errors] == [
+        (1, "gross"),
+        (2, "period_finish"),
+        (3, "invoice_date"),
+        (3, "payment_due"),
+        (4, "payment_due"),
+    ]
+    assert errors[1].message == "period_finish is before period_start"
+
+
+def test_batch_rows_render_the_same_request_as_invoices():
+    invoice = QubePMPLInvoice(**make_row("INV-7", 100.0, 20.0, 120.0), invoice_link="https://docs/7.pdf")
+    row = QubePMPLInvoiceBatch.from_invoices([invoice])[0]
+    builder = QubePMPLRequestBuilder()
+    assert builder.post_invoice("key", row, "001/01", "USER0001", "1181") == builder.post_invoice(
+        "key", invoice, "001/01", "USER0001", "1181"
+    )
+    session = QubePMPLAPISession("key")
+    assert session.post_invoice_request(row, "001/01", "USER0001", "1181") == session.post_invoice_request(
+        invoice, "001/01", "USER0001", "1181"
+    )
+
+
+def test_bulk_poster_posts_batch_jobs_with_journal(tmp_path):
+    batch = QubePMPLInvoiceBatch()
+    for number in range(20):
+        batch.append("SUP1", f"INV-{number}", 100, 20, 120, "2024-06-01", "2024-05-01", "2024-05-31",
+                     "2024-06-14", "2024-06-30", "1", fund_heading_uid=str(1000 + number % 3))
+    assert batch.validate() == []
+    with QubePMPLStandInServer() as server:
+        client = QubePMPLAPIClient(server.url, "u", "p", "g", auto_close_report=True)
+        pool = QubePMPLSessionPool(client, size=4)
+        with QubePMPLPostingJournal(str(tmp_path / "journal.db")) as journal:
+            poster = QubePMPLBulkPoster(pool, journal=journal)
+            results = list(poster.post(batch.jobs("USER0001", property_ref="001/01")))
+            assert all(result.success for result in results), results
+            assert journal.state("SUP1", "INV-19") == CONFIRMED
+        pool.close()
+        assert len(server.posted) == 20
+
+
+def test_jobs_refuses_invalid_rows_before_creating_any():
+    batch = QubePMPLInvoiceBatch.from_rows(
+        [make_row("OK-0"), make_row("SUM-1", gross="120.01"), make_row("DATE-2", payment_due="30/06/2024")]
+    )
+    with pytest.raises(ValueError, match=r"2 error\(s\): row 1 \(SUM-1\): nett .*; row 2 \(DATE-2\): payment_due"):
+        batch.jobs("USER0001", property_ref="001/01")
+    with pytest.raises(ValueError, match=r"1 error\(s\): row 2 \(DATE-2\)"):
+        batch.jobs("USER0001", indexes=iter([0, 2]))
+    jobs = list(batch.jobs("USER0001", property_ref="001/01", indexes=iter([0])))
+    assert [(job.invoice.invoice_number, job.property_ref) for job in jobs] == [("OK-0", "001/01")]
+
+
+def test_jobs_can_leave_out_invalid_rows_and_post_the_rest():
+    batch = QubePMPLInvoiceBatch.from_rows(
+        [
+            make_row("OK-0"),
+            make_row("SUM-1", gross="120.01"),
+            make_row("CREDIT-2", invoice_date="2024-07-01"),
+        ]
+    )
+    invalid = []
+    jobs = list(batch.jobs("USER0001", property_ref="001/01", invalid=invalid))
+    assert [job.invoice.invoice_number for job in jobs] == ["OK-0", "CREDIT-2"]
+    assert [(error.index, error.field) for error in invalid] == [(1, "gross")]
+    invalid = []
+    jobs = list(batch.jobs("USER0001", invalid=invalid, date_order=DATE_ORDER))
+    assert [job.invoice.invoice_number for job in jobs] == ["OK-0"]
+    assert [error.index for error in invalid] == [1, 2]
@@ -0,0 +1,69 @@
+import argparse
+import time
+
+from src.qube_pm_api_client.builder import QubePMPLRequestBuilder
+from src.qube_pm_api_client.main import QubePMPLAPISession, QubePMPLInvoice
+
+##############################################
+# Request construction: f-string path vs pre-compiled byte templates
+# Run from the repo root: python -m benchmarks.builder_benchmark
+##############################################
+
+
+def make_invoices(count: int) -> list[QubePMPLInvoice]:
+    return [
+        QubePMPLInvoice(
+            supplier_ref=f"SUP{i % 500}",
+            invoice_number=f"INV-{i:06d}",
+            nett=100.0 + i % 97,
+            vat=20.0,
+            gross=120.0 + i % 97,
+            invoice_date="2024-06-01",
+            period_start="2024-05-01",
+            period_finish="2024-05-31",
+            prompt_payment_due="2024-06-01",
+            payment_due="2024-06-01",
+            vat_code="1",
+            invoice_link=f"https://docs.test/{i}.pdf" if i % 2 else "",
+        )
+        for i in range(count)
+    ]
+
+
+# Time building (and encoding to bytes, as requests would) every invoice body.
+
+
+def run(session: QubePMPLAPISession, invoices: list[QubePMPLInvoice]) -> tuple[float, int]:
+    start = time.perf_counter()
+    size = 0
+    for invoice in invoices:
+        _, data = session.post_invoice_request(invoice, "001/01", "user", "1181")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        size += len(data)
+    return time.perf_counter() - start, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", type=int, default=100_000)
+    args = parser.parse_args()
+
+    invoices = make_invoices(args.invoices)
+    paths = {
+        "f-string": QubePMPLAPISession("bench"),
+        "template": QubePMPLAPISession("bench", request_builder=QubePMPLRequestBuilder()),
+        "compact": QubePMPLAPISession("bench", request_builder=QubePMPLRequestBuilder(compact=True)),
+    }
+    baseline = None
+    for name, session in paths.items():
+        elapsed, size = run(session, invoices)
+        baseline = baseline or elapsed
+        print(
+            f"{name:<10} {elapsed:7.3f} s  {elapsed / len(invoices) * 1e6:6.2f} us/body  "
+            f"{size / len(invoices):7.0f} bytes/body  x{baseline / elapsed:4.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
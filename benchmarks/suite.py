@@ -0,0 +1,330 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from contextlib import ExitStack
+from importlib import metadata
+
+from src.qube_pm_api_client.builder import QubePMPLRequestBuilder
+from src.qube_pm_api_client.main import (
+    QubePMPLAPIClient,
+    QubePMPLAPISession,
+    QubePMPLInvoice,
+)
+from src.qube_pm_api_client.results import parse_lookup, parse_post_journal, parse_status
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset, QubePMPLStandInServer
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+##############################################
+# Benchmark suite: request building, response parsing and end-to-end calls
+# Run from the repo root: python -m benchmarks.suite --output results.json
+# Compare against an earlier run: python -m benchmarks.suite --compare baseline.json
+##############################################
+
+# Every benchmark produces one result:
+#   group / name / params: what was measured
+#   samples: number of timings behind the percentiles
+#   ops_per_sec, mean_us, p50_us, p99_us: per-operation figures
+# Micro benchmarks time `number` operations per sample and divide, end-to-end benchmarks time every call.
+
+SCHEMA_VERSION = 1
+
+
+def make_invoice(number: str) -> QubePMPLInvoice:
+    return QubePMPLInvoice(
+        supplier_ref="SUP1",
+        invoice_number=number,
+        nett=100.0,
+        vat=20.0,
+        gross=120.0,
+        invoice_date="2024-06-01",
+        period_start="2024-05-01",
+        period_finish="2024-05-31",
+        prompt_payment_due="2024-06-01",
+        payment_due="2024-06-01",
+        vat_code="1",
+    )
+
+
+def summarize(group: str, name: str, params: dict, timings: list[float], ops: int | None = None, wall: float | None = None) -> dict:
+    timings = sorted(timings)
+    mean = statistics.fmean(timings)
+    if wall is None:
+        ops_per_sec = 1.0 / statistics.median(timings)
+    else:
+        ops_per_sec = ops / wall
+    return {
+        "group": group,
+        "name": name,
+        "params": params,
+        "samples": len(timings),
+        "ops_per_sec": round(ops_per_sec, 1),
+        "mean_us": round(mean * 1e6, 3),
+        "p50_us": round(statistics.median(timings) * 1e6, 3),
+        "p99_us": round(timings[max(0, int(len(timings) * 0.99) - 1)] * 1e6, 3),
+    }
+
+
+# Time fn() `number` times per sample, `repeat` samples.
+
+
+def micro(group: str, name: str, fn: Callable[[], object], number: int, repeat: int, **params) -> dict:
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return summarize(group, name, params, timings)
+
+
+# Request building
+
+
+def bench_build(number: int, repeat: int) -> list[dict]:
+    results = []
+    invoice = make_invoice("INV-000001")
+    body = "<web:Logout><web:ClientSessionKey>key</web:ClientSessionKey></web:Logout>"
+    session = QubePMPLAPISession("bench")
+    results.append(micro("build", "add_soap_envelope", lambda: session.add_soap_envelope(body), number, repeat))
+    for path, builder in (("fstring", None), ("template", QubePMPLRequestBuilder())):
+        session = QubePMPLAPISession("bench", request_builder=builder)
+        client = QubePMPLAPIClient("http://offline/", "user", "secret", "group", request_builder=builder)
+        operations = {
+            "login": lambda: client.login_request("bench"),
+            "logout": session.logout_request,
+            "close_report": session.close_report_request,
+            "get_users": session.get_users_request,
+            "get_properties": lambda: session.get_properties_request("001/01", True),
+            "get_fund": lambda: session.get_fund_request(property_ref="001/01"),
+            "get_fund_heading": lambda: session.get_fund_heading_request("001/01", "Service Charge"),
+            "post_invoice": lambda: session.post_invoice_request(invoice, "001/01", "USER0001", "1000"),
+        }
+        for operation, build in operations.items():
+            results.append(micro("build", f"{operation}_request", build, number, repeat, path=path))
+    return results
+
+
+# Response parsing, on lookup payloads of increasing size
+
+
+def lookup_payload(records: int) -> bytes:
+    rows = "".join(
+        f"<property><reference>{i:05d}/01</reference><unique-id>{i}</unique-id><name>Property {i}</name></property>"
+        for i in range(records)
+    )
+    return (
+        '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body>'
+        f'<QubeProcess-1iaResponse><property-lookup success="true">{rows}</property-lookup>'
+        "</QubeProcess-1iaResponse></soapenv:Body></soapenv:Envelope>"
+    ).encode()
+
+
+def bench_parse(number: int, repeat: int, sizes: list[int]) -> list[dict]:
+    login = b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><Login-Overload-4Response><status error-code="" error-message=""/></Login-Overload-4Response></soapenv:Body></soapenv:Envelope>'
+    posted = b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><QubeProcess-1iaResponse><post-journal><success>true</success></post-journal></QubeProcess-1iaResponse></soapenv:Body></soapenv:Envelope>'
+    client = QubePMPLAPIClient("http://offline/", "user", "secret", "group")
+    results = [
+        micro("parse", "check_login_response", lambda: client.check_login_response(login), number, repeat),
+        micro("parse", "parse_status", lambda: parse_status(login), number, repeat),
+        micro("parse", "parse_post_journal", lambda: parse_post_journal(posted), number, repeat),
+    ]
+    for size in sizes:
+        payload = lookup_payload(size)
+        # Keep the total work per sample roughly constant across sizes.
+        runs = max(1, number // max(1, size))
+        results.append(
+            micro("parse", "parse_lookup", lambda: parse_lookup(payload, "property"), runs, repeat, records=size, bytes=len(payload))
+        )
+        results.append(
+            micro(
+                "parse",
+                "parse_lookup_chunked",
+                lambda: parse_lookup(
+                    (payload[i : i + 65536] for i in range(0, len(payload), 65536)), "property"
+                ),
+                runs,
+                repeat,
+                records=size,
+                bytes=len(payload),
+            )
+        )
+    return results
+
+
+# End-to-end calls against the local stand-in, `threads` sessions calling concurrently.
+
+
+def e2e(
+    group_name: str,
+    client: QubePMPLAPIClient,
+    threads: int,
+    calls: int,
+    call: Callable[[QubePMPLAPISession, int], object],
+    **params,
+) -> list[dict]:
+    sessions = [client.get_session() for _ in range(threads)]
+    call_timings: list[list[float]] = [[] for _ in range(threads)]
+    close_timings: list[list[float]] = [[] for _ in range(threads)]
+    per_thread = max(1, calls // threads)
+
+    def worker(index: int) -> None:
+        session = sessions[index]
+        for i in range(per_thread):
+            start = time.perf_counter()
+            call(session, index * per_thread + i)
+            middle = time.perf_counter()
+            session.close_report()
+            close_timings[index].append(time.perf_counter() - middle)
+            call_timings[index].append(middle - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - start
+    total = per_thread * threads
+    params = {"threads": threads, **params}
+    return [
+        summarize("e2e", group_name, params, [t for ts in call_timings for t in ts], total, wall),
+        summarize("e2e", f"{group_name}.close_report", params, [t for ts in close_timings for t in ts], total, wall),
+    ]
+
+
+# url: an already running stand-in (python -m src.qube_pm_api_client.standin) with its default dataset.
+# Running the stand-in in its own process keeps it from competing with the client for the GIL.
+
+
+def bench_e2e(calls: int, threads: list[int], latency: float, url: str | None = None) -> list[dict]:
+    results = []
+    run_id = time.time_ns()
+    with ExitStack() as stack:
+        if url is None:
+            dataset = QubePMPLStandInDataset(properties=1000)
+            url = stack.enter_context(QubePMPLStandInServer(dataset=dataset, latency=latency)).url
+            params = {"latency": latency}
+        else:
+            dataset = QubePMPLStandInDataset()
+            params = {"url": url}
+        transport = stack.enter_context(QubePMPLPooledTransport(max_connections_per_host=max(threads)))
+        client = QubePMPLAPIClient(url, "user", "secret", "group", transport=transport)
+        heading_uid = dataset.headings[("001/01", "Service Charge")][0]["unique-id"]
+        properties = len(dataset.properties)
+        for count in threads:
+            results += e2e(
+                "lookup_properties",
+                client,
+                count,
+                calls,
+                lambda s, i: s.lookup_properties(f"{i % properties + 1:03d}/01", True),
+                **params,
+            )
+            results += e2e(
+                "lookup_properties_wildcard",
+                client,
+                count,
+                max(1, calls // 10),
+                lambda s, i: s.lookup_properties(),
+                **params,
+                records=properties,
+            )
+            results += e2e(
+                "post_invoice",
+                client,
+                count,
+                calls,
+                lambda s, i, run=count: s.post_journal(
+                    make_invoice(f"INV-{run_id}-{run}-{i}"), "001/01", "USER0001", heading_uid
+                ),
+                **params,
+            )
+    return results
+
+
+def environment() -> dict:
+    try:
+        version = metadata.version("qube-pm-api-client")
+    except metadata.PackageNotFoundError:
+        version = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "schema": SCHEMA_VERSION,
+        "package_version": version,
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def key(result: dict) -> tuple:
+    return result["group"], result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def print_results(results: list[dict], baseline: dict | None) -> None:
+    previous = {key(r): r for r in baseline["results"]} if baseline else {}
+    for result in results:
+        params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        line = (
+            f"{result['group']:<6} {result['name']:<34} {params:<34} "
+            f"{result['ops_per_sec']:>12,.0f}/s  p50 {result['p50_us']:>10.2f} us  p99 {result['p99_us']:>10.2f} us"
+        )
+        before = previous.get(key(result))
+        if before:
+            line += f"  p50 x{before['p50_us'] / result['p50_us']:.2f} vs baseline"
+        print(line)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="qube-pm-api-client benchmark suite")
+    parser.add_argument("--groups", default="build,parse,e2e", help="comma separated: build, parse, e2e")
+    parser.add_argument("--number", type=int, default=2000, help="operations per micro benchmark sample")
+    parser.add_argument("--repeat", type=int, default=15, help="samples per micro benchmark")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="lookup payload sizes in records")
+    parser.add_argument("--calls", type=int, default=2000, help="end-to-end calls per benchmark")
+    parser.add_argument("--threads", default="1,8", help="comma separated end-to-end concurrency levels")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in latency per request, seconds")
+    parser.add_argument("--url", help="use a stand-in already running at this URL for the e2e group")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare p50 against")
+    parser.add_argument("--quick", action="store_true", help="small iteration counts, for smoke runs")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.number, args.repeat, args.calls, args.sizes = 50, 3, 40, "10,100"
+
+    groups = set(args.groups.split(","))
+    results = []
+    if "build" in groups:
+        results += bench_build(args.number, args.repeat)
+    if "parse" in groups:
+        results += bench_parse(args.number, args.repeat, [int(s) for s in args.sizes.split(",")])
+    if "e2e" in groups:
+        results += bench_e2e(args.calls, [int(t) for t in args.threads.split(",")], args.latency, args.url)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.qube_pm_api_client.main import QubePMPLAPISession
+from src.qube_pm_api_client.transport import (
+    QubePMPLTransport,
+    QubePMPLPooledTransport,
+)
+
+##############################################
+# Per-call latency: new connection per call vs pooled keep-alive
+# Run from the repo root: python -m benchmarks.transport_benchmark
+##############################################
+
+RESPONSE = b"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><QubeProcess-1iaResponse><user-lookup success="true"></user-lookup></QubeProcess-1iaResponse></soapenv:Body></soapenv:Envelope>"""
+
+
+# Minimal local stand-in for the Qube endpoint, answers every POST with a fixed lookup response.
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(transport: QubePMPLTransport, url: str, calls: int) -> list[float]:
+    session = QubePMPLAPISession(client_session_key="bench", base_url=url, transport=transport)
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        session.get_users()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+    mean = statistics.fmean(timings) * 1000
+    print(f"{name:<10} mean {mean:7.3f} ms   p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/qubews/"
+    try:
+        report("per-call", run(QubePMPLTransport(), url, args.calls))
+        with QubePMPLPooledTransport() as pooled:
+            report("pooled", run(pooled, url, args.calls))
+            stats = pooled.stats()
+        print(
+            f"pooled transport: {stats.requests} requests over "
+            f"{stats.connections_opened} connection(s), reuse ratio {stats.reuse_ratio:.2%}"
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import xml.etree.ElementTree as ET
+import pytest
+from unittest.mock import patch, MagicMock
+
+from conftest import make_invoice
+from src.qube_pm_api_client.builder import QubePMPLRequestBuilder, QubePMPLTemplate
+from src.qube_pm_api_client.main import (
+    QubePMPLAPIClient,
+    QubePMPLAPISession,
+    QubePMPLInvoiceLine,
+)
+
+pytestmark = pytest.mark.usefixtures("disable_session_destructor")
+
+
+def split_lines():
+    return [
+        QubePMPLInvoiceLine(60.0, 12.0, 72.0, "1", "P1", "1181"),
+        QubePMPLInvoiceLine(40.0, 8.0, 48.0, "2", "P2"),
+    ]
+
+
+def request_pairs():
+    invoice = make_invoice()
+    linked = make_invoice(invoice_link="https://docs.test/inv-1.pdf")
+    split = make_invoice(lines=split_lines())
+    return [
+        ("logout_request", ()),
+        ("close_report_request", ()),
+        ("get_users_request", ("U1", True)),
+        ("get_properties_request", ("?", False)),
+        ("get_fund_request", ("P1", "77", "OWN", "Service")),
+        ("get_fund_heading_request", ("P1", "Admin Charge")),
+        ("post_invoice_request", (invoice, "P1", "user", "1181")),
+        ("post_invoice_request", (linked, "P1", "user", "1181")),
+        ("post_invoice_request", (split, "", "user", "2290")),
+    ]
+
+
+def test_builder_matches_string_path_byte_for_byte():
+    plain = QubePMPLAPISession("sess-1", base_url="https://api.test/")
+    built = QubePMPLAPISession(
+        "sess-1", base_url="https://api.test/", request_builder=QubePMPLRequestBuilder()
+    )
+    for method, args in request_pairs():
+        action, text = getattr(plain, method)(*args)
+        built_action, data = getattr(built, method)(*args)
+        assert built_action == action
+        assert data == text.encode()
+
+    client = QubePMPLAPIClient("https://api.test/", "user", "pass", "group")
+    built_client = QubePMPLAPIClient(
+        "https://api.test/", "user", "pass", "group", request_builder=QubePMPLRequestBuilder()
+    )
+    assert built_client.login_request("k")[1] == client.login_request("k")[1].encode()
+
+
+def test_builder_escapes_interpolated_values():
+    builder = QubePMPLRequestBuilder()
+    invoice = make_invoice(
+        supplier_ref="B&Q <Ltd>", invoice_number='INV "7"', invoice_link="https://d.test/?a=1&b=2"
+    )
+    _, data = builder.post_invoice("k", invoice, "P1", "user", "1181")
+    root = ET.fromstring(data)
+    assert root.find(".//supplier-reference").text == "B&Q <Ltd>"
+    assert root.find(".//document").get("saveas") == 'INV "7"'
+    assert root.find(".//document").text == "https://d.test/?a=1&b=2"
+    assert root.find(".//nett").text == "100.00"
+
+
+def test_builder_renders_non_text_values_and_nul_field_by_field():
+    builder = QubePMPLRequestBuilder()
+    _, data = builder.get_fund("k", property_ref="P\x00&1", fund_uid=77)
+    assert b"<property-reference>P\x00&amp;1</property-reference>" in data
+    assert b"<unique-id>77</unique-id>" in data
+    _, data = builder.post_invoice("k", make_invoice(), "P1", 1001, 1181)
+    root = ET.fromstring(data)
+    assert (root.find(".//user-id").text, root.find(".//heading-unique-id").text) == ("1001", "1181")
+
+
+def test_compact_builder_output_is_minified_and_equivalent():
+    invoice = make_invoice()
+    _, full = QubePMPLRequestBuilder().post_invoice("k", invoice, "P1", "user", "1181")
+    _, compact = QubePMPLRequestBuilder(compact=True).post_invoice("k", invoice, "P1", "user", "1181")
+    assert len(compact) < len(full) * 0.7
+    assert b">\n" not in compact and b"<!--" not in compact
+    flat = lambda data: [(e.tag, (e.text or "").strip()) for e in ET.fromstring(data).iter()]
+    assert flat(compact) == flat(full.replace(b"<!-- document -->", b""))
+
+
+def test_compact_multi_line_post_is_equivalent():
+    invoice = make_invoice(lines=split_lines(), invoice_link="https://docs.test/inv-1.pdf")
+    _, full = QubePMPLRequestBuilder().post_invoice("k", invoice, "", "user", "", invoice.detail_lines("", "2290"))
+    _, compact = QubePMPLRequestBuilder(compact=True).post_invoice(
+        "k", invoice, "", "user", "", invoice.detail_lines("", "2290")
+    )
+    assert b">\n" not in compact
+    flat = lambda data: [(e.tag, (e.text or "").strip()) for e in ET.fromstring(data).iter()]
+    assert flat(compact) == flat(full)
+    details = ET.fromstring(compact).findall(".//detail")
+    assert [d.find("heading-unique-id").text for d in details] == ["1181", "2290"]
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_client_sessions_send_builder_bytes(mock_post):
+    mock_post.return_value = MagicMock(
+        content=b'<E><status error-code="" error-message=""/></E>'
+    )
+    client = QubePMPLAPIClient(
+        "https://api.test/", "u", "p", "g", request_builder=QubePMPLRequestBuilder(compact=True)
+    )
+    session = client.get_session()
+    assert session.request_builder is client.request_builder
+    session.close_report()
+    data = mock_post.call_args.kwargs["data"]
+    assert isinstance(data, bytes)
+    assert session.client_session_key.encode() in data
+
+
+def test_template_formats_each_amount_once_and_accepts_ignored_fields():
+    template = QubePMPLTemplate(
+        "action", "<a>{x:.2f}</a><b>{x:.2f}</b><c>{name}</c>", envelope=False, ignored=("link", "name")
+    )
+    assert template.fields == ("x", "name")
+    assert template.render(x=1.5, name="a&b", link="ignored") == b"<a>1.50</a><b>1.50</b><c>a&amp;b</c>"
+    assert template.render(x=2, name=7) == b"<a>2.00</a><b>2.00</b><c>7</c>"
+    with pytest.raises(ValueError, match="not a plain name"):
+        QubePMPLTemplate("action", "<a>{v[0]}</a>", envelope=False)
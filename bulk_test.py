@@ -0,0 +1,77 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from conftest import CLOSE_OK, POST_OK, make_invoice
+from src.qube_pm_api_client.bulk import QubePMPLBulkPoster
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+
+POST_FAIL = b'<Envelope><post-journal><success>false</success><status error-code="42" error-message="Duplicate invoice"/></post-journal></Envelope>'
+
+
+def make_pool(size=3, delay=0.0):
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def post_invoice(invoice, property_ref, user_id, fund_heading_uid):
+        with lock:
+            in_flight.append(invoice)
+            peak[0] = max(peak[0], len(in_flight))
+        time.sleep(delay)
+        with lock:
+            in_flight.remove(invoice)
+        if invoice.invoice_number.startswith("BAD"):
+            return MagicMock(status_code=200, content=POST_FAIL)
+        if invoice.invoice_number.startswith("ERR"):
+            raise ConnectionError("reset by peer")
+        return MagicMock(status_code=200, content=POST_OK)
+
+    def get_session():
+        session = MagicMock()
+        session.post_invoice.side_effect = post_invoice
+        session.close_report.return_value = MagicMock(status_code=200, content=CLOSE_OK)
+        return session
+
+    client = MagicMock()
+    client.get_session.side_effect = get_session
+    return QubePMPLSessionPool(client, size=size), peak
+
+
+def test_bulk_poster_reports_each_result_and_summary():
+    pool, _ = make_pool()
+    jobs = [
+        (make_invoice("INV-1"), "P1", "user", "1181"),
+        (make_invoice("BAD-2"), "P1", "user", "1181"),
+        (make_invoice("ERR-3"), "P1", "user", "1181"),
+        (make_invoice("INV-4"), "P2", "user", "1182"),
+    ]
+    poster = QubePMPLBulkPoster(pool)
+    results = {r.index: r for r in poster.post(jobs)}
+    assert sorted(results) == [0, 1, 2, 3]
+    assert results[0].success and results[3].success
+    assert results[1].error_message == "Duplicate invoice"
+    assert "reset by peer" in results[2].error_message
+    assert results[3].job.fund_heading_uid == "1182"
+    assert poster.summary.submitted == 4
+    assert poster.summary.succeeded == 2
+    assert poster.summary.failed == 2
+    assert poster.summary.per_second > 0
+
+
+def test_bulk_poster_bounds_concurrency_and_pulls_lazily():
+    pool, peak = make_pool(size=4, delay=0.005)
+    pulled = []
+
+    def jobs():
+        for i in range(40):
+            pulled.append(i)
+            yield (make_invoice(f"INV-{i}"), "P1", "user", "1181")
+
+    poster = QubePMPLBulkPoster(pool, concurrency=2, max_pending=3)
+    stream = poster.post(jobs())
+    next(stream)
+    assert len(pulled) <= 4
+    rest = list(stream)
+    assert len(rest) == 39
+    assert peak[0] <= 2
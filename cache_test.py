@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+from conftest import LOGIN_OK
+from src.qube_pm_api_client.cache import QubePMPLLookupCache
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession
+
+pytestmark = pytest.mark.usefixtures("disable_session_destructor")
+
+HEADING_OK = b'<Envelope><heading-lookup success="true"><heading><unique-id>1181</unique-id></heading></heading-lookup></Envelope>'
+HEADING_FAIL = b'<Envelope><heading-lookup success="false"><status error-code="1" error-message="Report open"/></heading-lookup></Envelope>'
+
+
+def test_cache_lru_eviction_and_stats():
+    cache = QubePMPLLookupCache(maxsize=2)
+    cache.set(("u", "op", ("a",)), 1)
+    cache.set(("u", "op", ("b",)), 2)
+    assert cache.get_or_load(("u", "op", ("a",)), lambda: 0) == 1
+    cache.set(("u", "op", ("c",)), 3)
+    assert cache.get_or_load(("u", "op", ("b",)), lambda: "reloaded") == "reloaded"
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.size) == (1, 1, 2)
+    assert stats.evictions == 2
+
+
+def test_cache_entries_expire_after_ttl():
+    cache = QubePMPLLookupCache(ttl=0.01)
+    cache.set(("u", "op", ()), "old")
+    time.sleep(0.02)
+    assert cache.get_or_load(("u", "op", ()), lambda: "new") == "new"
+    assert cache.stats().expirations == 1
+
+
+def test_cache_invalidate_by_operation_and_args():
+    cache = QubePMPLLookupCache()
+    cache.set(("u", "get_fund", ("P1", "", "", "")), 1)
+    cache.set(("u", "get_fund_heading", ("P1", "Admin")), 2)
+    cache.set(("u", "get_fund_heading", ("P2", "Admin")), 3)
+    assert cache.invalidate("get_fund_heading", ("P1", "Admin")) == 1
+    assert cache.invalidate("get_fund_heading") == 1
+    assert cache.stats().size == 1
+    assert cache.invalidate() == 1
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_session_serves_repeat_lookups_from_cache(mock_post):
+    mock_post.return_value = MagicMock(status_code=200, content=HEADING_OK)
+    session = QubePMPLAPISession("s1", base_url="https://api.test/", cache=QubePMPLLookupCache())
+    first = session.get_fund_heading("P1", "Admin Charge")
+    second = session.get_fund_heading("P1", "Admin Charge")
+    assert first is second
+    assert mock_post.call_count == 1
+    session.get_fund_heading("P2", "Admin Charge")
+    assert mock_post.call_count == 2
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_failed_lookups_are_not_cached(mock_post):
+    mock_post.return_value = MagicMock(status_code=200, content=HEADING_FAIL)
+    session = QubePMPLAPISession("s1", base_url="https://api.test/", cache=QubePMPLLookupCache())
+    session.get_fund_heading("P1", "Admin Charge")
+    session.get_fund_heading("P1", "Admin Charge")
+    assert mock_post.call_count == 2
+    assert session.cache.stats().size == 0
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_client_sessions_share_cache_across_threads(mock_post):
+    def respond(url, data, headers, stream=False):
+        if "Login-Overload-4" in headers["SOAPAction"]:
+            return MagicMock(status_code=200, content=LOGIN_OK)
+        response = MagicMock(status_code=200, content=HEADING_OK)
+        response.iter_content.return_value = [HEADING_OK]
+        response.__enter__.return_value = response
+        return response
+
+    mock_post.side_effect = respond
+    cache = QubePMPLLookupCache()
+    client = QubePMPLAPIClient("https://api.test/", "u", "p", "g", cache=cache)
+    session = client.get_session()
+    assert session.cache is cache
+    session.lookup_fund_headings("P1", "Admin Charge")
+
+    results = []
+    sessions = [client.get_session() for _ in range(8)]
+    threads = [
+        threading.Thread(target=lambda s=s: results.append(s.lookup_fund_headings("P1", "Admin Charge")))
+        for s in sessions
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(r[0].unique_id == "1181" for r in results)
+    assert cache.stats().hits == 8
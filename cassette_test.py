@@ -0,0 +1,160 @@
+import gzip
+import pytest
+import requests
+import threading
+
+from conftest import make_invoice
+from src.qube_pm_api_client.cassette import (
+    SESSION_KEY,
+    QubePMPLCassette,
+    QubePMPLCassetteMiss,
+    QubePMPLRecordingTransport,
+    QubePMPLReplayTransport,
+)
+from src.qube_pm_api_client.main import QubePMPLAPIClient
+from src.qube_pm_api_client.results import parse_post_journal
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset, QubePMPLStandInServer
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport, QubePMPLTransport
+
+
+# Login, lookups (one streamed), a post and logout; returns what the caller would see.
+
+
+def flow(client: QubePMPLAPIClient, invoice_number: str = "INV-1") -> list:
+    seen = []
+    with client.get_session() as session:
+        seen.append([user.reference for user in session.lookup_users()])
+        session.close_report()
+        seen.append([p.reference for p in session.iter_properties("001/0?")])
+        session.close_report()
+        headings = session.lookup_fund_headings("001/01", "Service Charge")
+        seen.append([heading.unique_id for heading in headings])
+        session.close_report()
+        response = session.post_invoice(make_invoice(invoice_number), "001/01", "USER0001", headings[0].unique_id)
+        seen.append(parse_post_journal(response.content).success)
+        seen.append(session.close_report().status_code)
+    return seen
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    path = str(tmp_path / "flow.jsonl.gz")
+    dataset = QubePMPLStandInDataset(users=5, properties=12)
+    with QubePMPLStandInServer(dataset=dataset, username="user", password="s3cret-pw") as server:
+        with QubePMPLRecordingTransport(path, QubePMPLPooledTransport()) as transport:
+            client = QubePMPLAPIClient(server.url, "user", "s3cret-pw", "group", transport=transport)
+            live = flow(client)
+    return path, live
+
+
+def test_recording_is_scrubbed_and_compact(recorded):
+    path, live = recorded
+    cassette = QubePMPLCassette.load(path)
+    assert [interaction.action.rsplit("/", 1)[-1] for interaction in cassette][:2] == [
+        "Login-Overload-4",
+        "QubeProcess-1ia",
+    ]
+    assert len(cassette) == 10
+    with gzip.open(path, "rb") as f:
+        raw = f.read()
+    assert b"s3cret-pw" not in raw
+    assert raw.count(SESSION_KEY.encode()) >= len(cassette)
+    assert all(b"<password>********</password>" in i.request for i in cassette if b"<password>" in i.request)
+    with open(path, "rb") as f:
+        assert len(f.read()) < len(raw) / 3
+
+
+def test_replay_matches_live_run_offline(recorded):
+    path, live = recorded
+    transport = QubePMPLReplayTransport(path)
+    # The standin is gone; sessions get new keys but match the scrubbed recording.
+    client = QubePMPLAPIClient("http://127.0.0.1:9/qubews/", "user", "s3cret-pw", "group", transport=transport)
+    assert flow(client) == live
+    assert transport.remaining() == 0
+    with pytest.raises(QubePMPLCassetteMiss, match="No recorded response"):
+        client.get_session()
+
+
+def test_non_strict_replay_falls_back_to_recording_order(recorded):
+    path, live = recorded
+    strict = QubePMPLAPIClient("http://replay/", "user", "x", "group", transport=QubePMPLReplayTransport(path))
+    with pytest.raises(QubePMPLCassetteMiss):
+        flow(strict, invoice_number="INV-OTHER")
+
+    transport = QubePMPLReplayTransport(path, strict=False)
+    client = QubePMPLAPIClient("http://replay/", "user", "x", "group", transport=transport)
+    assert flow(client, invoice_number="INV-OTHER") == live
+    assert transport.remaining() == 0
+
+
+def test_streamed_responses_are_recorded_as_they_are_read(tmp_path):
+    path = str(tmp_path / "stream.jsonl.gz")
+    dataset = QubePMPLStandInDataset(users=5, properties=40)
+    with QubePMPLStandInServer(dataset=dataset) as server:
+        with QubePMPLRecordingTransport(path, QubePMPLPooledTransport()) as transport:
+            client = QubePMPLAPIClient(server.url, "u", "p", "g", transport=transport)
+            with client.get_session() as session:
+                response = session.make_request(*session.get_properties_request("0??/01"), stream=True)
+                # Nothing is read ahead of the caller; the exchange keeps its place in sending order.
+                assert not response._content_consumed and len(transport.cassette) == 1
+                streamed = b"".join(response.iter_content(chunk_size=64))
+                assert len(transport.cassette) == 2
+                session.close_report()
+                # Closed after one chunk: the rest is read for the recording.
+                response = session.make_request(*session.get_properties_request("0??/01"), stream=True)
+                first = next(response.iter_content(chunk_size=64))
+                response.close()
+                session.close_report()
+            recorded = list(transport.cassette)
+    assert [interaction.action.rsplit("/", 1)[-1] for interaction in recorded] == [
+        "Login-Overload-4",
+        "QubeProcess-1ia",
+        "CloseReport",
+        "QubeProcess-1ia",
+        "CloseReport",
+        "Logout",
+    ]
+    assert recorded[1].response == streamed and streamed.count(b"<property>") == 40
+    assert recorded[3].response == streamed and streamed.startswith(first)
+    assert b"<username>u</username>" not in recorded[0].request
+    assert b"<group>g</group>" not in recorded[0].request
+
+
+# Answers b"slow" only once b"fast" has been answered, and refuses to send b"fail".
+
+
+class _OutOfOrderTransport(QubePMPLTransport):
+    def __init__(self):
+        self.fast_answered = threading.Event()
+
+    def post(self, url, data, headers, stream=False, timeout=None):
+        if data == b"fail":
+            raise requests.ConnectionError("refused")
+        if data == b"slow":
+            assert self.fast_answered.wait(5)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"answer to " + data
+        if data == b"fast":
+            self.fast_answered.set()
+        return response
+
+
+def test_exchanges_keep_sending_order_and_failed_sends_are_left_out(tmp_path):
+    transport = QubePMPLRecordingTransport(str(tmp_path / "order.jsonl.gz"), _OutOfOrderTransport())
+    slow = threading.Thread(target=transport.post, args=("http://qube", b"slow", {"SOAPAction": "slow"}))
+    slow.start()
+    # The slow request has taken its place before it was sent, so the fast one is recorded after it.
+    while not transport.cassette._slots:
+        pass
+    transport.post("http://qube", b"fast", {"SOAPAction": "fast"})
+    slow.join()
+    with pytest.raises(requests.ConnectionError):
+        transport.post("http://qube", b"fail", {"SOAPAction": "fail"})
+    transport.close()
+
+    recorded = list(QubePMPLCassette.load(transport.path))
+    assert [(interaction.action, interaction.response) for interaction in recorded] == [
+        ("slow", b"answer to slow"),
+        ("fast", b"answer to fast"),
+    ]
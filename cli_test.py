@@ -0,0 +1,185 @@
+import io
+import json
+import os
+import pytest
+
+from src.qube_pm_api_client.cli import _Reporter, _Settings, main, read_rows, run
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset
+
+
+pytestmark = pytest.mark.standin(
+    dataset=QubePMPLStandInDataset(users=5, properties=12, funds_per_property=2, headings_per_fund=2),
+    username="user",
+    password="secret",
+)
+
+
+COLUMNS = (
+    "supplier_ref,invoice_number,nett,vat,gross,invoice_date,period_start,period_finish,"
+    "prompt_payment_due,payment_due,vat_code,property_ref,fund_heading_uid,fund_type,heading"
+)
+
+
+def row(number, property_ref="001/01", heading_uid="", fund_type="Service Charge", heading="Cleaning", gross="120.00"):
+    return {
+        "supplier_ref": "SUP1",
+        "invoice_number": number,
+        "nett": "100.00",
+        "vat": "20.00",
+        "gross": gross,
+        "invoice_date": "2024-06-01",
+        "period_start": "2024-05-01",
+        "period_finish": "2024-05-31",
+        "prompt_payment_due": "2024-06-01",
+        "payment_due": "2024-06-01",
+        "vat_code": "1",
+        "property_ref": property_ref,
+        "fund_heading_uid": heading_uid,
+        "fund_type": fund_type,
+        "heading": heading,
+    }
+
+
+def write_csv(path, rows):
+    lines = [COLUMNS] + [",".join(r[c] for c in COLUMNS.split(",")) for r in rows]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def run_cli(standin, tmp_path, input_path, *extra):
+    output = tmp_path / "results.jsonl"
+    status = main(
+        [
+            str(input_path),
+            "--url", standin.url,
+            "--username", "user",
+            "--password", "secret",
+            "--group", "group",
+            "--user-id", "USER0001",
+            "--output", str(output),
+            "--progress-interval", "0",
+            *extra,
+        ]
+    )
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    return status, sorted(results, key=lambda r: r["line"])
+
+
+def test_read_rows_jsonl_reports_bad_lines():
+    stream = io.StringIO('{"invoice_number": "A"}\n\nnot json\n[1, 2]\n')
+    rows = list(read_rows(stream, "jsonl"))
+    assert [line for line, _ in rows] == [1, 3, 4]
+    assert rows[0][1] == {"invoice_number": "A"}
+    assert rows[1][1]["_error"].startswith("Invalid JSON")
+    assert rows[2][1]["_error"] == "Expected a JSON object"
+
+
+def test_csv_import_resolves_headings_and_posts(standin, tmp_path):
+    heading_uid = standin.dataset.headings[("002/01", "Service Charge")][1]["unique-id"]
+    rows = [row(f"INV-{i}", property_ref=f"{i % 3 + 1:03d}/01") for i in range(6)]
+    rows.append(row("INV-uid", property_ref="002/01", heading_uid=heading_uid, fund_type="", heading=""))
+    input_path = tmp_path / "invoices.csv"
+    write_csv(input_path, rows)
+
+    status, results = run_cli(standin, tmp_path, input_path, "--sessions", "3", "--batch-size", "4")
+
+    assert status == 0
+    assert [r["line"] for r in results] == list(range(2, 9))
+    assert all(r["success"] for r in results)
+    assert len(standin.posted) == 7
+    assert standin.posted[("SUP1", "INV-uid")]
+    # Property and heading lookups are cached per (property, fund type).
+    assert standin.stats().lookups <= 6
+
+
+def test_bad_rows_are_reported_and_fail_the_run(standin, tmp_path):
+    rows = [
+        row("INV-good"),
+        row("INV-property", property_ref="999/01"),
+        row("INV-heading", heading="Nonexistent"),
+        row("INV-totals", gross="999.00"),
+        row("INV-missing", fund_type="", heading=""),
+    ]
+    input_path = tmp_path / "invoices.jsonl"
+    input_path.write_text("\n".join(json.dumps(r) for r in rows) + "\n{broken\n")
+
+    status, results = run_cli(standin, tmp_path, input_path)
+
+    assert status == 1
+    by_number = {r["invoice_number"]: r for r in results}
+    assert by_number["INV-good"]["success"]
+    assert "Unknown property" in by_number["INV-property"]["error_message"]
+    assert "No heading" in by_number["INV-heading"]["error_message"]
+    assert not by_number["INV-totals"]["success"]
+    assert by_number["INV-totals"]["error_code"] == "40"
+    assert "fund_heading_uid" in by_number["INV-missing"]["error_message"]
+    assert results[-1]["line"] == 6
+    assert results[-1]["error_message"].startswith("Invalid JSON")
+    assert list(standin.posted) == [("SUP1", "INV-good")]
+
+
+def test_worker_processes(standin, tmp_path):
+    rows = [row(f"INV-{i}", property_ref=f"{i % 5 + 1:03d}/01") for i in range(20)]
+    input_path = tmp_path / "invoices.csv"
+    write_csv(input_path, rows)
+
+    status, results = run_cli(standin, tmp_path, input_path, "--workers", "2", "--sessions", "2", "--batch-size", "5")
+
+    assert status == 0
+    assert len(results) == 20
+    assert all(r["success"] for r in results)
+    assert len(standin.posted) == 20
+    # Each worker logs its pool's sessions out on exit.
+    assert standin.stats().logouts == standin.stats().logins
+
+
+# Unpickling this in a worker process kills it, as a crash mid-batch would.
+class _KillWorker:
+    def __reduce__(self):
+        return os._exit, (1,)
+
+
+def test_dead_worker_fails_its_rows_and_the_import_goes_on(standin):
+    rows = [(i, row(f"INV-{i}")) for i in range(6)]
+    rows[4][1]["note"] = _KillWorker()
+    settings = _Settings(standin.url, "user", "secret", "group", 2, "USER0001")
+    output = io.StringIO()
+
+    summary = run(rows, settings, _Reporter(output, io.StringIO(), 0), workers=2, batch_size=2)
+
+    results = sorted((json.loads(line) for line in output.getvalue().splitlines()), key=lambda r: r["line"])
+    # Every row is reported, the dead worker's batch as failed; a broken pool may take other batches with it.
+    assert [r["line"] for r in results] == list(range(6))
+    assert not results[4]["success"] and not results[5]["success"]
+    assert results[4]["error_message"].startswith("Worker failed: BrokenProcessPool")
+    assert summary.completed == 6 and summary.failed >= 2
+    assert all(("SUP1", r["invoice_number"]) in standin.posted for r in results if r["success"])
+
+
+def test_journal_resumes_without_reposting(standin, tmp_path):
+    rows = [row(f"INV-{i}", property_ref=f"{i % 3 + 1:03d}/01") for i in range(4)]
+    input_path = tmp_path / "invoices.csv"
+    write_csv(input_path, rows)
+    journal = str(tmp_path / "journal.db")
+
+    status, results = run_cli(standin, tmp_path, input_path, "--journal", journal)
+    assert status == 0
+    assert not any(r["skipped"] for r in results)
+    lookups = standin.stats().lookups
+
+    rows.append(row("INV-new"))
+    write_csv(input_path, rows)
+    status, results = run_cli(standin, tmp_path, input_path, "--journal", journal)
+
+    assert status == 0
+    assert [r["skipped"] for r in results] == [True] * 4 + [False]
+    assert len(standin.posted) == 5
+    # Skipped rows make no lookups either.
+    assert standin.stats().lookups <= lookups + 2
+
+
+def test_missing_connection_settings(monkeypatch, capsys):
+    for name in ("QUBE_URL", "QUBE_USERNAME", "QUBE_PASSWORD", "QUBE_GROUP"):
+        monkeypatch.delenv(name, raising=False)
+    with pytest.raises(SystemExit):
+        main(["-", "--url", "http://localhost/"])
+    assert "--username" in capsys.readouterr().err
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from src.qube_pm_api_client.async_client import QubePMPLAsyncAPIClient
+from src.qube_pm_api_client.async_transport import QubePMPLAsyncTransport
+from src.qube_pm_api_client.coalesce import QubePMPLCoalescer
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.main import QubePMPLAPIClient
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+pytestmark = pytest.mark.standin(latency=0.1)
+
+
+def test_concurrent_calls_share_one_load_and_its_errors():
+    coalescer = QubePMPLCoalescer()
+    loads = []
+    release = threading.Event()
+
+    def load():
+        loads.append(1)
+        release.wait(5)
+        if len(loads) == 2:
+            raise ConnectionError("reset by peer")
+        return "result"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(coalescer.call(("k",), load))) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while coalescer.stats().calls < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 5
+    assert len(loads) == 1
+    stats = coalescer.stats()
+    assert (stats.calls, stats.coalesced, stats.in_flight) == (5, 4, 0)
+
+    # Nothing is kept after the call: the next one loads again, and its exception reaches the caller.
+    with pytest.raises(ConnectionError):
+        coalescer.call(("k",), load)
+    assert len(loads) == 2
+
+
+def test_sessions_coalesce_identical_lookups_across_threads(standin):
+    coalescer = QubePMPLCoalescer()
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(
+            standin.url, "u", "p", "g", transport=transport, coalescer=coalescer, logout_worker=worker
+        )
+        sessions = [client.get_session() for _ in range(6)]
+        barrier = threading.Barrier(len(sessions))
+        results = []
+
+        def lookup(session):
+            barrier.wait()
+            results.append(session.lookup_fund_headings("001/01", "Service Charge"))
+
+        threads = [threading.Thread(target=lookup, args=(s,)) for s in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        worker.close()
+
+    assert len(results) == 6 and all(len(r) == 4 for r in results)
+    assert standin.stats().lookups < 6
+    assert coalescer.stats().coalesced == 6 - standin.stats().lookups
+    # Only sessions that sent the lookup hold an open report.
+    assert sum(s.report_open for s in sessions) == standin.stats().lookups
+
+
+def test_async_sessions_coalesce_identical_lookups(standin):
+    coalescer = QubePMPLCoalescer()
+
+    async def run():
+        async with QubePMPLAsyncAPIClient(
+            standin.url, "u", "p", "g", transport=QubePMPLAsyncTransport(), coalescer=coalescer
+        ) as client:
+            sessions = [await client.get_session() for _ in range(5)]
+            funds = [s.lookup_funds(property_ref="002/01") for s in sessions[:4]]
+            other = sessions[4].lookup_funds(property_ref="003/01")
+            return await asyncio.gather(*funds, other)
+
+    results = asyncio.run(run())
+    assert [len(r) for r in results] == [3] * 5
+    assert results[-1][0].property_reference == "003/01"
+    assert standin.stats().lookups == 2
+    stats = coalescer.stats()
+    assert (stats.calls, stats.coalesced, stats.in_flight) == (5, 3, 0)
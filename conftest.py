@@ -0,0 +1,64 @@
+import gc
+import pytest
+
+from src.qube_pm_api_client.lifecycle import default_logout_worker
+from src.qube_pm_api_client.main import QubePMPLAPISession, QubePMPLInvoice
+from src.qube_pm_api_client.standin import QubePMPLStandInServer
+
+# Helpers shared by the test modules, which import them from here.
+
+LOGIN_OK = b"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><LoginResponse><status error-code="" error-message=""/></LoginResponse></soapenv:Body></soapenv:Envelope>"""
+CLOSE_OK = b"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><CloseReportResponse/></soapenv:Body></soapenv:Envelope>"""
+POST_OK = b"<Envelope><post-journal><success>true</success></post-journal></Envelope>"
+
+
+def make_invoice(invoice_number: str = "INV-1", **overrides) -> QubePMPLInvoice:
+    fields = dict(
+        supplier_ref="SUP1",
+        invoice_number=invoice_number,
+        nett=100.0,
+        vat=20.0,
+        gross=120.0,
+        invoice_date="2024-06-01",
+        period_start="2024-05-01",
+        period_finish="2024-05-31",
+        prompt_payment_due="2024-06-01",
+        payment_due="2024-06-01",
+        vat_code="1",
+    )
+    fields.update(overrides)
+    return QubePMPLInvoice(**fields)
+
+
+# A session dropped while logged in queues its Logout on the process wide worker. Modules whose sessions
+# log in through a fake (a patched requests.post, MagicMock responses) opt in to this with
+# pytestmark = pytest.mark.usefixtures("disable_session_destructor"), so those Logouts aren't sent for
+# real once the fake is gone. Everything else runs with the real destructor.
+
+
+@pytest.fixture
+def disable_session_destructor():
+    original = QubePMPLAPISession.__del__
+    QubePMPLAPISession.__del__ = lambda self: None
+    try:
+        yield
+        gc.collect()
+    finally:
+        QubePMPLAPISession.__del__ = original
+
+
+# A stand-in Qube server for the test. A module (or test) configures it with
+# pytestmark = pytest.mark.standin(dataset=QubePMPLStandInDataset(...), latency=...), whose keyword arguments
+# are passed to QubePMPLStandInServer. Logouts queued by dropped sessions are sent before it stops.
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "standin(**kwargs): QubePMPLStandInServer arguments for the standin fixture")
+
+
+@pytest.fixture
+def standin(request):
+    marker = request.node.get_closest_marker("standin")
+    with QubePMPLStandInServer(**(marker.kwargs if marker is not None else {})) as server:
+        yield server
+        default_logout_worker().drain(timeout=5.0)
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+import pytest
+import requests
+
+from conftest import make_invoice
+from src.qube_pm_api_client.async_client import QubePMPLAsyncAPIClient
+from src.qube_pm_api_client.async_transport import QubePMPLAsyncTransport
+from src.qube_pm_api_client.bulk import QubePMPLBulkPoster
+from src.qube_pm_api_client.deadline import (
+    QubePMPLDeadline,
+    QubePMPLDeadlineExceeded,
+    QubePMPLTimeout,
+    call_timeout,
+    current_deadline,
+    request_timeout,
+)
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.main import QubePMPLAPIClient
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.standin import QubePMPLStandInServer
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+def test_request_timeout_precedence_and_deadline_cap():
+    default = QubePMPLTimeout(5.0, 30.0)
+    assert request_timeout(None) is None
+    assert request_timeout(default) == (5.0, 30.0)
+    with call_timeout(read=2.0):
+        assert request_timeout(default) == (None, 2.0)
+        assert request_timeout(default, QubePMPLTimeout(1.0, 1.0)) == (1.0, 1.0)
+    assert request_timeout(default) == (5.0, 30.0)
+
+    with QubePMPLDeadline(10.0) as deadline:
+        assert current_deadline() is deadline
+        connect, read = request_timeout(default)
+        assert connect == 5.0 and 9.0 < read <= 10.0
+        connect, read = request_timeout(None)
+        assert 9.0 < connect <= 10.0 and 9.0 < read <= 10.0
+        # A nested deadline can only shorten the one it is entered in.
+        with QubePMPLDeadline(60.0) as inner:
+            assert inner.remaining() <= 10.0
+        with QubePMPLDeadline(1.0):
+            assert request_timeout(default)[1] <= 1.0
+    assert current_deadline() is None
+
+    # Cancellation only, no time limit.
+    with QubePMPLDeadline() as deadline:
+        assert request_timeout(None) is None
+        deadline.cancel()
+        with pytest.raises(QubePMPLDeadlineExceeded, match="cancelled"):
+            request_timeout(None)
+
+
+def test_one_deadline_entered_in_several_threads_keeps_each_parent():
+    shared = QubePMPLDeadline(30.0)
+    entered = threading.Barrier(2)
+    seen = {}
+
+    def run(name, parent):
+        with parent:
+            with shared:
+                entered.wait(5)
+                seen[name] = (current_deadline() is shared, shared.remaining(), shared.cancelled)
+                entered.wait(5)
+            seen[name + "-after"] = current_deadline() is parent
+
+    short, cancelled = QubePMPLDeadline(1.0), QubePMPLDeadline()
+    cancelled.cancel()
+    threads = [
+        threading.Thread(target=run, args=("short", short)),
+        threading.Thread(target=run, args=("cancelled", cancelled)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen["short"][0] and seen["short"][1] <= 1.0 and not seen["short"][2]
+    assert seen["cancelled"][0] and 1.0 < seen["cancelled"][1] <= 30.0 and seen["cancelled"][2]
+    assert seen["short-after"] and seen["cancelled-after"]
+    # Outside any thread's nesting the shared deadline only answers for itself.
+    assert 1.0 < shared.remaining() <= 30.0 and not shared.cancelled
+    assert current_deadline() is None
+
+
+def test_expired_deadline_raises_before_sending(standin):
+    client = QubePMPLAPIClient(standin.url, "u", "p", "g")
+    with client.get_session() as session:
+        with QubePMPLDeadline(0.0):
+            with pytest.raises(QubePMPLDeadlineExceeded, match="deadline exceeded"):
+                session.lookup_users("USER0001", exact=True)
+        assert standin.stats().lookups == 0
+        assert session.logged_in
+
+
+def test_read_timeout_leaves_report_marked_open(standin):
+    client = QubePMPLAPIClient(standin.url, "u", "p", "g", timeout=(5.0, 0.1))
+    session = client.get_session()
+    assert session.timeout == QubePMPLTimeout(5.0, 0.1)
+    standin.latency = 0.5
+    with pytest.raises(requests.Timeout):
+        session.lookup_properties("001/01", exact=True)
+    assert session.report_open is True
+
+    # A per-call override lets the slow call through.
+    with call_timeout(5.0, 5.0):
+        assert session.close_report().ok
+    assert session.report_open is False
+
+
+def test_pool_evicts_session_after_timeout_and_deadline_bounds_operation(standin):
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        pool = QubePMPLSessionPool(client, size=1)
+        standin.latency = 0.3
+        start = time.monotonic()
+        with pytest.raises(requests.Timeout):
+            with QubePMPLDeadline(0.1):
+                with pool.lease() as session:
+                    session.lookup_users("USER0001", exact=True)
+        assert time.monotonic() - start < 0.3
+        assert pool.stats().evictions == 1
+
+        standin.latency = 0.0
+        with pool.lease() as fresh:
+            assert fresh is not session
+            assert fresh.lookup_users("USER0001", exact=True).success
+        pool.close()
+    assert worker.drain(5)
+
+
+def test_deadline_bounds_a_bulk_post_in_its_worker_threads():
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLStandInServer(latency=0.3) as server, QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(server.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        pool = QubePMPLSessionPool(client, size=2)
+        with pool.lease(), pool.lease():
+            pass
+        jobs = [(make_invoice(f"INV-{i}"), "001/01", "USER0001", "1181") for i in range(6)]
+        start = time.monotonic()
+        with QubePMPLDeadline(0.1):
+            results = list(QubePMPLBulkPoster(pool).post(jobs))
+        assert time.monotonic() - start < 1.0
+        assert len(results) == 6 and not any(result.success for result in results)
+        pool.close()
+    worker.drain(5)
+
+
+def test_cancel_from_another_thread_stops_the_next_call(standin):
+    client = QubePMPLAPIClient(standin.url, "u", "p", "g")
+    deadline = QubePMPLDeadline()
+    with client.get_session() as session:
+        with deadline:
+            assert session.lookup_users("USER0001", exact=True).success
+            thread = threading.Thread(target=deadline.cancel)
+            thread.start()
+            thread.join()
+            with pytest.raises(QubePMPLDeadlineExceeded):
+                session.close_report()
+        assert deadline.cancelled
+        assert session.report_open is True
+        assert session.close_report().ok
+
+
+def test_async_read_timeout_closes_the_connection(standin):
+    async def scenario():
+        transport = QubePMPLAsyncTransport()
+        client = QubePMPLAsyncAPIClient(standin.url, "u", "p", "g", transport=transport, timeout=(5.0, 0.1))
+        session = await client.get_session()
+        standin.latency = 0.5
+        with pytest.raises(TimeoutError):
+            await session.lookup_users("USER0001", exact=True)
+        assert session.report_open is True
+        standin.latency = 0.0
+        with QubePMPLDeadline(0.0):
+            with pytest.raises(QubePMPLDeadlineExceeded):
+                await session.close_report()
+        assert (await session.close_report()).ok
+        await session.logout()
+        await client.aclose()
+        return transport.stats()
+
+    stats = asyncio.run(scenario())
+    # Login's connection was reused by the lookup, which timed out and closed it.
+    assert stats.connections_opened == 2
@@ -0,0 +1,166 @@
+import threading
+import time
+import pytest
+
+from src.qube_pm_api_client.coalesce import QubePMPLCoalescer
+from src.qube_pm_api_client.hedge import QubePMPLHedgedLookup
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession
+from src.qube_pm_api_client.results import QubePMPLLookupResult
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.sharded import QubePMPLShardedLookup
+from src.qube_pm_api_client.standin import QubePMPLStandInServer
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+@pytest.fixture
+def pool():
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLStandInServer() as server, QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(server.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        pool = QubePMPLSessionPool(client, size=2)
+        yield pool
+        pool.close()
+    worker.drain(5)
+
+
+# Make the first lookup_users call (on whichever session sends it) stall for `stall` seconds.
+
+
+def stall_first_call(monkeypatch, stall: float) -> list[str]:
+    original = QubePMPLAPISession.lookup_users
+    lock = threading.Lock()
+    calls = []
+
+    def lookup_users(self, ref="?", exact=False):
+        with lock:
+            calls.append(self.client_session_key)
+            first = len(calls) == 1
+        if first:
+            time.sleep(stall)
+        return original(self, ref, exact)
+
+    monkeypatch.setattr(QubePMPLAPISession, "lookup_users", lookup_users)
+    return calls
+
+
+def test_slow_primary_is_hedged_and_loser_report_closed(pool, monkeypatch):
+    calls = stall_first_call(monkeypatch, 0.5)
+    with QubePMPLHedgedLookup(pool, initial_delay=0.05) as hedger:
+        start = time.monotonic()
+        result = hedger.lookup_users("USER0001", exact=True)
+        elapsed = time.monotonic() - start
+        assert result.success and result[0].reference == "USER0001"
+        assert elapsed < 0.4
+        stats = hedger.stats()
+        assert (stats.calls, stats.hedged, stats.hedge_wins, stats.skipped) == (1, 1, 1, 0)
+    # Both requests went to different sessions; closing waited for the loser, whose report is closed.
+    assert len(set(calls)) == 2
+    assert pool.stats().idle == 2
+    assert all(entry.session.report_open is False for entry in pool._idle)
+
+
+def test_delay_adapts_to_observed_latency(pool):
+    with QubePMPLHedgedLookup(pool, percentile=90.0, window=10, min_samples=5, initial_delay=5.0) as hedger:
+        assert hedger.delay == 5.0
+        for _ in range(5):
+            assert hedger.lookup_properties("001/01", exact=True).success
+        assert hedger.delay < 1.0
+        stats = hedger.stats()
+        assert stats.hedged == 0 and stats.calls == 5 and stats.delay == hedger.delay
+
+
+def test_posts_are_never_hedged(pool):
+    with QubePMPLHedgedLookup(pool) as hedger:
+        for method in ("post_invoice", "post_journal", "close_report"):
+            with pytest.raises(ValueError, match="can't be hedged"):
+                hedger.call(method)
+        assert hedger.stats().calls == 0
+
+
+def test_hedge_skipped_without_a_free_session(pool, monkeypatch):
+    stall_first_call(monkeypatch, 0.2)
+    held = pool.acquire()
+    try:
+        with QubePMPLHedgedLookup(pool, initial_delay=0.01) as hedger:
+            assert hedger.lookup_users("USER0002", exact=True).success
+            stats = hedger.stats()
+            assert (stats.hedged, stats.skipped) == (0, 1)
+    finally:
+        pool.release(held)
+
+
+def test_sharded_lookup_through_hedger(pool):
+    with QubePMPLHedgedLookup(pool, initial_delay=0.001, min_delay=0.001) as hedger:
+        sharded = QubePMPLShardedLookup(pool, alphabet="0123456789", hedger=hedger)
+        plain = QubePMPLShardedLookup(pool, alphabet="0123456789")
+        assert sorted(r.reference for r in sharded.properties()) == sorted(r.reference for r in plain.properties())
+        assert sharded.stats.duplicates == 0
+        assert hedger.stats().calls == sharded.stats.partitions
+
+
+# Pooled transport whose first user lookup request stalls on the wire.
+
+
+class StallFirstLookup(QubePMPLPooledTransport):
+    def __init__(self, stall: float):
+        super().__init__()
+        self.stall = stall
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, data, headers, stream=False, timeout=None):
+        if b"user-lookup" in (data.encode() if isinstance(data, str) else data):
+            with self._lock:
+                self.lookups += 1
+                first = self.lookups == 1
+            if first:
+                time.sleep(self.stall)
+        return super().post(url, data, headers, stream=stream, timeout=timeout)
+
+
+def test_hedge_bypasses_coalescer_of_stalled_primary():
+    coalescer = QubePMPLCoalescer()
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLStandInServer() as server, StallFirstLookup(0.5) as transport:
+        client = QubePMPLAPIClient(
+            server.url, "u", "p", "g", transport=transport, logout_worker=worker, coalescer=coalescer
+        )
+        pool = QubePMPLSessionPool(client, size=2)
+        with QubePMPLHedgedLookup(pool, initial_delay=0.05) as hedger:
+            start = time.monotonic()
+            result = hedger.lookup_users("USER0001", exact=True)
+            elapsed = time.monotonic() - start
+            assert result.success and result[0].reference == "USER0001"
+            assert elapsed < 0.4
+            assert hedger.stats().hedge_wins == 1
+        assert transport.lookups == 2
+        assert coalescer.stats().coalesced == 0
+        pool.close()
+    worker.drain(5)
+
+
+def test_unsuccessful_hedge_does_not_win(pool, monkeypatch):
+    original = QubePMPLAPISession.lookup_users
+    lock = threading.Lock()
+    calls = []
+
+    # First call answers slowly but successfully; the hedge answers at once with a refusal.
+    def lookup_users(self, ref="?", exact=False):
+        with lock:
+            calls.append(ref)
+            first = len(calls) == 1
+        if first:
+            time.sleep(0.2)
+            return original(self, ref, exact)
+        refused = QubePMPLLookupResult("user")
+        refused.success = False
+        refused.error_message = "Report is already open"
+        return refused
+
+    monkeypatch.setattr(QubePMPLAPISession, "lookup_users", lookup_users)
+    with QubePMPLHedgedLookup(pool, initial_delay=0.01) as hedger:
+        result = hedger.lookup_users("USER0001", exact=True)
+        assert result.success and result[0].reference == "USER0001"
+        stats = hedger.stats()
+        assert (stats.hedged, stats.hedge_wins) == (1, 0)
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock
+from datetime import timedelta
+
+from src.qube_pm_api_client.async_client import QubePMPLAsyncAPIClient
+from src.qube_pm_api_client.async_transport import QubePMPLAsyncTransport
+from src.qube_pm_api_client.instrumentation import (
+    QubePMPLHistogram,
+    QubePMPLInstrumentation,
+    QubePMPLMetricsCollector,
+)
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+pytestmark = pytest.mark.standin(dataset=QubePMPLStandInDataset(properties=50))
+
+
+def test_hooks_see_operation_sizes_and_phases(standin):
+    instrumentation = QubePMPLInstrumentation()
+    seen = []
+    instrumentation.add_pre_hook(lambda call: seen.append(("pre", call.operation, call.status_code)))
+    instrumentation.add_post_hook(lambda call: seen.append(("post", call.operation, call)))
+    with QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, instrumentation=instrumentation)
+        session = client.get_session()
+        session.lookup_properties()
+        session.close_report()
+    assert [(kind, operation) for kind, operation, _ in seen] == [
+        ("pre", "Login-Overload-4"),
+        ("post", "Login-Overload-4"),
+        ("pre", "PURAPI:webAPI"),
+        ("post", "PURAPI:webAPI"),
+        ("pre", "CloseReport"),
+        ("post", "CloseReport"),
+    ]
+    assert seen[0][2] is None
+    login, lookup, close = (entry[2] for entry in seen if entry[0] == "post")
+    assert login.connect > 0 and close.connect == 0.0
+    assert lookup.status_code == 200
+    assert lookup.response_bytes > 50 * 60
+    assert lookup.request_bytes > 0
+    for call in (login, lookup, close):
+        assert call.send > 0 and call.wait > 0
+        assert call.duration >= call.connect + call.send + call.wait
+
+
+def test_collector_builds_per_operation_histograms(standin):
+    instrumentation = QubePMPLInstrumentation()
+    collector = QubePMPLMetricsCollector()
+    instrumentation.add_post_hook(collector)
+    with QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, instrumentation=instrumentation)
+        session = client.get_session()
+        for _ in range(5):
+            session.lookup_properties("001/01", True)
+            session.close_report()
+        instrumentation.remove_hook(collector)
+        session.lookup_properties("001/01", True)
+    summary = collector.summary()
+    assert collector.operations() == ["CloseReport", "Login-Overload-4", "PURAPI:webAPI"]
+    assert summary["PURAPI:webAPI"]["duration"]["count"] == 5
+    assert summary["PURAPI:webAPI"]["statuses"] == {200: 5}
+    assert summary["CloseReport"]["wait"]["p99"] > 0
+    assert summary["PURAPI:webAPI"]["errors"] == 0
+
+
+def test_default_transport_reports_wait_from_elapsed_and_errors():
+    instrumentation = QubePMPLInstrumentation()
+    collector = QubePMPLMetricsCollector()
+    instrumentation.add_post_hook(collector)
+    session = QubePMPLAPISession("key", base_url="http://qube.test/", instrumentation=instrumentation)
+    response = MagicMock(status_code=200, content=b"<CloseReportResponse/>", elapsed=timedelta(milliseconds=5))
+    with patch("src.qube_pm_api_client.main.requests.post", return_value=response):
+        session.close_report()
+    with patch("src.qube_pm_api_client.main.requests.post", side_effect=ConnectionError("reset")):
+        with pytest.raises(ConnectionError):
+            session.close_report()
+    summary = collector.summary()["CloseReport"]
+    assert summary["wait"]["max"] == pytest.approx(0.005)
+    assert summary["connect"]["count"] == 0
+    assert summary["errors"] == 1
+
+
+def test_async_client_records_phases(standin):
+    instrumentation = QubePMPLInstrumentation()
+    calls = []
+    instrumentation.add_post_hook(calls.append)
+
+    async def run():
+        async with QubePMPLAsyncAPIClient(
+            standin.url, "u", "p", "g", transport=QubePMPLAsyncTransport(), instrumentation=instrumentation
+        ) as client:
+            session = await client.get_session()
+            await session.lookup_users()
+            await session.close_report()
+
+    asyncio.run(run())
+    assert sorted(call.operation for call in calls) == ["CloseReport", "Login-Overload-4", "PURAPI:webAPI"]
+    assert all(call.wait > 0 and call.send is not None for call in calls)
+
+
+def test_histogram_percentiles_within_bucket_error():
+    histogram = QubePMPLHistogram()
+    for i in range(1, 1001):
+        histogram.add(i / 1000)
+    assert histogram.count == 1000
+    assert histogram.percentile(50) == pytest.approx(0.5, rel=0.1)
+    assert histogram.percentile(99) == pytest.approx(0.99, rel=0.1)
+    assert histogram.percentile(100) == 1.0
+    assert histogram.mean == pytest.approx(0.5005)
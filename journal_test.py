@@ -0,0 +1,221 @@
+import sqlite3
+import threading
+import time
+from unittest.mock import MagicMock
+
+from conftest import CLOSE_OK, POST_OK, make_invoice
+from src.qube_pm_api_client.bulk import QubePMPLBulkPoster
+from src.qube_pm_api_client.journal import (
+    CONFIRMED,
+    DUPLICATE,
+    PENDING,
+    REFUSED,
+    REJECTED,
+    UNCERTAIN,
+    QubePMPLPostingJournal,
+)
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.results import REPORT_OPEN_ERROR_CODES, QubePMPLPostJournalResult
+
+POST_DUPLICATE = b'<Envelope><post-journal><success>false</success><status error-code="42" error-message="Duplicate invoice"/></post-journal></Envelope>'
+POST_FAIL = b'<Envelope><post-journal><success>false</success><status error-code="41" error-message="Bad VAT code"/></post-journal></Envelope>'
+
+
+def make_pool(posted):
+    lock = threading.Lock()
+
+    def post_invoice(invoice, property_ref, user_id, fund_heading_uid):
+        with lock:
+            posted.append(invoice.invoice_number)
+        if invoice.invoice_number.startswith("BAD"):
+            return MagicMock(status_code=200, content=POST_FAIL)
+        if invoice.invoice_number.startswith("DUP"):
+            return MagicMock(status_code=200, content=POST_DUPLICATE)
+        if invoice.invoice_number.startswith("ERR"):
+            raise ConnectionError("read timed out")
+        return MagicMock(status_code=200, content=POST_OK)
+
+    def get_session():
+        session = MagicMock()
+        session.post_invoice.side_effect = post_invoice
+        session.close_report.return_value = MagicMock(status_code=200, content=CLOSE_OK)
+        return session
+
+    client = MagicMock()
+    client.get_session.side_effect = get_session
+    return QubePMPLSessionPool(client, size=2)
+
+
+def test_latest_entry_is_the_state_and_persists(tmp_path):
+    path = str(tmp_path / "journal.db")
+    with QubePMPLPostingJournal(path) as journal:
+        assert journal.get("SUP1", "INV-1") is None
+        assert journal.needs_post("SUP1", "INV-1")
+        journal.record_intent("SUP1", "INV-1")
+        journal.record_result("SUP1", "INV-1", QubePMPLPostJournalResult(True))
+        journal.record_intent("SUP1", "INV-2")
+        journal.record_result("SUP1", "INV-2", QubePMPLPostJournalResult(False, "41", "Bad VAT code"))
+        journal.record_intent("SUP1", "INV-3")
+        journal.record_result("SUP1", "INV-3", QubePMPLPostJournalResult(False, "", "Unreadable response"))
+        journal.record_intent("SUP2", "INV-1")
+
+    with QubePMPLPostingJournal(path) as journal:
+        assert journal.state("SUP1", "INV-1") == CONFIRMED
+        assert journal.get("SUP1", "INV-2").error_message == "Bad VAT code"
+        assert journal.state("SUP1", "INV-2") == REJECTED
+        assert journal.state("SUP1", "INV-3") == UNCERTAIN
+        assert journal.state("SUP2", "INV-1") == PENDING
+        assert not journal.needs_post("SUP1", "INV-1")
+        assert not journal.needs_post("SUP1", "INV-2")
+        assert journal.needs_post("SUP1", "INV-3") and journal.needs_post("SUP2", "INV-1")
+        assert [(e.supplier_ref, e.invoice_number) for e in journal.uncertain()] == [
+            ("SUP1", "INV-3"),
+            ("SUP2", "INV-1"),
+        ]
+        assert len(list(journal.entries())) == 4
+
+
+def test_bulk_poster_journals_and_resumes(tmp_path):
+    path = str(tmp_path / "journal.db")
+    numbers = ["INV-1", "BAD-2", "ERR-3", "INV-4"]
+    jobs = [(make_invoice(n), "P1", "user", "1181") for n in numbers]
+
+    posted = []
+    # A previous run crashed after journalling INV-4's intent; its claim has since expired.
+    with QubePMPLPostingJournal(path, claim_timeout=0) as journal:
+        journal.record_intent("SUP1", "INV-4")
+
+    with QubePMPLPostingJournal(path) as journal:
+        poster = QubePMPLBulkPoster(make_pool(posted), journal=journal)
+        results = list(poster.post(jobs))
+        assert sorted(posted) == sorted(numbers)
+        assert not any(r.skipped for r in results)
+        assert journal.state("SUP1", "INV-1") == CONFIRMED
+        assert journal.state("SUP1", "INV-4") == CONFIRMED
+        assert journal.state("SUP1", "BAD-2") == REJECTED
+        assert journal.state("SUP1", "ERR-3") == UNCERTAIN
+        assert "read timed out" in journal.get("SUP1", "ERR-3").error_message
+
+    posted = []
+    with QubePMPLPostingJournal(path) as journal:
+        poster = QubePMPLBulkPoster(make_pool(posted), journal=journal)
+        results = {r.job.invoice.invoice_number: r for r in poster.post(jobs)}
+    # Only the uncertain post is retried; the rejected one keeps its error.
+    assert posted == ["ERR-3"]
+    assert results["INV-1"].skipped and results["INV-1"].success
+    assert results["BAD-2"].skipped and not results["BAD-2"].success
+    assert results["BAD-2"].error_message == "Bad VAT code"
+    assert poster.summary.skipped == 3
+    assert poster.summary.completed == 4
+
+
+def test_lookups_stay_fast_with_many_entries(tmp_path):
+    with QubePMPLPostingJournal(str(tmp_path / "journal.db")) as journal:
+        journal._db.execute("BEGIN")
+        journal._db.executemany(
+            "INSERT INTO entries (supplier_ref, invoice_number, state, error_code, error_message, recorded_at) "
+            "VALUES (?, ?, ?, '', '', 0)",
+            ((f"SUP{i % 50}", f"INV-{i}", CONFIRMED) for i in range(200_000)),
+        )
+        journal._db.execute("COMMIT")
+        start = time.perf_counter()
+        for i in range(0, 200_000, 200):
+            assert journal.state(f"SUP{i % 50}", f"INV-{i}") == CONFIRMED
+        journal.record_intent("SUP1", "NEW")
+        assert time.perf_counter() - start < 1.0
+        plan = " ".join(
+            str(row)
+            for row in journal._db.execute(
+                "EXPLAIN QUERY PLAN SELECT state FROM entries WHERE supplier_ref = ? AND invoice_number = ? "
+                "ORDER BY seq DESC LIMIT 1",
+                ("SUP1", "NEW"),
+            )
+        )
+        assert "entries_key" in plan
+
+
+def test_record_intent_claims_the_key(tmp_path):
+    with QubePMPLPostingJournal(str(tmp_path / "journal.db")) as journal:
+        assert journal.record_intent("SUP1", "INV-1").state == PENDING
+        assert journal.record_intent("SUP1", "INV-1") is None
+        journal.record_error("SUP1", "INV-1", "read timed out")
+        assert journal.record_intent("SUP1", "INV-1") is not None
+        journal.record_result("SUP1", "INV-1", QubePMPLPostJournalResult(True))
+        assert journal.record_intent("SUP1", "INV-1") is None
+        assert [e.state for e in journal.entries()] == [CONFIRMED]
+
+
+def test_retried_uncertain_post_refused_as_duplicate_is_not_rejected(tmp_path):
+    posted = []
+    with QubePMPLPostingJournal(str(tmp_path / "journal.db"), duplicate_codes=("42",)) as journal:
+        journal.record_intent("SUP1", "DUP-1")
+        journal.record_error("SUP1", "DUP-1", "read timed out")
+        poster = QubePMPLBulkPoster(make_pool(posted), journal=journal)
+        list(poster.post([(make_invoice("DUP-1"), "P1", "user", "1181")]))
+        assert posted == ["DUP-1"]
+        assert journal.state("SUP1", "DUP-1") == DUPLICATE
+        assert not journal.needs_post("SUP1", "DUP-1")
+        results = list(poster.post([(make_invoice("DUP-1"), "P1", "user", "1181")]))
+        assert posted == ["DUP-1"]
+        assert results[0].skipped and results[0].success
+
+
+def test_duplicate_keys_in_one_run_are_posted_once(tmp_path):
+    posted = []
+    jobs = [(make_invoice(n), "P1", "user", "1181") for n in ["INV-1", "INV-1", "INV-2", "INV-1"]]
+    with QubePMPLPostingJournal(str(tmp_path / "journal.db")) as journal:
+        poster = QubePMPLBulkPoster(make_pool(posted), journal=journal, concurrency=4)
+        results = list(poster.post(jobs))
+    assert sorted(posted) == ["INV-1", "INV-2"]
+    assert poster.summary.skipped == 2
+    assert sorted(r.skipped for r in results if r.job.invoice.invoice_number == "INV-1") == [False, True, True]
+
+
+def test_journal_failures_fail_the_job_not_the_run(tmp_path, monkeypatch):
+    posted = []
+    jobs = [(make_invoice(n), "P1", "user", "1181") for n in ["INV-1", "INV-2", "INV-3"]]
+    with QubePMPLPostingJournal(str(tmp_path / "journal.db")) as journal:
+        record_intent = journal.record_intent
+
+        def flaky(supplier_ref, invoice_number):
+            if invoice_number == "INV-2":
+                raise sqlite3.OperationalError("database is locked")
+            return record_intent(supplier_ref, invoice_number)
+
+        monkeypatch.setattr(journal, "record_intent", flaky)
+        poster = QubePMPLBulkPoster(make_pool(posted), journal=journal)
+        results = {r.job.invoice.invoice_number: r for r in poster.post(jobs)}
+    assert sorted(posted) == ["INV-1", "INV-3"]
+    assert not results["INV-2"].success
+    assert results["INV-2"].error_message == "OperationalError: database is locked"
+    assert results["INV-1"].success and results["INV-3"].success
+
+
+def test_refusals_are_retried_and_duplicates_need_a_code(tmp_path):
+    with QubePMPLPostingJournal(str(tmp_path / "journal.db")) as journal:
+        journal.record_intent("SUP1", "INV-1")
+        journal.record_result(
+            "SUP1", "INV-1", QubePMPLPostJournalResult(False, REPORT_OPEN_ERROR_CODES[0], "Report already open")
+        )
+        assert journal.state("SUP1", "INV-1") == REFUSED
+        assert journal.needs_post("SUP1", "INV-1")
+        assert journal.record_intent("SUP1", "INV-1") is not None
+        # Without duplicate_codes a duplicate refusal is just a rejection.
+        journal.record_result("SUP1", "INV-1", QubePMPLPostJournalResult(False, "42", "Duplicate invoice"))
+        assert journal.state("SUP1", "INV-1") == REJECTED
+
+
+def test_claims_are_shared_between_journal_instances(tmp_path):
+    path = str(tmp_path / "journal.db")
+    with QubePMPLPostingJournal(path) as first, QubePMPLPostingJournal(path, claim_timeout=0) as second:
+        assert first.record_intent("SUP1", "INV-1") is not None
+        # The key is pending, but the first journal's post is still in flight.
+        assert second.record_intent("SUP1", "INV-1") is None
+        first.record_error("SUP1", "INV-1", "read timed out")
+        assert second.record_intent("SUP1", "INV-1") is not None
+        # second's claim expires at once, so first may take over the key; second never retakes its own.
+        assert second.record_intent("SUP1", "INV-1") is None
+        assert first.record_intent("SUP1", "INV-1") is not None
+        second.record_result("SUP1", "INV-1", QubePMPLPostJournalResult(True))
+        first.record_result("SUP1", "INV-1", QubePMPLPostJournalResult(True))
+        assert first._db.execute("SELECT COUNT(*) FROM claims").fetchone() == (0,)
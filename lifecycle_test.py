@@ -0,0 +1,97 @@
+import gc
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+@pytest.fixture
+def client(standin):
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLPooledTransport() as transport:
+        yield QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        worker.close()
+
+
+def test_default_session_keys_are_unique():
+    first = QubePMPLAPISession(base_url="http://qube.test/")
+    second = QubePMPLAPISession(base_url="http://qube.test/")
+    assert first.client_session_key != second.client_session_key
+    assert not first.logged_in
+
+
+def test_dropping_a_session_that_never_logged_in_sends_nothing(standin):
+    worker = QubePMPLLogoutWorker()
+    session = QubePMPLAPISession("never", base_url=standin.url, logout_worker=worker)
+    del session
+    gc.collect()
+    assert worker.stats().submitted == 0
+    assert standin.stats().requests == 0
+
+
+def test_dropped_session_is_logged_out_off_thread(client, standin):
+    session = client.get_session()
+    del session
+    gc.collect()
+    assert client.logout_worker.drain(timeout=5)
+    assert client.logout_worker.stats().completed == 1
+    assert standin.stats().logouts == 1
+    assert standin.stats().sessions == 0
+
+
+def test_context_manager_logs_out(client, standin):
+    with client.get_session() as session:
+        session.lookup_users()
+        session.close_report()
+    assert not session.logged_in
+    assert standin.stats().logouts == 1
+    del session
+    gc.collect()
+    assert client.logout_worker.stats().submitted == 0
+
+
+def test_pool_logs_out_evicted_and_closed_sessions(client, standin):
+    pool = QubePMPLSessionPool(client, size=2, max_age=0.05)
+    time.sleep(0.1)
+    with pool.lease():
+        pass
+    pool.close()
+    assert client.logout_worker.drain(timeout=5)
+    assert standin.stats().logins == 3
+    assert standin.stats().logouts == 3
+    assert standin.stats().sessions == 0
+
+
+def test_worker_close_drops_what_misses_the_deadline():
+    release = threading.Event()
+    worker = QubePMPLLogoutWorker()
+    sent = []
+    worker.submit(lambda: release.wait(5))
+    for i in range(3):
+        worker.submit(lambda i=i: sent.append(i))
+    assert not worker.close(timeout=0.05)
+    release.set()
+    stats = worker.stats()
+    assert stats.dropped == 3
+    assert not worker.submit(lambda: None)
+    assert sent == []
+
+
+def test_pending_logouts_are_drained_at_exit(standin):
+    script = (
+        "from src.qube_pm_api_client.main import QubePMPLAPIClient\n"
+        f"client = QubePMPLAPIClient({standin.url!r}, 'u', 'p', 'g')\n"
+        "sessions = [client.get_session() for _ in range(3)]\n"
+        "for session in sessions:\n"
+        "    session.logout_later()\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
+    assert standin.stats().logins == 3
+    assert standin.stats().logouts == 3
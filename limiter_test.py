@@ -0,0 +1,150 @@
+import threading
+import time
+import pytest
+
+from conftest import make_invoice
+from src.qube_pm_api_client.bulk import QubePMPLBulkPoster
+from src.qube_pm_api_client.deadline import QubePMPLDeadline, QubePMPLDeadlineExceeded
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.limiter import QubePMPLAdaptiveLimiter
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLInvoice
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.standin import QubePMPLStandInServer
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+# Run one call that took `latency` seconds.
+
+
+def complete(limiter, latency, error=False):
+    limiter.acquire()
+    limiter.release(time.monotonic() - latency, error)
+
+
+def test_limit_grows_additively_while_latency_holds():
+    limiter = QubePMPLAdaptiveLimiter(initial=4, max_limit=6)
+    for _ in range(5):
+        complete(limiter, 0.010)
+    assert limiter.limit == 5
+    for _ in range(40):
+        complete(limiter, 0.012)
+    assert limiter.limit == 6
+    stats = limiter.stats()
+    assert stats.successes == 45 and stats.errors == 0 and stats.decreases == 0
+    assert stats.baseline == pytest.approx(0.010, abs=0.003)
+
+
+def test_errors_and_slow_calls_cut_the_limit_once_per_window():
+    limiter = QubePMPLAdaptiveLimiter(initial=10, min_limit=2)
+    complete(limiter, 0.010)
+    # Three calls in flight together fail: only the first cuts the limit.
+    started = [limiter.acquire() - 0.01 for _ in range(3)]
+    for start in started:
+        limiter.release(start, error=True)
+    assert limiter.limit == 7
+    assert limiter.stats().decreases == 1
+    # A call started after the cut, far slower than the baseline, cuts again.
+    started = limiter.acquire()
+    time.sleep(0.1)
+    limiter.release(started)
+    assert limiter.limit == 4
+    for _ in range(10):
+        time.sleep(0.001)
+        complete(limiter, 0.0, error=True)
+    assert limiter.limit == 2
+    assert limiter.stats().errors == 13
+
+
+def test_slots_hold_in_flight_calls_to_the_limit():
+    limiter = QubePMPLAdaptiveLimiter(initial=3, max_limit=3)
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def call(fail):
+        with limiter.slot() as slot:
+            with lock:
+                in_flight.append(1)
+                peak[0] = max(peak[0], len(in_flight))
+            time.sleep(0.005)
+            with lock:
+                in_flight.pop()
+            if fail:
+                slot.fail()
+
+    threads = [threading.Thread(target=call, args=(i == 5,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 3
+    stats = limiter.stats()
+    assert (stats.successes, stats.errors, stats.in_flight) == (11, 1, 0)
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot():
+            raise RuntimeError("boom")
+    assert limiter.stats().errors == 2
+
+
+def test_acquire_waits_no_longer_than_the_deadline():
+    limiter = QubePMPLAdaptiveLimiter(initial=1, max_limit=1)
+    started = limiter.acquire()
+    with QubePMPLDeadline(0.1):
+        start = time.monotonic()
+        with pytest.raises(QubePMPLDeadlineExceeded, match="exceeded"):
+            limiter.acquire()
+        assert time.monotonic() - start < 1.0
+
+    deadline = QubePMPLDeadline()
+    threading.Timer(0.1, deadline.cancel).start()
+    with deadline:
+        with pytest.raises(QubePMPLDeadlineExceeded, match="cancelled"):
+            limiter.acquire()
+    limiter.release(started)
+    assert limiter.stats().in_flight == 0
+    with QubePMPLDeadline(1.0):
+        with limiter.slot():
+            assert limiter.stats().in_flight == 1
+
+
+def test_bulk_poster_backs_off_when_qube_returns_faults():
+    limiter = QubePMPLAdaptiveLimiter(initial=8, max_limit=8)
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLStandInServer(latency=0.002, seed=7) as standin, QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        with QubePMPLSessionPool(client, size=8) as pool:
+            heading_uid = standin.dataset.headings[("001/01", "Service Charge")][0]["unique-id"]
+            standin.error_rate = 0.3
+            invoices = (
+                QubePMPLInvoice(
+                    "SUP1", f"INV-{i}", 100.0, 20.0, 120.0, "2024-06-01", "2024-05-01", "2024-05-31",
+                    "2024-06-01", "2024-06-01", "1",
+                )
+                for i in range(60)
+            )
+            poster = QubePMPLBulkPoster(pool, limiter=limiter)
+            results = list(poster.post((inv, "001/01", "USER0001", heading_uid) for inv in invoices))
+            standin.error_rate = 0.0
+        worker.close()
+    assert len(results) == 60
+    stats = limiter.stats()
+    assert stats.errors == sum(not r.success for r in results) > 0
+    assert stats.decreases > 0
+    assert stats.limit < 8
+
+
+def test_waiting_for_a_pooled_session_is_not_counted_as_latency():
+    limiter = QubePMPLAdaptiveLimiter(initial=4, max_limit=4)
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLStandInServer(latency=0.02) as standin, QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        # One session for four posters: each post waits for the three ahead of it.
+        with QubePMPLSessionPool(client, size=1) as pool:
+            heading_uid = standin.dataset.headings[("001/01", "Service Charge")][0]["unique-id"]
+            jobs = [(make_invoice(f"INV-{i}"), "001/01", "USER0001", heading_uid) for i in range(16)]
+            results = list(QubePMPLBulkPoster(pool, concurrency=4, limiter=limiter).post(jobs))
+        worker.close()
+    assert all(result.success for result in results)
+    stats = limiter.stats()
+    assert stats.decreases == 0 and stats.successes == 16
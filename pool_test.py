@@ -0,0 +1,107 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+
+from conftest import CLOSE_OK
+from src.qube_pm_api_client.pool import (
+    QubePMPLSessionPool,
+    QubePMPLSessionPoolTimeout,
+)
+
+CLOSE_ERROR = b"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><CloseReportResponse><status error-code="9" error-message="Session expired"/></CloseReportResponse></soapenv:Body></soapenv:Envelope>"""
+
+
+def make_session(close_content=CLOSE_OK):
+    session = MagicMock()
+    session.close_report.return_value = MagicMock(status_code=200, content=close_content)
+    return session
+
+
+@pytest.fixture
+def client():
+    client = MagicMock()
+    client.get_session.side_effect = lambda: make_session()
+    return client
+
+
+def test_pool_warms_sessions_and_reuses_them(client):
+    pool = QubePMPLSessionPool(client, size=2)
+    assert client.get_session.call_count == 2
+    for _ in range(5):
+        with pool.lease() as session:
+            session.get_users()
+        session.close_report.assert_called()
+    stats = pool.stats()
+    assert stats.logins == 2
+    assert stats.leases == 5
+    assert stats.idle == 2
+    assert stats.evictions == 0
+
+
+def test_pool_logs_in_lazily_when_not_warm(client):
+    pool = QubePMPLSessionPool(client, size=3, warm=False)
+    assert client.get_session.call_count == 0
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a is not b
+    assert pool.stats().logins == 2
+    pool.release(a)
+    pool.release(b)
+
+
+def test_pool_evicts_session_when_close_report_fails(client):
+    bad = make_session(CLOSE_ERROR)
+    client.get_session.side_effect = [bad, make_session()]
+    pool = QubePMPLSessionPool(client, size=1)
+    with pool.lease() as session:
+        assert session is bad
+    assert pool.stats().evictions == 1
+    with pool.lease() as session:
+        assert session is not bad
+    assert pool.stats().logins == 2
+
+
+def test_pool_replaces_expired_sessions(client):
+    pool = QubePMPLSessionPool(client, size=1, max_age=0.01)
+    first = pool.acquire()
+    pool.release(first)
+    time.sleep(0.02)
+    second = pool.acquire()
+    assert second is not first
+    assert pool.stats().evictions == 1
+    pool.release(second)
+
+
+def test_pool_acquire_times_out_when_exhausted(client):
+    pool = QubePMPLSessionPool(client, size=1)
+    session = pool.acquire()
+    with pytest.raises(QubePMPLSessionPoolTimeout):
+        pool.acquire(timeout=0.01)
+    pool.release(session)
+
+
+def test_pool_hands_sessions_to_one_caller_at_a_time(client):
+    pool = QubePMPLSessionPool(client, size=2)
+    in_use = set()
+    overlap = []
+
+    def worker():
+        for _ in range(20):
+            with pool.lease() as session:
+                if id(session) in in_use:
+                    overlap.append(session)
+                in_use.add(id(session))
+                time.sleep(0.001)
+                in_use.discard(id(session))
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlap
+    stats = pool.stats()
+    assert stats.leases == 120
+    assert stats.logins == 2
+    assert stats.lease_wait_max >= stats.lease_wait_mean > 0
@@ -11,8 +11,11 @@ from src.qube_pm_api_client.main import (
     QubePMPLAPIClient,
     QubePMPLAPISession,
     QubePMPLInvoice,
+    QubePMPLInvoiceLine,
 )
 
+pytestmark = pytest.mark.usefixtures("disable_session_destructor")
+
 
 @pytest.fixture
 def base_url():
@@ -31,16 +34,6 @@ def client(base_url):
     )
 
 
-@pytest.fixture(autouse=True)
-def disable_session_destructor():
-    # Temporarily disable the session destructor during tests to avoid network calls during GC
-    original = getattr(QubePMPLAPISession, "__del__", None)
-    QubePMPLAPISession.__del__ = lambda self: None
-    yield
-    if original is not None:
-        QubePMPLAPISession.__del__ = original
-
-
 def test_add_soap_envelope_includes_body(client):
     body = "<test>payload</test>"
     envelope = client.add_soap_envelope(body)
@@ -211,6 +204,57 @@ def test_post_invoice_with_and_without_link(mock_post):
     assert "<!-- document -->" in data2
 
 
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_post_invoice_sends_every_detail_line_in_one_call(mock_post):
+    mock_post.return_value = MagicMock(status_code=200)
+    session = QubePMPLAPISession(client_session_key="s6", base_url="https://api.test/")
+    invoice = QubePMPLInvoice(
+        supplier_ref="SUP1",
+        invoice_number="INV789",
+        nett=100.0,
+        vat=15.0,
+        gross=115.0,
+        invoice_date="2025-01-01",
+        period_start="2025-01-01",
+        period_finish="2025-01-31",
+        prompt_payment_due="2025-02-01",
+        payment_due="2025-02-15",
+        vat_code="",
+        lines=[
+            QubePMPLInvoiceLine(50.0, 10.0, 60.0, "V1", "P1", "h1"),
+            QubePMPLInvoiceLine(30.0, 5.0, 35.0, "V2", "P2", "h2"),
+            QubePMPLInvoiceLine(20.0, 0.0, 20.0, "V0"),
+        ],
+    )
+
+    session.post_invoice(invoice, property_ref="P3", user_id="u1", fund_heading_uid="h3")
+    assert mock_post.call_count == 1
+    data = mock_post.call_args.kwargs.get("data") or mock_post.call_args.args[1]
+    assert data.count("<detail>") == 3
+    assert re.findall(r"<property-reference>(.*?)</property-reference>", data) == ["P1", "P2", "P3"]
+    assert re.findall(r"<vat-code>(.*?)</vat-code>", data) == ["V1", "V2", "V0"]
+    assert "<heading-unique-id>h3</heading-unique-id>" in data
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_post_invoice_rejects_lines_not_matching_totals(mock_post):
+    session = QubePMPLAPISession(client_session_key="s7", base_url="https://api.test/")
+    lines = [
+        QubePMPLInvoiceLine(50.0, 10.0, 60.0, "V1", "P1", "h1"),
+        QubePMPLInvoiceLine(40.0, 10.0, 50.0, "V1", "P1", "h1"),
+    ]
+    invoice = QubePMPLInvoice(
+        "SUP1", "INV790", 100.0, 20.0, 120.0, "2025-01-01", "2025-01-01", "2025-01-31", "2025-02-01", "2025-02-15", "",
+        lines=lines,
+    )
+    with pytest.raises(ValueError, match="total nett 90.00, header nett is 100.00"):
+        session.post_invoice(invoice, property_ref="", user_id="u1", fund_heading_uid="")
+    invoice.lines = [QubePMPLInvoiceLine(100.0, 20.0, 120.0, "V1", "P1")]
+    with pytest.raises(ValueError, match="needs a property_ref and fund_heading_uid"):
+        session.post_invoice(invoice, property_ref="", user_id="u1", fund_heading_uid="")
+    mock_post.assert_not_called()
+
+
 @patch("src.qube_pm_api_client.main.requests.post")
 def test_client_get_session_parses_login_response(mock_post, base_url):
     # Successful login (no error-message)
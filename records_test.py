@@ -0,0 +1,71 @@
+import tracemalloc
+import pytest
+from unittest.mock import patch, MagicMock
+
+from src.qube_pm_api_client.main import QubePMPLAPISession
+from src.qube_pm_api_client.records import QubePMPLAPIError, iter_records
+
+HEAD = b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><QubeProcess-1iaResponse><property-lookup success="true">'
+TAIL = b"</property-lookup></QubeProcess-1iaResponse></soapenv:Body></soapenv:Envelope>"
+
+
+def property_payload(count):
+    yield HEAD
+    for i in range(count):
+        yield (
+            b'<property><reference>%03d/01</reference><unique-id>%d</unique-id>'
+            b"<name>Property %d</name></property>" % (i, i, i)
+        )
+    yield TAIL
+
+
+def test_iter_records_yields_one_record_per_element():
+    records = list(iter_records(property_payload(3), "property"))
+    assert [r.reference for r in records] == ["000/01", "001/01", "002/01"]
+    assert records[1]["unique-id"] == "1"
+    assert records[1].unique_id == "1"
+    assert records[2].as_dict() == {"reference": "002/01", "unique-id": "2", "name": "Property 2"}
+    assert records[0].names is records[2].names
+
+
+def test_iter_records_memory_stays_flat():
+    def peak(count):
+        tracemalloc.start()
+        for _ in iter_records(property_payload(count), "property"):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    small, large = peak(2_000), peak(40_000)
+    assert large < small * 2
+
+
+def test_iter_records_ignores_nested_elements_with_same_tag():
+    payload = [b"<r><fund-lookup><fund><unique-id>1</unique-id><fund><x/></fund></fund></fund-lookup></r>"]
+    records = list(iter_records(payload, "fund"))
+    assert len(records) == 1
+    assert records[0].unique_id == "1"
+
+
+def test_iter_records_raises_on_error_status():
+    payload = [b'<r><user-lookup success="false"><status error-code="7" error-message="Report open"/></user-lookup></r>']
+    with pytest.raises(QubePMPLAPIError) as exc:
+        list(iter_records(payload, "user"))
+    assert exc.value.error_code == "7"
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_session_iter_properties_streams_response(mock_post):
+    response = MagicMock()
+    response.iter_content.return_value = property_payload(5)
+    response.__enter__.return_value = response
+    mock_post.return_value = response
+
+    session = QubePMPLAPISession(client_session_key="s1", base_url="https://api.test/")
+    records = session.iter_properties("0", exact=False)
+
+    assert mock_post.call_args.kwargs["stream"] is True
+    assert "property-lookup" in mock_post.call_args.kwargs["data"]
+    assert [r.unique_id for r in records] == ["0", "1", "2", "3", "4"]
+    response.__exit__.assert_called_once()
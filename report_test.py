@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+import requests
+
+from conftest import make_invoice
+from src.qube_pm_api_client.async_client import QubePMPLAsyncAPIClient
+from src.qube_pm_api_client.main import QubePMPLAPIClient, _response_refused
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+pytestmark = pytest.mark.standin(dataset=QubePMPLStandInDataset(properties=5))
+
+
+@pytest.fixture
+def transport():
+    with QubePMPLPooledTransport() as transport:
+        yield transport
+
+
+def test_session_tracks_report_state(standin, transport):
+    session = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport).get_session()
+    assert session.report_open is False
+    assert session.ensure_report_closed() is None
+    session.lookup_properties()
+    assert session.report_open is True
+    assert session.ensure_report_closed().status_code == 200
+    assert session.report_open is False
+    # Explicit close_report always sends.
+    session.close_report()
+    assert standin.stats().close_reports == 2
+    # Without auto_close_report a second lookup is refused, as before.
+    session.lookup_properties()
+    assert session.lookup_properties().error_message == "Report already open"
+
+
+def test_auto_close_report_closes_only_when_needed(standin, transport):
+    client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, auto_close_report=True)
+    session = client.get_session()
+    heading_uid = standin.dataset.headings[("001/01", "Service Charge")][0]["unique-id"]
+    for i in range(10):
+        assert session.post_journal(make_invoice(f"INV-{i}"), "001/01", "USER0001", heading_uid).success
+    assert session.lookup_properties().success
+    session.ensure_report_closed()
+    stats = standin.stats()
+    assert stats.posts == 10 and stats.lookups == 1
+    # Every call opens a report, so each still needs its own CloseReport: 11, not 22 as when closing
+    # defensively before and after every call.
+    assert stats.close_reports == 11
+    assert stats.report_conflicts == 0
+
+
+def test_defensive_close_report_costs_twice_as_many_round_trips(standin, transport):
+    session = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport).get_session()
+    heading_uid = standin.dataset.headings[("001/01", "Service Charge")][0]["unique-id"]
+    for i in range(10):
+        session.close_report()
+        assert session.post_journal(make_invoice(f"INV-{i}"), "001/01", "USER0001", heading_uid).success
+        session.close_report()
+    assert standin.stats().close_reports == 20
+
+
+def test_auto_close_report_recovers_when_server_has_report_open(standin, transport):
+    client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, auto_close_report=True)
+    session = client.get_session()
+    session.make_request(*session.get_users_request())
+    assert session.report_open is False
+    result = session.lookup_properties()
+    assert result.success and len(result) == 5
+    assert standin.stats().report_conflicts == 1
+    session.ensure_report_closed()
+    response = session.get_properties("001/01", exact=True)
+    assert b'success="true"' in response.content
+
+
+def test_pool_skips_close_report_when_none_is_open(standin, transport):
+    client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport)
+    with QubePMPLSessionPool(client, size=1) as pool:
+        with pool.lease():
+            pass
+        assert standin.stats().close_reports == 0
+        with pool.lease() as session:
+            session.lookup_users()
+        assert standin.stats().close_reports == 1
+        assert pool.stats().evictions == 0
+
+
+def test_async_session_auto_close_report(standin):
+    async def run():
+        async with QubePMPLAsyncAPIClient(standin.url, "u", "p", "g", auto_close_report=True) as client:
+            session = await client.get_session()
+            for _ in range(3):
+                assert (await session.lookup_users()).success
+            await session.ensure_report_closed()
+            assert session.report_open is False
+
+    asyncio.run(run())
+    assert standin.stats().close_reports == 3
+    assert standin.stats().report_conflicts == 0
+
+
+def test_only_the_report_open_code_counts_as_a_refusal():
+    def response(status: bytes):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b"<Envelope><Body><QubeProcess-1iaResponse>" + status + b"</QubeProcess-1iaResponse></Body></Envelope>"
+        return response
+
+    assert _response_refused(response(b'<status error-code="12" error-message="Report already open"/>'))
+    assert not _response_refused(response(b'<status error-code="7" error-message="Cannot report period: not open"/>'))
+    assert not _response_refused(response(b'<status error-code="" error-message=""/>'))
@@ -0,0 +1,107 @@
+import sys
+import pytest
+from unittest.mock import patch, MagicMock
+
+from src.qube_pm_api_client.main import QubePMPLAPISession, QubePMPLInvoice
+from src.qube_pm_api_client.records import QubePMPLAPIError
+from src.qube_pm_api_client.results import (
+    QubePMPLFundHeading,
+    QubePMPLProperty,
+    parse_fund_lookup,
+    parse_heading_lookup,
+    parse_post_journal,
+    parse_property_lookup,
+    parse_status,
+    parse_user_lookup,
+)
+
+ENVELOPE = '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body><QubeProcess-1iaResponse>{}</QubeProcess-1iaResponse></soapenv:Body></soapenv:Envelope>'
+
+
+def wrap(inner):
+    return ENVELOPE.format(inner).encode()
+
+
+def test_parse_property_lookup_returns_typed_records():
+    content = wrap(
+        '<property-lookup success="true">'
+        + "".join(
+            f"<property><reference>{i:03d}/01</reference><unique-id>{i}</unique-id><name>P{i}</name></property>"
+            for i in range(3)
+        )
+        + "</property-lookup>"
+    )
+    result = parse_property_lookup(content)
+    assert result.success
+    assert len(result) == 3
+    assert isinstance(result[0], QubePMPLProperty)
+    assert result[2].reference == "002/01"
+    assert result[2].unique_id == "2"
+    assert result.column("unique-id") == ["0", "1", "2"]
+    assert result.find("reference", "001/01").name == "P1"
+    assert [p.unique_id for p in result[1:]] == ["1", "2"]
+    result.raise_for_status()
+
+
+def test_lookup_result_rows_are_compact():
+    content = wrap(
+        '<user-lookup success="true">'
+        + "".join(f"<user><reference>U{i}</reference><name>User {i}</name></user>" for i in range(1000))
+        + "</user-lookup>"
+    )
+    result = parse_user_lookup(content)
+    assert len(result) == 1000
+    assert len(result._shapes) == 1
+    assert not hasattr(result[0], "__dict__")
+    assert sys.getsizeof(result._values[0]) < 100
+
+
+def test_parse_lookup_reports_error_status():
+    content = wrap(
+        '<fund-lookup success="false"><status error-code="12" error-message="Report already open"/></fund-lookup>'
+    )
+    result = parse_fund_lookup(content)
+    assert not result.success
+    assert result.error_code == "12"
+    assert result.error_message == "Report already open"
+    assert len(result) == 0
+    with pytest.raises(QubePMPLAPIError):
+        result.raise_for_status()
+
+
+def test_parse_lookup_without_container_is_failure():
+    result = parse_heading_lookup(b"<soap:Envelope xmlns:soap='x'><soap:Body><soap:Fault><faultstring>Bad key</faultstring></soap:Fault></soap:Body></soap:Envelope>")
+    assert not result.success
+    assert result.error_message == "Bad key"
+    assert not parse_heading_lookup(b"garbage").success
+
+
+def test_parse_post_journal_and_status():
+    ok = parse_post_journal(wrap("<post-journal><success>true</success></post-journal>"))
+    assert ok.success and not ok.error_message
+    failed = parse_post_journal(
+        wrap('<post-journal><success>false</success><status error-code="4" error-message="Duplicate"/></post-journal>')
+    )
+    assert not failed.success
+    assert (failed.error_code, failed.error_message) == ("4", "Duplicate")
+    assert parse_status(wrap("<CloseReportResponse/>")).success
+    assert not parse_status(wrap('<LogoutResponse><status error-code="1" error-message="x"/></LogoutResponse>')).success
+
+
+@patch("src.qube_pm_api_client.main.requests.post")
+def test_session_lookup_and_post_journal_parse_responses(mock_post):
+    lookup = MagicMock()
+    lookup.iter_content.return_value = [
+        wrap('<heading-lookup success="true"><heading><unique-id>1181</unique-id><description>Admin</description></heading></heading-lookup>')
+    ]
+    lookup.__enter__.return_value = lookup
+    posted = MagicMock(content=wrap("<post-journal><success>true</success></post-journal>"))
+    mock_post.side_effect = [lookup, posted]
+
+    session = QubePMPLAPISession(client_session_key="s1", base_url="https://api.test/")
+    headings = session.lookup_fund_headings("001/01", "Admin Charge")
+    assert isinstance(headings[0], QubePMPLFundHeading)
+    assert headings[0].unique_id == "1181"
+
+    invoice = QubePMPLInvoice("SUP", "INV-1", 1.0, 0.2, 1.2, "2024-06-01", "2024-05-01", "2024-05-31", "2024-06-01", "2024-06-01", "1")
+    assert session.post_journal(invoice, "001/01", "user", headings[0].unique_id).success
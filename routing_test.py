@@ -0,0 +1,84 @@
+import pytest
+
+from conftest import make_invoice
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.main import QubePMPLAPIClient
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.routing import QubePMPLRoute, QubePMPLRoutingResolver
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+pytestmark = pytest.mark.standin(
+    dataset=QubePMPLStandInDataset(users=5, properties=10, funds_per_property=2, headings_per_fund=3), latency=0.01
+)
+
+
+@pytest.fixture
+def pool(standin):
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        with QubePMPLSessionPool(client, size=4) as pool:
+            yield pool
+        worker.close()
+
+
+def test_each_distinct_key_is_resolved_once(pool, standin):
+    routes = [
+        QubePMPLRoute(make_invoice(f"INV-{i}"), "USER0001", f"{i % 3 + 1:03d}/01", "Service Charge", "Cleaning")
+        for i in range(30)
+    ]
+    routes.append(QubePMPLRoute(make_invoice("INV-admin"), "USER0001", "001/01", "Admin Charge", "Cleaning"))
+    resolver = QubePMPLRoutingResolver(pool)
+
+    routed = resolver.resolve(routes)
+
+    assert [r.index for r in routed] == list(range(31))
+    assert all(r.success for r in routed)
+    cleaning = standin.dataset.headings[("002/01", "Service Charge")][0]["unique-id"]
+    assert routed[1].job.property_ref == "002/01"
+    assert routed[1].job.fund_heading_uid == cleaning
+    assert routed[1].job.invoice.invoice_number == "INV-1"
+    assert routed[30].job.fund_heading_uid != routed[0].job.fund_heading_uid
+    # 3 property checks and 4 (property, fund type) heading lookups.
+    assert standin.stats().lookups == 7
+
+    # Memoized across batches.
+    assert resolver.resolve(routes[:5])[0].success
+    assert standin.stats().lookups == 7
+
+
+def test_owner_routes_and_errors(pool, standin):
+    resolver = QubePMPLRoutingResolver(pool)
+    routed = resolver.resolve(
+        [
+            QubePMPLRoute(
+                make_invoice("INV-1"), "USER0001", fund_type="Admin Charge", heading="Cleaning", owner_ref="OWN004"
+            ),
+            QubePMPLRoute(make_invoice("INV-2"), "USER0001", "999/01", "Service Charge", "Cleaning"),
+            QubePMPLRoute(make_invoice("INV-3"), "USER0001", "001/01", "Service Charge", "Nonexistent"),
+            QubePMPLRoute(make_invoice("INV-4"), "USER0001", "001/01"),
+            QubePMPLRoute(make_invoice("INV-5"), "USER0001", "001/01", fund_heading_uid="1000"),
+            QubePMPLRoute(
+                make_invoice("INV-6"), "USER0001", fund_type="Reserve", heading="Cleaning", owner_ref="OWN004"
+            ),
+        ]
+    )
+    assert routed[0].job.property_ref == "004/01"
+    assert routed[0].job.fund_heading_uid == standin.dataset.headings[("004/01", "Admin Charge")][0]["unique-id"]
+    assert "Unknown property 999/01" in routed[1].error_message
+    assert "No heading 'Nonexistent'" in routed[2].error_message
+    assert "fund_heading_uid" in routed[3].error_message
+    assert routed[4].job.fund_heading_uid == "1000"
+    assert "No 'Reserve' fund for owner OWN004" in routed[5].error_message
+
+
+def test_failed_lookups_are_retried_by_the_next_batch(pool, standin):
+    resolver = QubePMPLRoutingResolver(pool)
+    route = QubePMPLRoute(make_invoice("INV-1"), "USER0001", "001/01", "Service Charge", "Cleaning")
+    standin.error_rate = 1.0
+    failed = resolver.resolve([route, route._replace(invoice=make_invoice("INV-2"))])
+    assert not failed[0].success and not failed[1].success
+    standin.error_rate = 0.0
+    assert resolver.resolve([route])[0].success
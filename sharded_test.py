@@ -0,0 +1,80 @@
+import pytest
+
+from src.qube_pm_api_client.lifecycle import QubePMPLLogoutWorker
+from src.qube_pm_api_client.main import QubePMPLAPIClient
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.records import QubePMPLAPIError
+from src.qube_pm_api_client.sharded import QubePMPLShardedLookup, QubePMPLShardedLookupIncomplete
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+pytestmark = pytest.mark.standin(
+    dataset=QubePMPLStandInDataset(users=30, properties=140, funds_per_property=1, headings_per_fund=1)
+)
+
+
+@pytest.fixture
+def pool(standin):
+    worker = QubePMPLLogoutWorker()
+    with QubePMPLPooledTransport() as transport:
+        client = QubePMPLAPIClient(standin.url, "u", "p", "g", transport=transport, logout_worker=worker)
+        with QubePMPLSessionPool(client, size=4) as pool:
+            yield pool
+        worker.close()
+
+
+def test_sharded_properties_match_the_single_wildcard_lookup(pool):
+    with pool.lease() as session:
+        expected = [p.reference for p in session.lookup_properties("?")]
+    sharded = QubePMPLShardedLookup(pool, alphabet="0123456789", split_threshold=25)
+    references = [p.reference for p in sharded.properties()]
+    assert sorted(references) == sorted(expected)
+    assert len(references) == 140
+    stats = sharded.stats
+    assert stats.records == 140
+    # "0?" and "1?" come back too large and are split, then "00?" .. "09?" as well.
+    assert stats.splits >= 2
+    assert stats.duplicates >= 25
+    assert stats.partitions > 10
+
+
+def test_sharded_lookup_from_a_prefix_includes_the_prefix_itself(pool):
+    sharded = QubePMPLShardedLookup(pool, alphabet="0123456789/", split_threshold=1000)
+    assert sorted(p.reference for p in sharded.properties("01")) == [f"{i:03d}/01" for i in range(10, 20)]
+
+
+
+def test_sharded_lookup_raises_on_partitions_truncated_at_max_depth(pool):
+    users = QubePMPLShardedLookup(pool, alphabet="SU", split_threshold=10, max_depth=2)
+    found = []
+    # "U?" is split once; "US?" is capped at depth 2 rather than split further, so can't be vouched for.
+    with pytest.raises(QubePMPLShardedLookupIncomplete, match="too large at max_depth") as raised:
+        found.extend(users.users())
+    assert raised.value.truncated == ["US?"] and raised.value.missing == []
+    assert len(found) == 30
+    assert (users.stats.splits, users.stats.truncated) == (1, 1)
+
+
+def test_coverage_check_finds_references_outside_the_alphabet(pool):
+    # "001/01" has "/" at the split position after "001"; by default nothing notices.
+    assert list(QubePMPLShardedLookup(pool, alphabet="0123456789").properties("001")) == []
+    narrow = QubePMPLShardedLookup(pool, alphabet="0123456789", verify=True)
+    found = []
+    with pytest.raises(QubePMPLShardedLookupIncomplete, match="add '/' to the alphabet") as raised:
+        found.extend(p.reference for p in narrow.properties("001"))
+    assert raised.value.missing == ["001/01"] and raised.value.characters == "/"
+    assert found == ["001/01"] and narrow.stats.missing == 1
+
+    real = QubePMPLShardedLookup(pool, alphabet="0123456789/", verify=True)
+    assert [p.reference for p in real.properties("001")] == ["001/01"]
+    assert (real.stats.missing, real.stats.truncated) == (0, 0)
+    # The default alphabet covers the stand-in's references too.
+    assert len(list(QubePMPLShardedLookup(pool, split_threshold=50, verify=True).properties())) == 140
+
+
+def test_sharded_lookup_raises_on_a_failed_partition(pool, standin):
+    sharded = QubePMPLShardedLookup(pool, alphabet="01", split_threshold=1000)
+    standin.error_rate = 1.0
+    with pytest.raises(QubePMPLAPIError):
+        list(sharded.properties())
@@ -0,0 +1,98 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+from src.qube_pm_api_client.main import QubePMPLAPISession
+from src.qube_pm_api_client.records import QubePMPLAPIError
+from src.qube_pm_api_client.results import QubePMPLProperty
+from src.qube_pm_api_client.snapshot import QubePMPLSnapshot, QubePMPLSnapshotRefresher
+
+RESPONSES = {
+    "<user-lookup>": b'<E><user-lookup success="true"><user><reference>U1</reference><name>Ann</name></user></user-lookup></E>',
+    "<property-lookup>": b'<E><property-lookup success="true">'
+    b"<property><reference>001/01</reference><unique-id>11</unique-id></property>"
+    b"<property><reference>002/01</reference><unique-id>12</unique-id></property></property-lookup></E>",
+    "<fund-lookup>": b'<E><fund-lookup success="true"><fund><unique-id>77</unique-id><property-reference>001/01</property-reference><fund-type>Admin Charge</fund-type></fund></fund-lookup></E>',
+    "<heading-lookup>": b'<E><heading-lookup success="true"><heading><unique-id>1181</unique-id><description>Repairs</description></heading></heading-lookup></E>',
+    "<web:CloseReport>": b"<E><CloseReportResponse/></E>",
+}
+
+
+@pytest.fixture
+def calls():
+    calls = []
+
+    def respond(url, data, headers, stream=False):
+        for marker, content in RESPONSES.items():
+            if marker in data:
+                calls.append(marker)
+                response = MagicMock(status_code=200, content=content)
+                response.iter_content.return_value = [content]
+                response.__enter__.return_value = response
+                return response
+        raise AssertionError(data)
+
+    with patch("src.qube_pm_api_client.main.requests.post", side_effect=respond):
+        yield calls
+
+
+# Not logged in, so it sends no Logout when it outlives the test body.
+
+
+@pytest.fixture
+def session():
+    return QubePMPLAPISession("s1", base_url="https://api.test/")
+
+
+def test_snapshot_refresh_and_indexed_reads(tmp_path, calls, session):
+    with QubePMPLSnapshot(str(tmp_path / "ref.sqlite")) as snapshot:
+        assert snapshot.refresh_users(session) == 1
+        assert snapshot.refresh_properties(session) == 2
+        snapshot.refresh_funds(session, "001/01")
+        snapshot.refresh_fund_headings(session, "001/01", "Admin Charge")
+
+    with QubePMPLSnapshot(str(tmp_path / "ref.sqlite")) as snapshot:
+        assert snapshot.user("U1").name == "Ann"
+        assert isinstance(snapshot.property("002/01"), QubePMPLProperty)
+        assert snapshot.find("property", unique_id="11").reference == "001/01"
+        assert [p.reference for p in snapshot.properties()] == ["001/01", "002/01"]
+        assert snapshot.funds("001/01")[0].fund_type == "Admin Charge"
+        assert snapshot.fund("77").property_reference == "001/01"
+        assert snapshot.fund_headings("001/01", "Admin Charge")[0].unique_id == "1181"
+        assert snapshot.heading("1181").description == "Repairs"
+    assert calls.count("<web:CloseReport>") == 4
+
+
+def test_snapshot_refreshes_only_stale_scopes(tmp_path, calls, session):
+    with QubePMPLSnapshot(str(tmp_path / "ref.sqlite"), max_age=60) as snapshot:
+        snapshot.refresh_users(session)
+        snapshot.refresh_properties(session)
+        assert snapshot.refresh_stale(session) == 0
+        snapshot._db.execute("UPDATE scopes SET refreshed_at = 0 WHERE kind = 'property'")
+        calls.clear()
+        assert snapshot.refresh_stale(session) == 1
+        assert "<property-lookup>" in calls and "<user-lookup>" not in calls
+        assert snapshot.refreshed_at("property", "?") > time.time() - 5
+
+
+def test_snapshot_keeps_old_records_when_lookup_fails(tmp_path, calls, session):
+    with QubePMPLSnapshot(str(tmp_path / "ref.sqlite")) as snapshot:
+        snapshot.refresh_users(session)
+        RESPONSES_BACKUP = RESPONSES["<user-lookup>"]
+        RESPONSES["<user-lookup>"] = b'<E><user-lookup success="false"><status error-code="1" error-message="Report open"/></user-lookup></E>'
+        try:
+            with pytest.raises(QubePMPLAPIError):
+                snapshot.refresh_users(session)
+        finally:
+            RESPONSES["<user-lookup>"] = RESPONSES_BACKUP
+        assert snapshot.user("U1") is not None
+
+
+def test_background_refresher_refreshes_stale_scopes(tmp_path, calls, session):
+    with QubePMPLSnapshot(str(tmp_path / "ref.sqlite"), max_age=0) as snapshot:
+        snapshot.refresh_users(session)
+        with QubePMPLSnapshotRefresher(snapshot, session, interval=0.01) as refresher:
+            deadline = time.monotonic() + 2
+            while refresher.refreshes < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert refresher.refreshes >= 2
@@ -1,2 +1,4 @@
 def main() -> None:
-    print("Hello from qube-pm-api-client!")
+    from .cli import main as cli_main
+
+    raise SystemExit(cli_main())
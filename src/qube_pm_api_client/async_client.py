@@ -0,0 +1,270 @@
+import uuid
+from .async_transport import QubePMPLAsyncResponse, QubePMPLAsyncTransport
+from .builder import QubePMPLRequestBuilder
+from .coalesce import QubePMPLCoalescer
+from .deadline import QubePMPLTimeout, request_timeout
+from .instrumentation import QubePMPLInstrumentation
+from .main import (
+    QubePMPLAPIBase,
+    QubePMPLAPIClientRequests,
+    QubePMPLAPISessionRequests,
+    QubePMPLInvoice,
+    _response_refused,
+)
+from .results import (
+    QubePMPLLookupResult,
+    QubePMPLPostJournalResult,
+    parse_lookup,
+    parse_post_journal,
+)
+
+##############################################
+# asyncio client for Qube PM Purchase Ledger API
+##############################################
+
+# Mirrors QubePMPLAPIClient / QubePMPLAPISession with coroutine methods.
+# Requests are built exactly as the sync client builds them and sent over a QubePMPLAsyncTransport,
+# so thousands of in-flight lookups and postings can share one event loop.
+
+# Common base class for async client and session.
+
+
+class QubePMPLAsyncAPICommon(QubePMPLAPIBase):
+    def __init__(
+        self,
+        base_url: str = "",
+        transport: QubePMPLAsyncTransport | None = None,
+        request_builder: QubePMPLRequestBuilder | None = None,
+        instrumentation: QubePMPLInstrumentation | None = None,
+        timeout: QubePMPLTimeout | tuple | None = None,
+    ):
+        super().__init__(base_url=base_url, request_builder=request_builder)
+        self.transport = transport if transport is not None else QubePMPLAsyncTransport()
+        self.instrumentation = instrumentation
+        self.timeout = QubePMPLTimeout(*timeout) if timeout is not None else None
+
+    # Timeouts and deadlines apply as in QubePMPLAPICommon.make_request; a timed out request raises TimeoutError.
+    async def make_request(
+        self, soap_action: str, body: str | bytes, timeout: QubePMPLTimeout | None = None
+    ) -> QubePMPLAsyncResponse:
+        headers = self.soap_headers(soap_action)
+        timeout = request_timeout(self.timeout, timeout)
+        if timeout is None:
+            send = lambda: self.transport.post(self.base_url, data=body, headers=headers)
+        else:
+            send = lambda: self.transport.post(self.base_url, data=body, headers=headers, timeout=timeout)
+        instrumentation = self.instrumentation
+        if instrumentation is None or not instrumentation.active:
+            return await send()
+        return await instrumentation.acall(soap_action, body, send)
+
+
+# Async session. Same rules as QubePMPLAPISession: close_report must be awaited before the next lookup or post.
+# There is no destructor logout: use `async with session` or await logout() when finished with the session.
+# report_open / auto_close_report / ensure_report_closed behave as on QubePMPLAPISession.
+# coalescer: optional QubePMPLCoalescer; identical get_* calls in flight on the same event loop share one
+# request (lookup_* calls share their get_* request and parse it separately).
+
+
+class QubePMPLAsyncAPISession(QubePMPLAPISessionRequests, QubePMPLAsyncAPICommon):
+
+    def __init__(
+        self,
+        client_session_key: str | None = None,
+        base_url: str = "https://partner-portals.qubeglobalcloud.com/qubews/",
+        transport: QubePMPLAsyncTransport | None = None,
+        request_builder: QubePMPLRequestBuilder | None = None,
+        instrumentation: QubePMPLInstrumentation | None = None,
+        auto_close_report: bool = False,
+        coalescer: QubePMPLCoalescer | None = None,
+        timeout: QubePMPLTimeout | tuple | None = None,
+    ):
+        self.client_session_key: str = client_session_key or str(uuid.uuid4())
+        self.auto_close_report = auto_close_report
+        self.coalescer = coalescer
+        self.report_open: bool | None = None
+        self.logged_in = False
+        super().__init__(
+            base_url=base_url,
+            transport=transport,
+            request_builder=request_builder,
+            instrumentation=instrumentation,
+            timeout=timeout,
+        )
+
+    async def _report_call(self, soap_action: str, body: str | bytes) -> QubePMPLAsyncResponse:
+        if self.auto_close_report and self.report_open is not False:
+            await self.close_report()
+        try:
+            response = await self.make_request(soap_action, body)
+        finally:
+            self.report_open = True
+        if self.auto_close_report and _response_refused(response):
+            await self.close_report()
+            try:
+                response = await self.make_request(soap_action, body)
+            finally:
+                self.report_open = True
+        return response
+
+    async def _lookup_call(self, operation: str, args: tuple, request: tuple) -> QubePMPLAsyncResponse:
+        if self.coalescer is None:
+            return await self._report_call(*request)
+        return await self.coalescer.acall(
+            (self.base_url, operation, args), lambda: self._report_call(*request)
+        )
+
+    async def ensure_report_closed(self) -> QubePMPLAsyncResponse | None:
+        if self.report_open is False:
+            return None
+        return await self.close_report()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.logged_in:
+            await self.logout()
+
+    async def logout(self) -> QubePMPLAsyncResponse:
+        response = await self.make_request(*self.logout_request())
+        self.logged_in = False
+        self.report_open = False
+        return response
+
+    async def close_report(self) -> QubePMPLAsyncResponse:
+        response = await self.make_request(*self.close_report_request())
+        if response.ok:
+            self.report_open = False
+        return response
+
+    async def get_users(self, ref: str = "?", exact: bool = False) -> QubePMPLAsyncResponse:
+        return await self._lookup_call("get_users", (ref, exact), self.get_users_request(ref, exact))
+
+    async def get_properties(self, ref: str = "?", exact: bool = False) -> QubePMPLAsyncResponse:
+        return await self._lookup_call(
+            "get_properties", (ref, exact), self.get_properties_request(ref, exact)
+        )
+
+    async def get_fund(
+        self,
+        property_ref: str = "",
+        fund_uid: str = "",
+        owner_ref: str = "",
+        description: str = "",
+    ) -> QubePMPLAsyncResponse:
+        return await self._lookup_call(
+            "get_fund",
+            (property_ref, fund_uid, owner_ref, description),
+            self.get_fund_request(property_ref, fund_uid, owner_ref, description),
+        )
+
+    async def get_fund_heading(self, property_ref: str, fund_type: str) -> QubePMPLAsyncResponse:
+        return await self._lookup_call(
+            "get_fund_heading", (property_ref, fund_type), self.get_fund_heading_request(property_ref, fund_type)
+        )
+
+    async def post_invoice(
+        self,
+        invoice: QubePMPLInvoice,
+        property_ref: str,
+        user_id: str,
+        fund_heading_uid: str,
+    ) -> QubePMPLAsyncResponse:
+        return await self._report_call(
+            *self.post_invoice_request(invoice, property_ref, user_id, fund_heading_uid)
+        )
+
+    # Parsed lookups and posting, as on QubePMPLAPISession.
+
+    async def lookup_users(self, ref: str = "?", exact: bool = False) -> QubePMPLLookupResult:
+        return parse_lookup((await self.get_users(ref, exact)).content, "user")
+
+    async def lookup_properties(self, ref: str = "?", exact: bool = False) -> QubePMPLLookupResult:
+        return parse_lookup((await self.get_properties(ref, exact)).content, "property")
+
+    async def lookup_funds(
+        self,
+        property_ref: str = "",
+        fund_uid: str = "",
+        owner_ref: str = "",
+        description: str = "",
+    ) -> QubePMPLLookupResult:
+        response = await self.get_fund(property_ref, fund_uid, owner_ref, description)
+        return parse_lookup(response.content, "fund")
+
+    async def lookup_fund_headings(self, property_ref: str, fund_type: str) -> QubePMPLLookupResult:
+        return parse_lookup((await self.get_fund_heading(property_ref, fund_type)).content, "heading")
+
+    async def post_journal(
+        self,
+        invoice: QubePMPLInvoice,
+        property_ref: str,
+        user_id: str,
+        fund_heading_uid: str,
+    ) -> QubePMPLPostJournalResult:
+        response = await self.post_invoice(invoice, property_ref, user_id, fund_heading_uid)
+        return parse_post_journal(response.content)
+
+
+# Async client, authenticates and generates sessions that share its transport, coalescer and timeout.
+
+
+class QubePMPLAsyncAPIClient(QubePMPLAPIClientRequests, QubePMPLAsyncAPICommon):
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        group: str,
+        transport: QubePMPLAsyncTransport | None = None,
+        request_builder: QubePMPLRequestBuilder | None = None,
+        instrumentation: QubePMPLInstrumentation | None = None,
+        auto_close_report: bool = False,
+        coalescer: QubePMPLCoalescer | None = None,
+        timeout: QubePMPLTimeout | tuple | None = None,
+    ):
+        self.username = username
+        self.password = password
+        self.group = group
+        self.auto_close_report = auto_close_report
+        self.coalescer = coalescer
+        super().__init__(
+            base_url=base_url,
+            transport=transport,
+            request_builder=request_builder,
+            instrumentation=instrumentation,
+            timeout=timeout,
+        )
+
+    async def login(self, client_session_key: str | None = None) -> QubePMPLAsyncResponse:
+        return await self.make_request(*self.login_request(client_session_key or str(uuid.uuid4())))
+
+    async def get_session(self) -> QubePMPLAsyncAPISession:
+        client_session_key = str(uuid.uuid4())
+        login_response = await self.login(client_session_key=client_session_key)
+        self.check_login_response(login_response.content)
+        session = QubePMPLAsyncAPISession(
+            client_session_key=client_session_key,
+            base_url=self.base_url,
+            transport=self.transport,
+            request_builder=self.request_builder,
+            instrumentation=self.instrumentation,
+            auto_close_report=self.auto_close_report,
+            coalescer=self.coalescer,
+            timeout=self.timeout,
+        )
+        session.report_open = False
+        session.logged_in = True
+        return session
+
+    # Closes the pooled connections of the client's transport (shared with its sessions).
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
@@ -0,0 +1,258 @@
+import asyncio
+import ssl
+import time
+import weakref
+from collections import deque
+from urllib.parse import urlsplit
+from requests.structures import CaseInsensitiveDict
+from .instrumentation import QubePMPLCall, current_call
+from .transport import QubePMPLTransportStats, _TransportCounters
+
+##############################################
+# Non-blocking HTTP transport for the asyncio client
+##############################################
+
+# Response returned by QubePMPLAsyncTransport. Mirrors the parts of requests.Response the client uses.
+
+
+class QubePMPLAsyncResponse:
+    __slots__ = ("status_code", "reason", "headers", "content")
+
+    def __init__(self, status_code: int, reason: str, headers: CaseInsensitiveDict, content: bytes):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 400
+
+    @property
+    def encoding(self) -> str:
+        content_type = self.headers.get("Content-Type", "")
+        for param in content_type.split(";")[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "charset" and value:
+                return value.strip('"')
+        return "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+
+class _Connection:
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    # Whether the server has closed the connection (or it was closed here) while it sat idle.
+    @property
+    def closed(self) -> bool:
+        return self.reader.at_eof() or self.writer.is_closing()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+# Idle connections and per-host limits of one event loop: streams and semaphores only work on the loop
+# they were created on.
+
+
+class _LoopPools:
+    __slots__ = ("idle", "limits", "__weakref__")
+
+    def __init__(self):
+        self.idle: dict[tuple, deque[_Connection]] = {}
+        self.limits: dict[tuple, asyncio.Semaphore] = {}
+
+
+# Pooled HTTP/1.1 keep-alive transport built on asyncio streams.
+# Connections and limits are kept per event loop, so one transport can serve successive asyncio.run() calls
+# (or loops in several threads); a loop's pools are dropped with the loop.
+# max_connections_per_host: cap on in-flight requests (and open connections) per host,
+# further requests wait for a free connection instead of opening new ones.
+# ssl_context: used for https endpoints, defaults to ssl.create_default_context().
+# post's timeout: (connect, read) seconds, None for no limit. read bounds the whole exchange (sending the
+# request and reading all of the response); a connection that times out is closed, not pooled.
+# Idle connections the server has already closed are dropped before anything is written to them. A request
+# is never resent once any of it has been written: if the connection then fails before a response arrives,
+# post raises ConnectionError, since the server may have acted on it (e.g. posted an invoice).
+# A response body must be sized by Content-Length or chunked encoding, or delimited by the server closing
+# a connection it marked "Connection: close" (HTTP/1.0 without keep-alive); anything else raises ConnectionError.
+
+
+class QubePMPLAsyncTransport:
+    def __init__(
+        self,
+        max_connections_per_host: int = 100,
+        ssl_context: ssl.SSLContext | None = None,
+    ):
+        if max_connections_per_host < 1:
+            raise ValueError("max_connections_per_host must be at least 1.")
+        self.max_connections_per_host = max_connections_per_host
+        self.ssl_context = ssl_context
+        self._loops: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopPools] = weakref.WeakKeyDictionary()
+        self._counters = _TransportCounters()
+
+    def _pools(self) -> _LoopPools:
+        loop = asyncio.get_running_loop()
+        pools = self._loops.get(loop)
+        if pools is None:
+            pools = self._loops[loop] = _LoopPools()
+        return pools
+
+    async def post(self, url: str, data, headers: dict, timeout=None) -> QubePMPLAsyncResponse:
+        connect_timeout, read_timeout = timeout if timeout is not None else (None, None)
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        body = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+        head = [f"POST {path} HTTP/1.1", f"Host: {parts.netloc}", f"Content-Length: {len(body)}"]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        request = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+        pools = self._pools()
+        limit = pools.limits.get(key)
+        if limit is None:
+            limit = pools.limits[key] = asyncio.Semaphore(self.max_connections_per_host)
+        call = current_call()
+        async with limit:
+            self._counters.request_sent()
+            connection = None
+            idle = pools.idle.get(key)
+            while idle and connection is None:
+                connection = idle.pop()
+                if connection.closed:
+                    connection.close()
+                    connection = None
+            if connection is None:
+                start = time.perf_counter()
+                connection = await asyncio.wait_for(self._connect(key), connect_timeout)
+                if call is not None:
+                    call.add_phase("connect", time.perf_counter() - start)
+            return await asyncio.wait_for(self._exchange(pools, key, connection, request, call), read_timeout)
+
+    async def _connect(self, key: tuple) -> _Connection:
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            ssl_context = self.ssl_context
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
+        self._counters.connection_opened()
+        return _Connection(reader, writer)
+
+    # call: instrumented call to record send / wait phases on, if any.
+
+    async def _exchange(
+        self,
+        pools: _LoopPools,
+        key: tuple,
+        connection: _Connection,
+        request: bytes,
+        call: QubePMPLCall | None = None,
+    ) -> QubePMPLAsyncResponse:
+        reader = connection.reader
+        try:
+            try:
+                start = time.perf_counter()
+                connection.writer.write(request)
+                await connection.writer.drain()
+                sent = time.perf_counter()
+                status_line = await reader.readline()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                status_line = b""
+            if not status_line:
+                raise ConnectionError(f"Connection to {key[1]}:{key[2]} closed without a response.")
+            if call is not None:
+                call.add_phase("send", sent - start)
+                call.add_phase("wait", time.perf_counter() - sent)
+                if call.connect is None:
+                    call.connect = 0.0
+
+            version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+            headers = CaseInsensitiveDict()
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip()] = value.strip()
+
+            connection_header = headers.get("Connection", "").lower()
+            keep_alive = (
+                connection_header != "close"
+                if version == "HTTP/1.1"
+                else connection_header == "keep-alive"
+            )
+            if status.startswith("1") or status in ("204", "304"):
+                content = b""
+            elif "chunked" in headers.get("Transfer-Encoding", "").lower():
+                content = await self._read_chunked(reader)
+            elif "Content-Length" in headers:
+                content = await reader.readexactly(int(headers["Content-Length"]))
+            elif not keep_alive:
+                content = await reader.read()
+            else:
+                raise ConnectionError(
+                    f"Response from {key[1]}:{key[2]} has no Content-Length or chunked encoding "
+                    "on a keep-alive connection."
+                )
+        except BaseException:
+            connection.close()
+            raise
+
+        if keep_alive:
+            pools.idle.setdefault(key, deque()).append(connection)
+        else:
+            connection.close()
+        return QubePMPLAsyncResponse(int(status), reason, headers, content)
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip trailers up to the terminating blank line.
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def stats(self) -> QubePMPLTransportStats:
+        return self._counters.snapshot()
+
+    # Closes the running loop's idle connections, and forgets those of loops that have been closed.
+
+    async def aclose(self) -> None:
+        for loop in [loop for loop in self._loops.keys() if loop.is_closed()]:
+            self._loops.pop(loop, None)
+        pools = self._loops.pop(asyncio.get_running_loop(), None)
+        if pools is None:
+            return
+        connections = [connection for idle in pools.idle.values() for connection in idle]
+        for connection in connections:
+            connection.close()
+        for connection in connections:
+            try:
+                await connection.writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
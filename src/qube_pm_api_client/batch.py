@@ -0,0 +1,333 @@
+import sys
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from itertools import compress
+from operator import add, gt, ne, not_
+from typing import NamedTuple
+from .bulk import QubePMPLPostJob
+from .main import QubePMPLInvoice
+
+##############################################
+# Columnar invoice batches
+##############################################
+
+# A large batch of single-line invoices held column by column: amounts as integer pence in array("q"),
+# dates as proleptic ordinals in array("l") (0 for missing or unreadable), references and codes as
+# interned strings shared across rows. A row costs a few dozen bytes instead of a QubePMPLInvoice with
+# its own dict, floats and date strings.
+# batch[i] is a QubePMPLInvoiceRow view, created on access and dropped after use, that post_invoice,
+# QubePMPLBulkPoster and the posting journal accept wherever they take a QubePMPLInvoice. jobs() feeds
+# a bulk poster one view per job as it is submitted, so only the invoices in flight ever have one.
+# validate() checks every row's totals and dates a column at a time; jobs() leaves out (or refuses) rows
+# that fail it.
+# Invoices with detail lines aren't supported; post those as QubePMPLInvoice.
+
+DATE_FIELDS = ("invoice_date", "period_start", "period_finish", "prompt_payment_due", "payment_due")
+
+# Date orderings validate() can check on request (date_order=DATE_ORDER), as (earlier, later). Qube
+# doesn't enforce them, and credit notes or back-dated invoices it accepts can break them.
+
+DATE_ORDER = (
+    ("period_start", "period_finish"),
+    ("invoice_date", "prompt_payment_due"),
+    ("prompt_payment_due", "payment_due"),
+)
+
+
+# Most validation errors jobs() lists in the ValueError it raises.
+
+MAX_LISTED = 10
+
+
+# A row validate() rejected. field: the (first) column at fault.
+
+
+class QubePMPLBatchError(NamedTuple):
+    index: int
+    invoice_number: str
+    field: str
+    message: str
+
+
+# Amount in pounds (float, str, int or Decimal) to integer pence, rounding half away from zero.
+
+
+def to_pence(amount) -> int:
+    if isinstance(amount, float):
+        amount = repr(amount)
+    try:
+        return int((Decimal(amount) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}") from None
+
+
+def _ordinal(value) -> int:
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(value).toordinal() if value else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class QubePMPLInvoiceBatch(Sequence):
+    def __init__(self):
+        self.supplier_ref: list[str] = []
+        self.invoice_number: list[str] = []
+        self.invoice_link: list[str] = []
+        self.vat_code: list[str] = []
+        self.property_ref: list[str] = []
+        self.fund_heading_uid: list[str] = []
+        self.nett = array("q")
+        self.vat = array("q")
+        self.gross = array("q")
+        self.invoice_date = array("l")
+        self.period_start = array("l")
+        self.period_finish = array("l")
+        self.prompt_payment_due = array("l")
+        self.payment_due = array("l")
+
+    # Amounts in pounds; dates as ISO strings (or date objects). Unreadable dates are kept as missing and
+    # reported by validate(); an unreadable amount raises ValueError here.
+    # property_ref / fund_heading_uid: where jobs() posts the invoice.
+
+    def append(
+        self,
+        supplier_ref: str,
+        invoice_number: str,
+        nett,
+        vat,
+        gross,
+        invoice_date: str,
+        period_start: str,
+        period_finish: str,
+        prompt_payment_due: str,
+        payment_due: str,
+        vat_code: str,
+        invoice_link: str = "",
+        property_ref: str = "",
+        fund_heading_uid: str = "",
+    ) -> None:
+        amounts = (to_pence(nett), to_pence(vat), to_pence(gross))
+        self.nett.append(amounts[0])
+        self.vat.append(amounts[1])
+        self.gross.append(amounts[2])
+        self.invoice_date.append(_ordinal(invoice_date))
+        self.period_start.append(_ordinal(period_start))
+        self.period_finish.append(_ordinal(period_finish))
+        self.prompt_payment_due.append(_ordinal(prompt_payment_due))
+        self.payment_due.append(_ordinal(payment_due))
+        self.supplier_ref.append(sys.intern(supplier_ref))
+        self.invoice_number.append(invoice_number)
+        self.invoice_link.append(sys.intern(invoice_link))
+        self.vat_code.append(sys.intern(vat_code))
+        self.property_ref.append(sys.intern(property_ref))
+        self.fund_heading_uid.append(sys.intern(fund_heading_uid))
+
+    # Rows as dicts with the QubePMPLInvoice field names (plus property_ref / fund_heading_uid);
+    # extra keys are ignored, missing optional ones default to "".
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> "QubePMPLInvoiceBatch":
+        batch = cls()
+        for row in rows:
+            batch.append(
+                row["supplier_ref"],
+                row["invoice_number"],
+                row["nett"],
+                row["vat"],
+                row["gross"],
+                row["invoice_date"],
+                row["period_start"],
+                row["period_finish"],
+                row["prompt_payment_due"],
+                row["payment_due"],
+                row["vat_code"],
+                row.get("invoice_link") or "",
+                row.get("property_ref") or "",
+                row.get("fund_heading_uid") or "",
+            )
+        return batch
+
+    @classmethod
+    def from_invoices(cls, invoices: Iterable[QubePMPLInvoice]) -> "QubePMPLInvoiceBatch":
+        batch = cls()
+        for invoice in invoices:
+            if invoice.lines:
+                raise ValueError(
+                    f"Invoice {invoice.invoice_number} has detail lines; batches hold single-line invoices."
+                )
+            batch.append(
+                invoice.supplier_ref,
+                invoice.invoice_number,
+                invoice.nett,
+                invoice.vat,
+                invoice.gross,
+                invoice.invoice_date,
+                invoice.period_start,
+                invoice.period_finish,
+                invoice.prompt_payment_due,
+                invoice.payment_due,
+                invoice.vat_code,
+                invoice.invoice_link,
+            )
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.invoice_number)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Invoice batch index out of range")
+        return QubePMPLInvoiceRow(self, index)
+
+    def __iter__(self) -> Iterator["QubePMPLInvoiceRow"]:
+        for index in range(len(self)):
+            yield QubePMPLInvoiceRow(self, index)
+
+    # Every row whose nett + VAT isn't gross or with a date missing or unreadable, in row order.
+    # date_order: (earlier, later) pairs to check as well, e.g. DATE_ORDER.
+    # Each column check runs over whole arrays (map / compress), not per row.
+
+    def validate(self, date_order: Iterable[tuple[str, str]] = ()) -> list[QubePMPLBatchError]:
+        rows = range(len(self))
+        errors = []
+        for index in compress(rows, map(ne, map(add, self.nett, self.vat), self.gross)):
+            errors.append(
+                self._error(
+                    index,
+                    "gross",
+                    f"nett {self.nett[index] / 100:.2f} + vat {self.vat[index] / 100:.2f} "
+                    f"is not gross {self.gross[index] / 100:.2f}",
+                )
+            )
+        for name in DATE_FIELDS:
+            for index in compress(rows, map(not_, getattr(self, name))):
+                errors.append(self._error(index, name, f"{name} is missing or not a YYYY-MM-DD date"))
+        for earlier, later in date_order:
+            first, second = getattr(self, earlier), getattr(self, later)
+            for index in compress(rows, map(gt, first, second)):
+                if first[index] and second[index]:
+                    errors.append(self._error(index, later, f"{later} is before {earlier}"))
+        errors.sort(key=lambda error: error.index)
+        return errors
+
+    def _error(self, index: int, field: str, message: str) -> QubePMPLBatchError:
+        return QubePMPLBatchError(index, self.invoice_number[index], field, message)
+
+    # Post jobs for every row (or the given indexes), for QubePMPLBulkPoster.post, created lazily.
+    # Rows without a property_ref / fund_heading_uid take the defaults given here.
+    # The rows are validated first (validate(date_order)). invalid: a list to append the errors of rows
+    # that fail to; those rows get no job and the rest are posted. Without one, any invalid row raises
+    # ValueError listing them, before any job is created.
+
+    def jobs(
+        self,
+        user_id: str,
+        property_ref: str = "",
+        fund_heading_uid: str = "",
+        indexes: Iterable[int] | None = None,
+        invalid: list[QubePMPLBatchError] | None = None,
+        date_order: Iterable[tuple[str, str]] = (),
+    ) -> Iterator[QubePMPLPostJob]:
+        rows = range(len(self)) if indexes is None else list(indexes)
+        errors = self.validate(date_order)
+        if indexes is not None:
+            selected = set(rows)
+            errors = [error for error in errors if error.index in selected]
+        if errors and invalid is not None:
+            invalid.extend(errors)
+            failed = {error.index for error in errors}
+            rows = [index for index in rows if index not in failed]
+        elif errors:
+            listed = "; ".join(f"row {e.index} ({e.invoice_number}): {e.message}" for e in errors[:MAX_LISTED])
+            more = f"; and {len(errors) - MAX_LISTED} more" if len(errors) > MAX_LISTED else ""
+            raise ValueError(f"Invoice batch failed validation with {len(errors)} error(s): {listed}{more}")
+        return self._jobs(rows, user_id, property_ref, fund_heading_uid)
+
+    def _jobs(
+        self, rows: Iterable[int], user_id: str, property_ref: str, fund_heading_uid: str
+    ) -> Iterator[QubePMPLPostJob]:
+        for index in rows:
+            yield QubePMPLPostJob(
+                QubePMPLInvoiceRow(self, index),
+                self.property_ref[index] or property_ref,
+                user_id,
+                self.fund_heading_uid[index] or fund_heading_uid,
+            )
+
+
+def _date_column(name: str):
+    def get(self) -> str:
+        ordinal = getattr(self.batch, name)[self.index]
+        return date.fromordinal(ordinal).isoformat() if ordinal else ""
+
+    return property(get)
+
+
+def _amount_column(name: str):
+    def get(self) -> float:
+        return getattr(self.batch, name)[self.index] / 100
+
+    return property(get)
+
+
+def _text_column(name: str):
+    def get(self) -> str:
+        return getattr(self.batch, name)[self.index]
+
+    return property(get)
+
+
+# Read-only view of one batch row with the attributes of a single-line QubePMPLInvoice.
+
+
+class QubePMPLInvoiceRow:
+    __slots__ = ("batch", "index")
+
+    lines = None
+    detail_lines = QubePMPLInvoice.detail_lines
+
+    def __init__(self, batch: QubePMPLInvoiceBatch, index: int):
+        self.batch = batch
+        self.index = index
+
+    supplier_ref = _text_column("supplier_ref")
+    invoice_number = _text_column("invoice_number")
+    invoice_link = _text_column("invoice_link")
+    vat_code = _text_column("vat_code")
+    property_ref = _text_column("property_ref")
+    fund_heading_uid = _text_column("fund_heading_uid")
+    nett = _amount_column("nett")
+    vat = _amount_column("vat")
+    gross = _amount_column("gross")
+    invoice_date = _date_column("invoice_date")
+    period_start = _date_column("period_start")
+    period_finish = _date_column("period_finish")
+    prompt_payment_due = _date_column("prompt_payment_due")
+    payment_due = _date_column("payment_due")
+
+    def to_invoice(self) -> QubePMPLInvoice:
+        return QubePMPLInvoice(
+            self.supplier_ref,
+            self.invoice_number,
+            self.nett,
+            self.vat,
+            self.gross,
+            self.invoice_date,
+            self.period_start,
+            self.period_finish,
+            self.prompt_payment_due,
+            self.payment_due,
+            self.vat_code,
+            self.invoice_link,
+        )
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.index}, {self.invoice_number!r})"
@@ -0,0 +1,419 @@
+import re
+from collections.abc import Callable
+from string import Formatter
+
+##############################################
+# Pre-compiled byte templates for SOAP requests
+##############################################
+
+# Opt-in replacement for the f-string request path. Each operation's full envelope is compiled once
+# into a single f-string over the values, so building a request is one format call and one encode, with
+# no envelope re-wrapping, and each amount is formatted once rather than once per appearance. Unlike the
+# f-string path, text values are XML-escaped. benchmarks/builder_benchmark.py measures an invoice body
+# at about 1.4x the speed of the f-string path; compact=True also makes bodies about 30% smaller.
+# Joining pre-encoded byte segments was measured too and is slower in CPython than formatting one str
+# and encoding it once (ASCII encodes at memcpy speed; a bytes per field does not).
+# Default output matches the f-string path byte for byte (apart from escaping, which the f-string path
+# does not do); compact=True strips the indentation between tags and the XML comments.
+
+ENVELOPE_HEAD = """<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:web="http://qube.qubeglobal.com/ns/webservice/">
+   <soapenv:Header/>
+   <soapenv:Body>
+      """
+ENVELOPE_TAIL = """
+   </soapenv:Body>
+</soapenv:Envelope>"""
+
+SOAP_ACTION_LOGIN = "http://qube.qubeglobal.com/ns/webservice/Login-Overload-4"
+SOAP_ACTION_LOGOUT = "http://qube.qubeglobal.com/ns/webservice/Logout"
+SOAP_ACTION_CLOSE_REPORT = "http://qube.qubeglobal.com/ns/webservice/CloseReport"
+SOAP_ACTION_PROCESS = "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia"
+
+LOGIN_BODY = """<web:Login-Overload-4>
+    <!--Optional:-->
+    <web:LoginData>
+        <logondata userdirectory="" xmlns="">
+            <clientsessionkey>{client_session_key}</clientsessionkey>
+            <username>{username}</username>
+            <password>{password}</password>
+            <group>{group}</group>
+            <application>Purchase Ledger</application>
+            <timeoutinterval>1000</timeoutinterval>
+        </logondata>
+    </web:LoginData>
+</web:Login-Overload-4>"""
+
+LOGOUT_BODY = """<web:Logout>
+    <!--Optional:-->
+    <web:ClientSessionKey>{client_session_key}</web:ClientSessionKey>
+</web:Logout>"""
+
+CLOSE_REPORT_BODY = """<web:CloseReport>
+    <web:ClientSessionKey>{client_session_key}</web:ClientSessionKey>
+</web:CloseReport>"""
+
+REFERENCE_LOOKUP_BODY = """<web:QubeProcess-1ia>
+<web:ClientSessionKey>{client_session_key}</web:ClientSessionKey>
+<web:QubeProcessName>PURAPI:webAPI</web:QubeProcessName>
+<web:Data>
+        <request-to-qube>
+          <{lookup}>
+            <reference exact="{exact}">{ref}</reference>
+          </{lookup}>
+        </request-to-qube>
+    </web:Data>
+    </web:QubeProcess-1ia>"""
+
+FUND_LOOKUP_BODY = """<web:QubeProcess-1ia>
+<web:ClientSessionKey>{client_session_key}</web:ClientSessionKey>
+<web:QubeProcessName>PURAPI:webAPI</web:QubeProcessName>
+<web:Data>
+        <request-to-qube>
+          <fund-lookup>
+            <owner-reference>{owner_ref}</owner-reference>
+            <property-reference>{property_ref}</property-reference>
+            <description>{description}</description>
+            <unique-id>{fund_uid}</unique-id>
+          </fund-lookup>
+        </request-to-qube>
+    </web:Data>
+    </web:QubeProcess-1ia>"""
+
+HEADING_LOOKUP_BODY = """<web:QubeProcess-1ia>
+    <web:ClientSessionKey>{client_session_key}</web:ClientSessionKey>
+    <web:QubeProcessName>PURAPI:webAPI</web:QubeProcessName>
+    <web:Data>
+        <request-to-qube>
+            <heading-lookup>
+                <property-reference>{property_ref}</property-reference>
+                <fund-type>{fund_type}</fund-type>
+            </heading-lookup>
+        </request-to-qube>
+    </web:Data>
+</web:QubeProcess-1ia>"""
+
+POST_INVOICE_HEAD = """<web:QubeProcess-1ia>
+    <web:ClientSessionKey>{client_session_key}</web:ClientSessionKey>
+    <web:QubeProcessName>PUR:Invoice.ws</web:QubeProcessName>
+    <web:Data>
+        <request-to-qube>
+            <version>1</version>
+            <pass-register-warnings>true</pass-register-warnings>
+            <pass-ledger-warnings>false</pass-ledger-warnings>
+            <post-journal>
+                <to-register>true</to-register>
+                <type>invoice</type>
+                <user-id>{user_id}</user-id>
+                {document}
+                <supplier-reference>{supplier_ref}</supplier-reference>
+                <invoice-number>{invoice_number}</invoice-number>
+                <invoice-date>{invoice_date}</invoice-date>
+                <period-start>{period_start}</period-start>
+                <period-finish>{period_finish}</period-finish>
+                <prompt-payment-due>{prompt_payment_due}</prompt-payment-due>
+                <payment-due>{payment_due}</payment-due>
+                <nett>{nett:.2f}</nett>
+                <vat>{vat:.2f}</vat>
+                <gross>{gross:.2f}</gross>
+                <vat-on-pay>false</vat-on-pay>"""
+
+POST_INVOICE_DETAIL = """
+                <detail>
+                    <line-type>{line_type}</line-type>
+                    <vat-code>{vat_code}</vat-code>
+                    <nett>{nett:.2f}</nett>
+                    <vat>{vat:.2f}</vat>
+                    <gross>{gross:.2f}</gross>
+                    <property-reference>{property_ref}</property-reference>
+                    <heading-unique-id>{fund_heading_uid}</heading-unique-id>
+                </detail>"""
+
+POST_INVOICE_TAIL = """
+            </post-journal>
+        </request-to-qube>
+    </web:Data>
+</web:QubeProcess-1ia>"""
+
+# Single line invoice: the detail line carries the header totals.
+POST_INVOICE_BODY = (
+    POST_INVOICE_HEAD
+    + POST_INVOICE_DETAIL.replace("{line_type}", "Property expenditure")
+    + POST_INVOICE_TAIL
+)
+
+DOCUMENT_LINK = """<document shortcut="false" saveas="{invoice_number}">{invoice_link}</document>"""
+NO_DOCUMENT = "<!-- document -->"
+
+_COMPACT_GAPS = re.compile(r">\s+<")
+_COMMENTS = re.compile(r"<!--.*?-->", re.S)
+
+
+def minify(text: str) -> str:
+    return _COMPACT_GAPS.sub("><", _COMMENTS.sub("", text)).strip()
+
+
+def _escape_text(value: str) -> str:
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    if '"' in value:
+        value = value.replace('"', "&quot;")
+    return value
+
+
+def _escape(value) -> str:
+    return _escape_text(str(value))
+
+
+# Source of a function taking the fields as arguments and returning the request as bytes. Fields with a
+# spec are formatted first, once each. The text fields are then checked, joined, for characters to escape
+# (or a value that isn't a str, which fails the join): without any, one f-string of the values is encoded;
+# otherwise one that escapes each of them.
+
+
+def _source(
+    fields: list[str], ignored: list[str], text_fields: list[str], formatted: dict, plain: str, escaped: str
+) -> str:
+    lines = [f"def render({', '.join(fields + [name + '=None' for name in ignored])}):"]
+    lines += [f"    {local} = _format({name}, {spec!r})" for (name, spec), local in formatted.items()]
+    lines += [
+        "    try:",
+        f"        _texts = ''.join(({''.join(name + ', ' for name in text_fields)}))",
+        "    except TypeError:",
+        "        _special = True",
+        "    else:",
+        """        _special = '&' in _texts or '<' in _texts or '>' in _texts or '"' in _texts""",
+        "    if _special:",
+        f"        return f{escaped!r}.encode()",
+        f"    return f{plain!r}.encode()",
+    ]
+    return "\n".join(lines)
+
+
+# One operation's request, compiled once. Placeholders use str.format syntax; a field with a
+# format spec (e.g. {nett:.2f}) is rendered with it, every other field as escaped text (str() of it).
+# Fixed values can be baked in at compile time with `constants`.
+# envelope=False compiles a fragment without the SOAP envelope (the pieces of a multi-line post).
+# ignored: fields render accepts but the body doesn't use, so variants of one request (with and without a
+# document link) take the same arguments.
+# render(**values): the request as bytes, given every field by name. It is a function compiled for the
+# template (see _source), so a render is one call with no dict or tuple of values built along the way,
+# one format per amount however often it appears (a single-line post repeats them in its detail line)
+# and one f-string and encode for the whole envelope.
+
+
+class QubePMPLTemplate:
+    __slots__ = ("soap_action", "fields", "render")
+
+    def __init__(
+        self,
+        soap_action: str,
+        body: str,
+        compact: bool = False,
+        constants: dict | None = None,
+        envelope: bool = True,
+        ignored: tuple[str, ...] = (),
+    ):
+        text = ENVELOPE_HEAD + body + ENVELOPE_TAIL if envelope else body
+        if constants:
+            for name, value in constants.items():
+                text = text.replace("{" + name + "}", value)
+        if compact:
+            text = minify(text)
+        self.soap_action = soap_action
+        fields: list[str] = []
+        text_fields: list[str] = []
+        formatted: dict[tuple[str, str], str] = {}
+        plain = []
+        escaped = []
+        for literal, name, spec, _ in Formatter().parse(text):
+            literal = literal.replace("{", "{{").replace("}", "}}")
+            plain.append(literal)
+            escaped.append(literal)
+            if name is None:
+                continue
+            if not name.isidentifier() or name.startswith("_"):
+                raise ValueError(f"Template field {name!r} is not a plain name.")
+            if name not in fields:
+                fields.append(name)
+            if spec:
+                local = formatted.setdefault((name, spec), f"_f{len(formatted)}")
+                plain.append(f"{{{local}}}")
+                escaped.append(f"{{{local}}}")
+            else:
+                if name not in text_fields:
+                    text_fields.append(name)
+                plain.append(f"{{{name}}}")
+                escaped.append(f"{{_escape({name})}}")
+        self.fields = tuple(fields)
+        namespace = {"_escape": _escape, "_format": format}
+        ignored = [name for name in ignored if name not in fields]
+        exec(_source(fields, ignored, text_fields, formatted, "".join(plain), "".join(escaped)), namespace)
+        self.render: Callable[..., bytes] = namespace["render"]
+
+
+# Compiled templates for every operation. Build one per process (or per compact setting) and
+# share it; rendering is thread safe.
+
+
+class QubePMPLRequestBuilder:
+    def __init__(self, compact: bool = False):
+        self.compact = compact
+
+        def template(soap_action: str, body: str, **constants) -> QubePMPLTemplate:
+            return QubePMPLTemplate(soap_action, body, compact, constants)
+
+        self.login_template = template(SOAP_ACTION_LOGIN, LOGIN_BODY)
+        self.logout_template = template(SOAP_ACTION_LOGOUT, LOGOUT_BODY)
+        self.close_report_template = template(SOAP_ACTION_CLOSE_REPORT, CLOSE_REPORT_BODY)
+        self.users_template = template(SOAP_ACTION_PROCESS, REFERENCE_LOOKUP_BODY, lookup="user-lookup")
+        self.properties_template = template(
+            SOAP_ACTION_PROCESS, REFERENCE_LOOKUP_BODY, lookup="property-lookup"
+        )
+        self.fund_template = template(SOAP_ACTION_PROCESS, FUND_LOOKUP_BODY)
+        self.heading_template = template(SOAP_ACTION_PROCESS, HEADING_LOOKUP_BODY)
+        self.post_invoice_template = template(
+            SOAP_ACTION_PROCESS, POST_INVOICE_BODY, document=DOCUMENT_LINK
+        )
+        self.post_invoice_no_document_template = QubePMPLTemplate(
+            SOAP_ACTION_PROCESS, POST_INVOICE_BODY, compact, {"document": NO_DOCUMENT}, ignored=("invoice_link",)
+        )
+        # Multi-line posts: envelope and header, one fragment per detail line, then the closing tags.
+        self.post_invoice_head_template = QubePMPLTemplate(
+            SOAP_ACTION_PROCESS, ENVELOPE_HEAD + POST_INVOICE_HEAD, compact, {"document": DOCUMENT_LINK}, False
+        )
+        self.post_invoice_no_document_head_template = QubePMPLTemplate(
+            SOAP_ACTION_PROCESS,
+            ENVELOPE_HEAD + POST_INVOICE_HEAD,
+            compact,
+            {"document": NO_DOCUMENT},
+            False,
+            ("invoice_link",),
+        )
+        self.post_invoice_detail_template = QubePMPLTemplate(
+            SOAP_ACTION_PROCESS, POST_INVOICE_DETAIL, compact, envelope=False
+        )
+        self.post_invoice_tail = (
+            minify(POST_INVOICE_TAIL + ENVELOPE_TAIL) if compact else POST_INVOICE_TAIL + ENVELOPE_TAIL
+        ).encode("utf-8")
+
+    def login(self, client_session_key: str, username: str, password: str, group: str) -> tuple[str, bytes]:
+        t = self.login_template
+        return t.soap_action, t.render(
+            client_session_key=client_session_key, username=username, password=password, group=group
+        )
+
+    def logout(self, client_session_key: str) -> tuple[str, bytes]:
+        t = self.logout_template
+        return t.soap_action, t.render(client_session_key=client_session_key)
+
+    def close_report(self, client_session_key: str) -> tuple[str, bytes]:
+        t = self.close_report_template
+        return t.soap_action, t.render(client_session_key=client_session_key)
+
+    def get_users(self, client_session_key: str, ref: str = "?", exact: bool = False) -> tuple[str, bytes]:
+        t = self.users_template
+        return t.soap_action, t.render(
+            client_session_key=client_session_key, exact="true" if exact else "false", ref=ref
+        )
+
+    def get_properties(
+        self, client_session_key: str, ref: str = "?", exact: bool = False
+    ) -> tuple[str, bytes]:
+        t = self.properties_template
+        return t.soap_action, t.render(
+            client_session_key=client_session_key, exact="true" if exact else "false", ref=ref
+        )
+
+    def get_fund(
+        self,
+        client_session_key: str,
+        property_ref: str = "",
+        fund_uid: str = "",
+        owner_ref: str = "",
+        description: str = "",
+    ) -> tuple[str, bytes]:
+        t = self.fund_template
+        return t.soap_action, t.render(
+            client_session_key=client_session_key,
+            owner_ref=owner_ref,
+            property_ref=property_ref,
+            description=description,
+            fund_uid=fund_uid,
+        )
+
+    def get_fund_heading(self, client_session_key: str, property_ref: str, fund_type: str) -> tuple[str, bytes]:
+        t = self.heading_template
+        return t.soap_action, t.render(
+            client_session_key=client_session_key, property_ref=property_ref, fund_type=fund_type
+        )
+
+    # invoice: anything with QubePMPLInvoice's attributes.
+    # lines: detail lines (QubePMPLInvoiceLine or alike), already validated against the header totals.
+    # Without them a single line carries the header totals against property_ref and fund_heading_uid.
+
+    def post_invoice(
+        self,
+        client_session_key: str,
+        invoice,
+        property_ref: str,
+        user_id: str,
+        fund_heading_uid: str,
+        lines=None,
+    ) -> tuple[str, bytes]:
+        if not lines:
+            t = self.post_invoice_template if invoice.invoice_link else self.post_invoice_no_document_template
+            return t.soap_action, t.render(
+                client_session_key=client_session_key,
+                user_id=user_id,
+                invoice_number=invoice.invoice_number,
+                supplier_ref=invoice.supplier_ref,
+                invoice_date=invoice.invoice_date,
+                period_start=invoice.period_start,
+                period_finish=invoice.period_finish,
+                prompt_payment_due=invoice.prompt_payment_due,
+                payment_due=invoice.payment_due,
+                nett=invoice.nett,
+                vat=invoice.vat,
+                gross=invoice.gross,
+                vat_code=invoice.vat_code,
+                property_ref=property_ref,
+                fund_heading_uid=fund_heading_uid,
+                invoice_link=invoice.invoice_link,
+            )
+        head = self.post_invoice_head_template if invoice.invoice_link else self.post_invoice_no_document_head_template
+        detail = self.post_invoice_detail_template.render
+        parts = [
+            head.render(
+                client_session_key=client_session_key,
+                user_id=user_id,
+                invoice_number=invoice.invoice_number,
+                supplier_ref=invoice.supplier_ref,
+                invoice_date=invoice.invoice_date,
+                period_start=invoice.period_start,
+                period_finish=invoice.period_finish,
+                prompt_payment_due=invoice.prompt_payment_due,
+                payment_due=invoice.payment_due,
+                nett=invoice.nett,
+                vat=invoice.vat,
+                gross=invoice.gross,
+                invoice_link=invoice.invoice_link,
+            )
+        ]
+        for line in lines:
+            parts.append(
+                detail(
+                    line_type=line.line_type,
+                    vat_code=line.vat_code,
+                    nett=line.nett,
+                    vat=line.vat,
+                    gross=line.gross,
+                    property_ref=line.property_ref,
+                    fund_heading_uid=line.fund_heading_uid,
+                )
+            )
+        parts.append(self.post_invoice_tail)
+        return head.soap_action, b"".join(parts)
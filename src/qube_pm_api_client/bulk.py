@@ -0,0 +1,188 @@
+import contextvars
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import NamedTuple
+from .journal import CONFIRMED, DUPLICATE, PENDING, REFUSED, UNCERTAIN, QubePMPLJournalEntry, QubePMPLPostingJournal
+from .limiter import QubePMPLAdaptiveLimiter, limiter_slot
+from .main import QubePMPLInvoice
+from .pool import QubePMPLSessionPool
+from .results import parse_post_journal
+
+##############################################
+# Bulk invoice posting across pooled sessions
+##############################################
+
+# One invoice to post, with the arguments post_invoice needs.
+
+
+class QubePMPLPostJob(NamedTuple):
+    invoice: QubePMPLInvoice
+    property_ref: str
+    user_id: str
+    fund_heading_uid: str
+
+
+# Outcome of posting one job. index is the job's position in the input stream.
+# success comes from the <success> flag of the post-journal response; error_message from
+# <status error-message> or, if the call itself failed, the exception.
+# skipped: the journal showed the invoice as already settled (confirmed, duplicate or rejected, with
+# success and the error from its journal entry) or claimed by another job or process, so it wasn't sent.
+
+
+@dataclass(slots=True)
+class QubePMPLPostResult:
+    index: int
+    job: QubePMPLPostJob
+    success: bool
+    error_code: str = ""
+    error_message: str = ""
+    elapsed: float = 0.0
+    skipped: bool = False
+
+
+# Running totals for a bulk post. Updated as results are yielded.
+
+
+@dataclass(slots=True)
+class QubePMPLBulkSummary:
+    submitted: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed + self.skipped
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+
+# Result for a job the journal didn't let through. entry: its latest journal entry.
+
+
+def _skipped(index: int, job: QubePMPLPostJob, entry: QubePMPLJournalEntry | None) -> QubePMPLPostResult:
+    if entry is None or entry.state in (PENDING, REFUSED, UNCERTAIN):
+        return QubePMPLPostResult(
+            index, job, False, "", "Already being posted by another job or process.", skipped=True
+        )
+    return QubePMPLPostResult(
+        index, job, entry.state in (CONFIRMED, DUPLICATE), entry.error_code, entry.error_message, skipped=True
+    )
+
+
+# Posts a stream of jobs concurrently, each on a session leased from the pool.
+# concurrency: posts in flight at once (defaults to the pool size).
+# max_pending: jobs pulled from the input ahead of completion (defaults to 2 x concurrency),
+# so a generator input is only consumed as fast as Qube accepts postings.
+# journal: optional QubePMPLPostingJournal. Each post is journalled before it is sent and its outcome
+# after; invoices the journal doesn't show as needing a post are skipped, so a restarted run resumes safely.
+# A journal that fails before the post fails that job without sending it; one that fails after leaves the
+# key pending (retried on restart) and adds the error to the job's error_message. Neither stops the run.
+# limiter: optional QubePMPLAdaptiveLimiter. Each post holds one of its slots while it is sent, and a post
+# that raises or isn't successful counts as an error, so the number in flight adapts to how Qube copes
+# (up to concurrency, which stays the hard cap). The session is leased before the slot is taken, so time
+# spent waiting for one isn't mistaken for Qube's latency.
+
+
+class QubePMPLBulkPoster:
+    def __init__(
+        self,
+        pool: QubePMPLSessionPool,
+        concurrency: int | None = None,
+        max_pending: int | None = None,
+        journal: QubePMPLPostingJournal | None = None,
+        limiter: QubePMPLAdaptiveLimiter | None = None,
+    ):
+        self.pool = pool
+        self.journal = journal
+        self.limiter = limiter
+        self.concurrency = concurrency or pool.size
+        self.max_pending = max(max_pending or 2 * self.concurrency, self.concurrency)
+        self.summary = QubePMPLBulkSummary()
+
+    def _post(self, index: int, job: QubePMPLPostJob) -> QubePMPLPostResult:
+        start = time.monotonic()
+        journal = self.journal
+        key = (job.invoice.supplier_ref, job.invoice.invoice_number)
+        if journal is not None:
+            try:
+                if journal.record_intent(*key) is None:
+                    return _skipped(index, job, journal.get(*key))
+            except Exception as e:
+                return QubePMPLPostResult(
+                    index, job, False, "", f"{type(e).__name__}: {e}", time.monotonic() - start
+                )
+        try:
+            with self.pool.lease() as session:
+                with limiter_slot(self.limiter) as slot:
+                    response = session.post_invoice(
+                        job.invoice, job.property_ref, job.user_id, job.fund_heading_uid
+                    )
+                    parsed = parse_post_journal(response.content)
+                    if not parsed.success or parsed.error_message:
+                        slot.fail()
+            success, error_code, error_message = parsed.success, parsed.error_code, parsed.error_message
+        except Exception as e:
+            success, error_code, error_message = False, "", f"{type(e).__name__}: {e}"
+            outcome = lambda: journal.record_error(*key, error_message)
+        else:
+            outcome = lambda: journal.record_result(*key, parsed)
+        if journal is not None:
+            try:
+                outcome()
+            except Exception as e:
+                note = f"Not journalled: {type(e).__name__}: {e}"
+                error_message = f"{error_message}; {note}" if error_message else note
+        return QubePMPLPostResult(
+            index, job, success, error_code, error_message, time.monotonic() - start
+        )
+
+    # Post every job and yield results in completion order.
+
+    def post(self, jobs: Iterable) -> Iterator[QubePMPLPostResult]:
+        self.summary = summary = QubePMPLBulkSummary()
+        jobs = iter(jobs)
+        pending: set[Future] = set()
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                while True:
+                    while not exhausted and len(pending) < self.max_pending:
+                        job = next(jobs, None)
+                        if job is None:
+                            exhausted = True
+                            break
+                        context = contextvars.copy_context()
+                        pending.add(
+                            executor.submit(context.run, self._post, summary.submitted, QubePMPLPostJob(*job))
+                        )
+                        summary.submitted += 1
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        if result.skipped:
+                            summary.skipped += 1
+                        elif result.success:
+                            summary.succeeded += 1
+                        else:
+                            summary.failed += 1
+                        yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+                summary.finished_at = time.monotonic()
+
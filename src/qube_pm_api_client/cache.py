@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+##############################################
+# In-process cache for reference-data lookups
+##############################################
+
+# Snapshot of cache counters.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    size: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+# Thread safe TTL + LRU cache for lookup results, keyed by (base_url, operation, args).
+# One instance can be shared by a client, all of its sessions and a session pool.
+# ttl: seconds an entry stays valid. maxsize: entries kept before the least recently used is dropped.
+
+
+class QubePMPLLookupCache:
+    def __init__(self, ttl: float = 3600.0, maxsize: int = 1024):
+        if ttl <= 0 or maxsize < 1:
+            raise ValueError("ttl must be positive and maxsize at least 1.")
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    # Return the cached value for key, or call load() and cache its result if cacheable(result).
+    # load runs outside the lock, so concurrent misses on the same key may each load once.
+
+    def get_or_load(
+        self,
+        key: tuple,
+        load: Callable[[], object],
+        cacheable: Callable[[object], bool] = lambda value: True,
+    ):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self._expirations += 1
+            self._misses += 1
+        value = load()
+        if cacheable(value):
+            self.set(key, value)
+        return value
+
+    def set(self, key: tuple, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    # Drop cached entries. With no arguments everything is dropped; otherwise only entries for
+    # `operation` (e.g. "get_fund_heading"), optionally only those called with exactly `args`.
+
+    def invalidate(self, operation: str | None = None, args: tuple | None = None) -> int:
+        with self._lock:
+            if operation is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            stale = [
+                key
+                for key in self._entries
+                if key[1] == operation and (args is None or key[2] == args)
+            ]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def stats(self) -> QubePMPLCacheStats:
+        with self._lock:
+            return QubePMPLCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                size=len(self._entries),
+            )
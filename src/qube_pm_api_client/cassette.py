@@ -0,0 +1,332 @@
+import gzip
+import json
+import os
+import re
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from typing import NamedTuple
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from .transport import QubePMPLTransport
+
+##############################################
+# Record / replay transports for offline runs
+##############################################
+
+# Cassette file: gzip-compressed JSON lines. The first line is a header {"version", "scrub"}, then one
+# line per interaction, in the order they were sent. Bodies are stored as (surrogate-escaped) UTF-8 text.
+# Secrets are scrubbed before anything is stored: the text of every element named in `scrub` (the Login
+# <username>, <password> and <group> by default) becomes SCRUBBED, and session keys (<clientsessionkey>,
+# <web:ClientSessionKey>) become SESSION_KEY in requests and responses alike.
+
+CASSETTE_VERSION = 1
+SCRUBBED = "********"
+SESSION_KEY = "recorded-session-key"
+DEFAULT_SCRUB = ("username", "password", "group")
+
+_SESSION_KEY = re.compile(rb"<(clientsessionkey|web:ClientSessionKey)>([^<]*)</\1>")
+
+
+class QubePMPLInteraction(NamedTuple):
+    action: str
+    request: bytes
+    status: int
+    reason: str
+    content_type: str
+    response: bytes
+
+
+# Raised by a strict replay for a request the cassette has no (more) recorded responses for.
+
+
+class QubePMPLCassetteMiss(LookupError):
+    pass
+
+
+def _body(data) -> bytes:
+    return data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+
+def _text(body: bytes) -> str:
+    return body.decode("utf-8", errors="surrogateescape")
+
+
+# Scrubs secrets from request bodies (and the session keys they carry from the matching responses).
+
+
+class QubePMPLScrubber:
+    def __init__(self, elements: Iterable[str] = DEFAULT_SCRUB):
+        self.elements = tuple(elements)
+        self._secret = (
+            re.compile(rb"<(" + b"|".join(re.escape(e.encode()) for e in self.elements) + rb")>[^<]*</\1>")
+            if self.elements
+            else None
+        )
+
+    # Returns the scrubbed request and the session keys it contained.
+
+    def request(self, body: bytes) -> tuple[bytes, list[bytes]]:
+        keys = [match.group(2) for match in _SESSION_KEY.finditer(body)]
+        body = _SESSION_KEY.sub(lambda m: b"<%s>%s</%s>" % (m[1], SESSION_KEY.encode(), m[1]), body)
+        if self._secret is not None:
+            body = self._secret.sub(lambda m: b"<%s>%s</%s>" % (m[1], SCRUBBED.encode(), m[1]), body)
+        return body, keys
+
+    def response(self, body: bytes, keys: list[bytes]) -> bytes:
+        for key in keys:
+            if key:
+                body = body.replace(key, SESSION_KEY.encode())
+        return body
+
+
+# In-memory list of scrubbed interactions, loadable from and savable to a cassette file.
+# Each exchange holds a numbered slot from the moment its request is sent (see start), None until its
+# response has been read; len(), iteration and save() skip those.
+
+
+class QubePMPLCassette:
+    def __init__(self, interactions: Iterable[QubePMPLInteraction] = (), scrub: Iterable[str] = DEFAULT_SCRUB):
+        self.scrubber = QubePMPLScrubber(scrub)
+        self._slots: dict[int, QubePMPLInteraction | None] = dict(enumerate(interactions))
+        self._next = len(self._slots)
+        self._lock = threading.Lock()
+
+    @property
+    def interactions(self) -> list[QubePMPLInteraction]:
+        return list(self)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(interaction is not None for interaction in self._slots.values())
+
+    def __iter__(self) -> Iterator[QubePMPLInteraction]:
+        with self._lock:
+            interactions = [interaction for interaction in self._slots.values() if interaction is not None]
+        return iter(interactions)
+
+    # Scrub a request and take its place in the recording, before it is sent. Returns (finish, discard):
+    # finish takes (status, reason, content_type, response) and stores the exchange once the response has
+    # been read; discard gives the place up, for a request whose send failed.
+
+    def start(
+        self, action: str, request
+    ) -> tuple[Callable[[int, str, str, bytes], QubePMPLInteraction], Callable[[], None]]:
+        body, keys = self.scrubber.request(_body(request))
+        with self._lock:
+            slot = self._next
+            self._next += 1
+            self._slots[slot] = None
+
+        def finish(status: int, reason: str, content_type: str, response: bytes) -> QubePMPLInteraction:
+            interaction = QubePMPLInteraction(
+                action, body, status, reason, content_type, self.scrubber.response(response, keys)
+            )
+            with self._lock:
+                self._slots[slot] = interaction
+            return interaction
+
+        def discard() -> None:
+            with self._lock:
+                self._slots.pop(slot, None)
+
+        return finish, discard
+
+    # Scrub and append one exchange. Returns the stored interaction.
+
+    def record(
+        self, action: str, request, status: int, reason: str, content_type: str, response: bytes
+    ) -> QubePMPLInteraction:
+        finish, _ = self.start(action, request)
+        return finish(status, reason, content_type, response)
+
+    @classmethod
+    def load(cls, path: str) -> "QubePMPLCassette":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')!r} in {path}")
+            interactions = []
+            for line in f:
+                item = json.loads(line)
+                interactions.append(
+                    QubePMPLInteraction(
+                        item["action"],
+                        item["request"].encode("utf-8", errors="surrogateescape"),
+                        item["status"],
+                        item["reason"],
+                        item["content_type"],
+                        item["response"].encode("utf-8", errors="surrogateescape"),
+                    )
+                )
+        return cls(interactions, header.get("scrub", DEFAULT_SCRUB))
+
+    # Written to a temporary file first, so an interrupted save leaves the previous cassette intact.
+
+    def save(self, path: str) -> None:
+        interactions = list(self)
+        temporary = f"{path}.tmp"
+        with gzip.open(temporary, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"version": CASSETTE_VERSION, "scrub": list(self.scrubber.elements)}) + "\n")
+            for interaction in interactions:
+                f.write(
+                    json.dumps(
+                        {
+                            "action": interaction.action,
+                            "request": _text(interaction.request),
+                            "status": interaction.status,
+                            "reason": interaction.reason,
+                            "content_type": interaction.content_type,
+                            "response": _text(interaction.response),
+                        },
+                        separators=(",", ":"),
+                    )
+                    + "\n"
+                )
+        os.replace(temporary, path)
+
+
+# Sends through `transport` (a plain QubePMPLTransport by default) and records every exchange, in the
+# order the requests were sent; a request whose send raises is left out.
+# A stream=True response is left unread: it is recorded as the caller consumes it (iter_content), in its
+# place in sending order. One closed part-way is read to the end first, so the recording is complete.
+# The cassette is written to path by save() and on close(), which also closes the wrapped transport.
+
+
+class QubePMPLRecordingTransport(QubePMPLTransport):
+    def __init__(
+        self, path: str, transport: QubePMPLTransport | None = None, scrub: Iterable[str] = DEFAULT_SCRUB
+    ):
+        self.path = path
+        self.transport = transport if transport is not None else QubePMPLTransport()
+        self.cassette = QubePMPLCassette(scrub=scrub)
+
+    def post(self, url: str, data, headers: dict, stream: bool = False, timeout=None) -> requests.Response:
+        finish, discard = self.cassette.start(headers.get("SOAPAction", ""), data)
+        try:
+            if timeout is None:
+                response = self.transport.post(url, data=data, headers=headers, stream=stream)
+            else:
+                response = self.transport.post(url, data=data, headers=headers, stream=stream, timeout=timeout)
+        except BaseException:
+            discard()
+            raise
+        record = lambda content: finish(
+            response.status_code, response.reason or "", response.headers.get("Content-Type", ""), content
+        )
+        if stream:
+            response.raw = _RecordedStream(response.raw, record)
+        else:
+            record(response.content)
+        return response
+
+    def save(self) -> None:
+        self.cassette.save(self.path)
+
+    def close(self) -> None:
+        self.save()
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Stands in for a streamed response's urllib3 body: passes the decoded chunks iter_content asks for through
+# and hands the whole body to `record` once it has been read.
+
+
+class _RecordedStream:
+    def __init__(self, raw, record: Callable[[bytes], object]):
+        self._raw = raw
+        self._record = record
+        self._chunks: list[bytes] = []
+        self._recorded = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def stream(self, amt: int | None = 2**16, decode_content: bool | None = None) -> Iterator[bytes]:
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish()
+
+    def _finish(self) -> None:
+        if not self._recorded:
+            self._recorded = True
+            self._record(b"".join(self._chunks))
+            self._chunks = []
+
+    # Response.close() on a body not read to the end: read the rest for the recording first.
+
+    def close(self) -> None:
+        try:
+            if not self._recorded:
+                for _ in self.stream(decode_content=True):
+                    pass
+        finally:
+            self._raw.close()
+
+
+# Serves a cassette from memory without any network access.
+# Requests are scrubbed like the recording was and matched on (SOAPAction, scrubbed body); identical
+# requests get the responses recorded for them in order. strict=False serves the next interaction with the
+# same SOAPAction not yet played, in recording order, for a request with no recorded match (e.g. a generated
+# invoice number), so a sequential flow replays even when some request bodies differ from the recording.
+# cassette: a path or a loaded QubePMPLCassette.
+
+
+class QubePMPLReplayTransport(QubePMPLTransport):
+    def __init__(self, cassette: str | QubePMPLCassette, strict: bool = True):
+        self.cassette = cassette if isinstance(cassette, QubePMPLCassette) else QubePMPLCassette.load(cassette)
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._interactions = list(self.cassette)
+        self._played = [False] * len(self._interactions)
+        self._queues: dict[tuple[str, bytes], deque[int]] = {}
+        self._actions: dict[str, deque[int]] = {}
+        for index, interaction in enumerate(self._interactions):
+            self._queues.setdefault((interaction.action, interaction.request), deque()).append(index)
+            self._actions.setdefault(interaction.action, deque()).append(index)
+
+    # Next unplayed index in queue, or None. Indices played through the other queue are dropped.
+
+    def _pop(self, queue: deque[int] | None) -> int | None:
+        while queue:
+            index = queue.popleft()
+            if not self._played[index]:
+                return index
+        return None
+
+    def _take(self, key: tuple[str, bytes]) -> int:
+        with self._lock:
+            index = self._pop(self._queues.get(key))
+            if index is None and not self.strict:
+                index = self._pop(self._actions.get(key[0]))
+            if index is None:
+                raise QubePMPLCassetteMiss(f"No recorded response left for {key[0]}: {_text(key[1])[:200]}")
+            self._played[index] = True
+            return index
+
+    def post(self, url: str, data, headers: dict, stream: bool = False, timeout=None) -> requests.Response:
+        body, _ = self.cassette.scrubber.request(_body(data))
+        interaction = self._interactions[self._take((headers.get("SOAPAction", ""), body))]
+        response = requests.Response()
+        response.status_code = interaction.status
+        response.reason = interaction.reason
+        response.url = url
+        response.headers = CaseInsensitiveDict({"Content-Type": interaction.content_type})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = interaction.response
+        response._content_consumed = True
+        return response
+
+    # Interactions not played yet.
+
+    def remaining(self) -> int:
+        with self._lock:
+            return self._played.count(False)
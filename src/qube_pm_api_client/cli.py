@@ -0,0 +1,418 @@
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from itertools import islice
+from multiprocessing import util
+from .bulk import QubePMPLBulkPoster, QubePMPLBulkSummary
+from .cache import QubePMPLLookupCache
+from .deadline import QubePMPLTimeout
+from .journal import CONFIRMED, DUPLICATE, QubePMPLPostingJournal
+from .lifecycle import QubePMPLLogoutWorker
+from .main import QubePMPLAPIClient, QubePMPLInvoice
+from .pool import QubePMPLSessionPool
+from .routing import QubePMPLRoute, QubePMPLRoutingResolver
+from .transport import QubePMPLPooledTransport
+
+##############################################
+# Command line bulk import
+##############################################
+
+# qube-pm-api-client invoices.csv --workers 4 --sessions 8 > results.jsonl
+#
+# Streams invoices from CSV or JSONL (a file, or stdin with "-") and posts them through pooled sessions.
+# Input is read in batches, so memory use doesn't grow with the file. Each input row needs:
+#   supplier_ref, invoice_number, nett, vat, gross, invoice_date, period_start, period_finish,
+#   prompt_payment_due, payment_due, vat_code, property_ref
+#   and either fund_heading_uid, or fund_type plus heading (the heading description) to look it up.
+# Optional: invoice_link, user_id (defaults to --user-id).
+# One JSON result per row goes to stdout (or --output), in completion order; a live throughput and
+# error summary goes to stderr. Exit status is 1 if any row failed.
+# Connection settings default to the QUBE_URL, QUBE_USERNAME, QUBE_PASSWORD and QUBE_GROUP variables.
+# --journal PATH records every post in a QubePMPLPostingJournal. Rerunning the same input with the same
+# journal after a crash skips rows it has already settled (reported with "skipped": true, and the success
+# and error recorded for them) and posts the rest: new rows and those whose outcome was uncertain.
+# The journal file can be shared by --workers: a row is claimed in it before it is posted, so no two
+# processes post the same row.
+# --duplicate-code CODE: the error code your Qube refuses an invoice it already has with. Such a refusal is
+# then journalled as posted (a retried uncertain post often gets one); without it, it counts as rejected.
+# --connect-timeout / --read-timeout bound each request (0 for no limit); a timed out row fails and its
+# session is replaced. A post that timed out may still have gone through: the journal marks it uncertain.
+# With --workers, results are written as each batch finishes. If a worker process dies, every row of the
+# batches it took down is reported as failed; some may have been posted, so rerun with --journal to settle them.
+
+REQUIRED_FIELDS = (
+    "supplier_ref",
+    "invoice_number",
+    "nett",
+    "vat",
+    "gross",
+    "invoice_date",
+    "period_start",
+    "period_finish",
+    "prompt_payment_due",
+    "payment_due",
+    "vat_code",
+    "property_ref",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class _Settings:
+    url: str
+    username: str
+    password: str
+    group: str
+    sessions: int
+    user_id: str
+    journal: str = ""
+    duplicate_codes: tuple[str, ...] = ()
+    connect_timeout: float | None = None
+    read_timeout: float | None = None
+
+
+# Input
+
+
+def read_rows(stream: io.TextIOBase, format: str) -> Iterator[tuple[int, dict]]:
+    if format == "csv":
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row
+        return
+    for line, text in enumerate(stream, start=1):
+        if text.strip():
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                row = {"_error": f"Invalid JSON: {e}"}
+            yield line, row if isinstance(row, dict) else {"_error": "Expected a JSON object"}
+
+
+def _invoice(row: dict) -> QubePMPLInvoice:
+    if "_error" in row:
+        raise ValueError(row["_error"])
+    missing = [name for name in REQUIRED_FIELDS if not str(row.get(name) or "").strip()]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    return QubePMPLInvoice(
+        supplier_ref=str(row["supplier_ref"]),
+        invoice_number=str(row["invoice_number"]),
+        nett=float(row["nett"]),
+        vat=float(row["vat"]),
+        gross=float(row["gross"]),
+        invoice_date=str(row["invoice_date"]),
+        period_start=str(row["period_start"]),
+        period_finish=str(row["period_finish"]),
+        prompt_payment_due=str(row["prompt_payment_due"]),
+        payment_due=str(row["payment_due"]),
+        vat_code=str(row["vat_code"]),
+        invoice_link=str(row.get("invoice_link") or ""),
+    )
+
+
+def _result(
+    line: int,
+    row: dict,
+    success: bool,
+    error_code: str = "",
+    error_message: str = "",
+    elapsed: float = 0.0,
+    skipped: bool = False,
+) -> dict:
+    return {
+        "line": line,
+        "supplier_ref": row.get("supplier_ref", ""),
+        "invoice_number": row.get("invoice_number", ""),
+        "success": success,
+        "error_code": error_code,
+        "error_message": error_message,
+        "elapsed": round(elapsed, 6),
+        "skipped": skipped,
+    }
+
+
+# Posting. One importer per process: a client with a lookup cache, a session pool, a routing resolver
+# (which looks each property and (property, fund type) up once, concurrently per batch) and a bulk poster.
+
+
+class _Importer:
+    def __init__(self, settings: _Settings):
+        self.settings = settings
+        self.transport = QubePMPLPooledTransport(max_connections_per_host=settings.sessions)
+        self.logout_worker = QubePMPLLogoutWorker()
+        self.client = QubePMPLAPIClient(
+            settings.url,
+            settings.username,
+            settings.password,
+            settings.group,
+            transport=self.transport,
+            cache=QubePMPLLookupCache(),
+            auto_close_report=True,
+            logout_worker=self.logout_worker,
+            timeout=QubePMPLTimeout(settings.connect_timeout, settings.read_timeout),
+        )
+        self.pool = QubePMPLSessionPool(self.client, size=settings.sessions, warm=False)
+        self.resolver = QubePMPLRoutingResolver(self.pool)
+        self.journal = (
+            QubePMPLPostingJournal(settings.journal, duplicate_codes=settings.duplicate_codes)
+            if settings.journal
+            else None
+        )
+        self.poster = QubePMPLBulkPoster(self.pool, journal=self.journal)
+
+    def close(self) -> None:
+        self.pool.close()
+        self.logout_worker.close()
+        self.transport.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    # Post a batch of (line, row) pairs, yielding one result dict per row as it completes.
+    # Rows the journal shows as settled are skipped before any lookups are made for them.
+
+    def post(self, rows: list[tuple[int, dict]]) -> Iterator[dict]:
+        routes = []
+        routed_lines = []
+        for line, row in rows:
+            try:
+                invoice = _invoice(row)
+            except Exception as e:
+                yield _result(line, row, False, "", str(e))
+                continue
+            if self.journal is not None and not self.journal.needs_post(invoice.supplier_ref, invoice.invoice_number):
+                entry = self.journal.get(invoice.supplier_ref, invoice.invoice_number)
+                posted = entry.state in (CONFIRMED, DUPLICATE)
+                yield _result(line, row, posted, entry.error_code, entry.error_message, skipped=True)
+                continue
+            routes.append(
+                QubePMPLRoute(
+                    invoice,
+                    str(row.get("user_id") or self.settings.user_id),
+                    property_ref=str(row["property_ref"]).strip(),
+                    fund_type=str(row.get("fund_type") or "").strip(),
+                    heading=str(row.get("heading") or "").strip(),
+                    fund_heading_uid=str(row.get("fund_heading_uid") or "").strip(),
+                )
+            )
+            routed_lines.append((line, row))
+        jobs = []
+        lines = []
+        for routed in self.resolver.resolve(routes):
+            line, row = routed_lines[routed.index]
+            if routed.job is None:
+                yield _result(line, row, False, routed.error_code, routed.error_message)
+                continue
+            jobs.append(routed.job)
+            lines.append((line, row))
+        for result in self.poster.post(jobs):
+            line, row = lines[result.index]
+            yield _result(
+                line, row, result.success, result.error_code, result.error_message, result.elapsed, result.skipped
+            )
+
+
+_importer: _Importer | None = None
+
+
+def _init_worker(settings: _Settings) -> None:
+    global _importer
+    _importer = _Importer(settings)
+    # Worker processes skip atexit handlers; log the pool's sessions out from multiprocessing's exit hook.
+    util.Finalize(None, _importer.close, exitpriority=10)
+
+
+def _post_batch(rows: list[tuple[int, dict]]) -> list[dict]:
+    return list(_importer.post(rows))
+
+
+# Workers are started fresh rather than forked: the parent has threads running (the logout worker, the
+# transport's pools), and forking a threaded process can deadlock the child.
+
+
+def _worker_context() -> multiprocessing.context.BaseContext:
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def _batches(rows: Iterable[tuple[int, dict]], size: int) -> Iterator[list[tuple[int, dict]]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+# Results: written per row, tallied for the live summary.
+
+
+class _Reporter:
+    def __init__(self, output: io.TextIOBase, progress: io.TextIOBase, interval: float):
+        self.output = output
+        self.progress = progress
+        self.interval = interval
+        self.summary = QubePMPLBulkSummary()
+        self._live = progress.isatty()
+        self._last = 0.0
+
+    def add(self, result: dict) -> None:
+        self.output.write(json.dumps(result) + "\n")
+        if result["skipped"]:
+            self.summary.skipped += 1
+        elif result["success"]:
+            self.summary.succeeded += 1
+        else:
+            self.summary.failed += 1
+        self.summary.submitted += 1
+        now = time.monotonic()
+        if self.interval and now - self._last >= self.interval:
+            self._last = now
+            self.output.flush()
+            self._print(final=False)
+
+    def _print(self, final: bool) -> None:
+        s = self.summary
+        line = (
+            f"{s.completed} rows  {s.succeeded} posted  {s.skipped} skipped  {s.failed} failed  "
+            f"{s.per_second:.1f}/s  {s.elapsed:.1f}s"
+        )
+        if self._live and not final:
+            self.progress.write("\r" + line)
+        else:
+            self.progress.write(("\r" if self._live else "") + line + "\n")
+        self.progress.flush()
+
+    def finish(self) -> None:
+        self.summary.finished_at = time.monotonic()
+        self.output.flush()
+        self._print(final=True)
+
+
+def run(
+    rows: Iterable[tuple[int, dict]],
+    settings: _Settings,
+    reporter: _Reporter,
+    workers: int = 1,
+    batch_size: int = 200,
+) -> QubePMPLBulkSummary:
+    if workers <= 1:
+        importer = _Importer(settings)
+        try:
+            for batch in _batches(rows, batch_size):
+                for result in importer.post(batch):
+                    reporter.add(result)
+        finally:
+            importer.close()
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=_worker_context(), initializer=_init_worker, initargs=(settings,)
+        )
+        with executor:
+            batches = _batches(rows, batch_size)
+            pending: dict[Future, list[tuple[int, dict]]] = {}
+            exhausted = False
+            while True:
+                # Keep two batches per worker queued, reading input only as fast as it is posted.
+                while not exhausted and len(pending) < 2 * workers:
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    try:
+                        future = executor.submit(_post_batch, batch)
+                    except BrokenProcessPool as e:
+                        future = Future()
+                        future.set_exception(e)
+                    pending[future] = batch
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # A failed batch (a worker that died, a row that wouldn't pickle) fails its own rows only.
+                        message = f"Worker failed: {type(e).__name__}: {e}"
+                        results = [_result(line, row, False, "", message) for line, row in batch]
+                    for result in results:
+                        reporter.add(result)
+    reporter.finish()
+    return reporter.summary
+
+
+def _format(path: str, format: str | None) -> str:
+    if format:
+        return format
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="qube-pm-api-client", description="Post invoices to Qube PM Purchase Ledger from CSV or JSONL."
+    )
+    parser.add_argument("input", nargs="?", default="-", help="CSV or JSONL file, or - for stdin")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from the file name, csv for stdin)")
+    parser.add_argument("--output", help="write per-row JSON results here instead of stdout")
+    parser.add_argument("--url", default=os.getenv("QUBE_URL"))
+    parser.add_argument("--username", default=os.getenv("QUBE_USERNAME"))
+    parser.add_argument("--password", default=os.getenv("QUBE_PASSWORD"))
+    parser.add_argument("--group", default=os.getenv("QUBE_GROUP"))
+    parser.add_argument("--user-id", default=os.getenv("QUBE_USER_ID", ""), help="user-id for rows without one")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions per worker process")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--batch-size", type=int, default=200, help="rows handed to a worker at a time")
+    parser.add_argument("--journal", help="posting journal file; rows it shows as posted are skipped")
+    parser.add_argument(
+        "--duplicate-code",
+        action="append",
+        default=[],
+        help="error code Qube returns for an invoice it already has; journalled as posted (repeatable)",
+    )
+    parser.add_argument("--connect-timeout", type=float, default=10.0, help="seconds to connect, 0 for no limit")
+    parser.add_argument("--read-timeout", type=float, default=120.0, help="seconds to wait for a response, 0 for no limit")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="seconds between summary updates, 0 for none")
+    args = parser.parse_args(argv)
+
+    missing = [name for name in ("url", "username", "password", "group") if not getattr(args, name)]
+    if missing:
+        parser.error(f"missing connection settings: {', '.join('--' + name for name in missing)}")
+    if args.sessions < 1 or args.workers < 1 or args.batch_size < 1:
+        parser.error("--sessions, --workers and --batch-size must be at least 1")
+
+    settings = _Settings(
+        args.url,
+        args.username,
+        args.password,
+        args.group,
+        args.sessions,
+        args.user_id,
+        args.journal or "",
+        tuple(args.duplicate_code),
+        args.connect_timeout or None,
+        args.read_timeout or None,
+    )
+    if args.input == "-":
+        source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    else:
+        source = open(args.input, encoding="utf-8-sig", newline="")
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        reporter = _Reporter(output, sys.stderr, args.progress_interval)
+        summary = run(
+            read_rows(source, _format(args.input, args.format)),
+            settings,
+            reporter,
+            workers=args.workers,
+            batch_size=args.batch_size,
+        )
+    finally:
+        source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 1 if summary.failed else 0
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+##############################################
+# Single-flight coalescing of identical lookups
+##############################################
+
+# Snapshot of coalescer counters.
+# calls: lookups that went through the coalescer. coalesced: those that joined a call already in flight
+# instead of sending their own. in_flight: calls currently running.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLCoalescerStats:
+    calls: int
+    coalesced: int
+    in_flight: int
+
+    @property
+    def coalesced_ratio(self) -> float:
+        return self.coalesced / self.calls if self.calls else 0.0
+
+
+# Shares one in-flight call between concurrent identical lookups, keyed by (base_url, operation, args).
+# The first caller runs the lookup; callers arriving before it finishes wait for it and get the same
+# result (or exception). Nothing is kept once the call completes; pair with a QubePMPLLookupCache for that.
+# One instance can be shared by a client and all of its sessions, sync (threads, via call) and async
+# (via acall; calls are shared within one event loop). Cancelling an async caller doesn't cancel the
+# shared call for the others.
+# A coalesced caller sends no request, so its own session opens no report.
+
+
+class QubePMPLCoalescer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, Future] = {}
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        self._count = 0
+        self._coalesced = 0
+
+    def call(self, key: tuple, load: Callable[[], object]):
+        with self._lock:
+            self._count += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self._coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = load()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def acall(self, key: tuple, load: Callable[[], Awaitable]):
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            self._count += 1
+            task = self._tasks.get(loop_key)
+            if task is None:
+                task = self._tasks[loop_key] = asyncio.ensure_future(load())
+                task.add_done_callback(lambda _: self._forget(loop_key))
+            else:
+                self._coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, loop_key: tuple) -> None:
+        with self._lock:
+            self._tasks.pop(loop_key, None)
+
+    def stats(self) -> QubePMPLCoalescerStats:
+        with self._lock:
+            return QubePMPLCoalescerStats(
+                calls=self._count,
+                coalesced=self._coalesced,
+                in_flight=len(self._calls) + len(self._tasks),
+            )
@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple
+import requests
+
+##############################################
+# Timeouts and deadlines for SOAP calls
+##############################################
+
+# Connect and read timeouts in seconds, None for no limit. read bounds each wait for response data
+# (so the wait for Qube to start answering), not the whole transfer.
+# Set per client (sessions inherit it) with timeout=QubePMPLTimeout(...); override it for the calls made
+# in a block with call_timeout(), or for one make_request with its timeout argument.
+
+
+class QubePMPLTimeout(NamedTuple):
+    connect: float | None = None
+    read: float | None = None
+
+
+# Raised by make_request instead of sending once the deadline in force has passed or been cancelled.
+
+
+class QubePMPLDeadlineExceeded(TimeoutError):
+    pass
+
+
+# Exceptions that mean a call timed out: the request may or may not have been processed by Qube.
+
+TIMEOUT_ERRORS = (requests.Timeout, TimeoutError)
+
+# Deadlines entered in this context, outermost first.
+
+_DEADLINES: ContextVar[tuple["QubePMPLDeadline", ...]] = ContextVar("qube_deadlines", default=())
+_TIMEOUT: ContextVar[QubePMPLTimeout | None] = ContextVar("qube_call_timeout", default=None)
+
+
+# Time budget for a whole multi-step operation (login, lookups, post, close_report).
+# While entered (with deadline:), every make_request in this thread or asyncio task (and tasks it
+# creates) has its timeouts capped at the time left, and raises QubePMPLDeadlineExceeded without
+# sending once none is left or cancel() was called, from any thread. Pool leases wait no longer than
+# the time left either. Nested deadlines can only shorten the one they are entered in.
+# The worker threads of QubePMPLBulkPoster, QubePMPLShardedLookup, QubePMPLRoutingResolver and
+# QubePMPLHedgedLookup run each call in a copy of the caller's context, so the deadline (and call_timeout())
+# in force where they are called bounds the calls they send. Threads of your own don't inherit it: enter
+# the deadline (or another one) in the thread's own code. One deadline can be entered in several threads
+# or tasks at once; each sees the deadlines it is nested in there, as the enclosing ones are kept in the
+# context rather than on the deadline.
+# seconds: None for no time limit, only cancellation.
+
+
+class QubePMPLDeadline:
+    def __init__(self, seconds: float | None = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    # This deadline and those it is entered in, in the calling thread or task.
+
+    def _chain(self) -> tuple["QubePMPLDeadline", ...]:
+        stack = _DEADLINES.get()
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index] is self:
+                return stack[: index + 1]
+        return (self,)
+
+    @property
+    def cancelled(self) -> bool:
+        return any(deadline._cancelled.is_set() for deadline in self._chain())
+
+    # Seconds left, None if unbounded. Never negative.
+
+    def remaining(self) -> float | None:
+        expires_at = [deadline.expires_at for deadline in self._chain() if deadline.expires_at is not None]
+        return max(min(expires_at) - time.monotonic(), 0.0) if expires_at else None
+
+    @property
+    def expired(self) -> bool:
+        return self.cancelled or self.remaining() == 0.0
+
+    # Raise QubePMPLDeadlineExceeded if cancelled or out of time, else return the seconds left.
+
+    def check(self) -> float | None:
+        if self.cancelled:
+            raise QubePMPLDeadlineExceeded("Operation cancelled.")
+        remaining = self.remaining()
+        if remaining == 0.0:
+            raise QubePMPLDeadlineExceeded("Operation deadline exceeded.")
+        return remaining
+
+    def __enter__(self):
+        _DEADLINES.set(_DEADLINES.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self in _DEADLINES.get():
+            _DEADLINES.set(self._chain()[:-1])
+
+
+def current_deadline() -> QubePMPLDeadline | None:
+    stack = _DEADLINES.get()
+    return stack[-1] if stack else None
+
+
+# Override the client's timeouts for the calls made in the block.
+
+
+@contextmanager
+def call_timeout(connect: float | None = None, read: float | None = None):
+    token = _TIMEOUT.set(QubePMPLTimeout(connect, read))
+    try:
+        yield
+    finally:
+        _TIMEOUT.reset(token)
+
+
+def _cap(timeout: float | None, remaining: float | None) -> float | None:
+    if remaining is None:
+        return timeout
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+# The (connect, read) timeouts for a request about to be sent, or None for no limit at all.
+# Precedence: explicit timeout, then call_timeout(), then the client default; all capped by the deadline.
+# Raises QubePMPLDeadlineExceeded if the deadline has passed.
+
+
+def request_timeout(
+    default: QubePMPLTimeout | None, timeout: QubePMPLTimeout | None = None
+) -> QubePMPLTimeout | None:
+    if timeout is None:
+        timeout = _TIMEOUT.get()
+    if timeout is None:
+        timeout = default
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    remaining = deadline.check()
+    if timeout is None and remaining is None:
+        return None
+    connect, read = timeout if timeout is not None else (None, None)
+    return QubePMPLTimeout(_cap(connect, remaining), _cap(read, remaining))
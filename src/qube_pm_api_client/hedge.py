@@ -0,0 +1,194 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import requests
+from .deadline import TIMEOUT_ERRORS
+from .main import unshared_lookups
+from .pool import QubePMPLSessionPool, QubePMPLSessionPoolTimeout
+
+##############################################
+# Hedged lookups across pooled sessions
+##############################################
+
+# Session methods that only read data, and so may be sent twice. post_invoice / post_journal never are.
+
+HEDGEABLE = frozenset(
+    {
+        "get_users",
+        "get_properties",
+        "get_fund",
+        "get_fund_heading",
+        "lookup_users",
+        "lookup_properties",
+        "lookup_funds",
+        "lookup_fund_headings",
+    }
+)
+
+
+# Snapshot of hedging counters.
+# hedged: calls that sent a second request. hedge_wins: those the second request answered first.
+# skipped: calls that were due a hedge but found no free pooled session for it.
+# delay: current wait before hedging, in seconds.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLHedgeStats:
+    calls: int
+    hedged: int
+    hedge_wins: int
+    skipped: int
+    delay: float
+
+
+# Sends a lookup on a session leased from the pool and, if it hasn't answered within the current delay,
+# the same lookup on a second pooled session. The first successful response wins (an HTTP 200 for get_*,
+# success="true" for lookup_*); if neither succeeds the primary's result is returned, or its exception raised.
+# The hedge skips the sessions' lookup cache and coalescer (see unshared_lookups), so it always sends a
+# request of its own rather than waiting on the stalled primary's. The losing request can't be aborted mid-flight: it runs to completion
+# in the background and its session goes back to the pool, which closes the report it opened.
+# The delay is the `percentile` of the last `window` lookup latencies (initial_delay until min_samples
+# have been seen), so about (100 - percentile)% of calls are hedged as the server speeds up or slows down.
+# A hedge is only sent if a pooled session is free (or can be logged in) at once; it never waits for one.
+# The caller's QubePMPLDeadline / call_timeout apply to both requests.
+# Close the hedger (or use it as a context manager) to wait for requests still running.
+
+
+def _succeeded(result) -> bool:
+    if isinstance(result, requests.Response):
+        return result.ok
+    return result.success
+
+
+class QubePMPLHedgedLookup:
+    def __init__(
+        self,
+        pool: QubePMPLSessionPool,
+        percentile: float = 95.0,
+        window: int = 200,
+        min_samples: int = 20,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.005,
+    ):
+        if not 0.0 < percentile < 100.0:
+            raise ValueError("percentile must be between 0 and 100.")
+        if window < 1 or not 1 <= min_samples <= window:
+            raise ValueError("window must be at least 1, and min_samples between 1 and window.")
+        self.pool = pool
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self._executor = ThreadPoolExecutor(max_workers=2 * pool.size)
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._calls = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._skipped = 0
+
+    @property
+    def delay(self) -> float:
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self._latencies)
+        index = round(self.percentile / 100.0 * (len(latencies) - 1))
+        return max(latencies[index], self.min_delay)
+
+    # Runs on the executor. The outcome is handed over before the session goes back to the pool
+    # (closing its report), so the caller doesn't wait for the CloseReport.
+
+    def _attempt(self, future: Future, session, method: str, args: tuple, kwargs: dict, hedge: bool) -> None:
+        start = time.monotonic()
+        discard = False
+        try:
+            if hedge:
+                with unshared_lookups():
+                    result = getattr(session, method)(*args, **kwargs)
+            else:
+                result = getattr(session, method)(*args, **kwargs)
+        except BaseException as e:
+            discard = isinstance(e, TIMEOUT_ERRORS)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+            future.set_result(result)
+        finally:
+            self.pool.release(session, discard=discard)
+
+    def _submit(self, session, method: str, args: tuple, kwargs: dict, hedge: bool = False) -> Future:
+        future = Future()
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._attempt, future, session, method, args, kwargs, hedge)
+        return future
+
+    # Call session.<method>(*args, **kwargs), hedged. method must be one of HEDGEABLE.
+
+    def call(self, method: str, *args, **kwargs):
+        if method not in HEDGEABLE:
+            raise ValueError(f"{method} is not an idempotent lookup and can't be hedged.")
+        delay = self.delay
+        with self._lock:
+            self._calls += 1
+        primary = self._submit(self.pool.acquire(), method, args, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        try:
+            session = self.pool.acquire(timeout=0)
+        except QubePMPLSessionPoolTimeout:
+            with self._lock:
+                self._skipped += 1
+            return primary.result()
+        with self._lock:
+            self._hedged += 1
+        hedge = self._submit(session, method, args, kwargs, hedge=True)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and _succeeded(future.result()):
+                    if future is hedge:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return future.result()
+        return primary.result()
+
+    def lookup_users(self, ref: str = "?", exact: bool = False):
+        return self.call("lookup_users", ref, exact)
+
+    def lookup_properties(self, ref: str = "?", exact: bool = False):
+        return self.call("lookup_properties", ref, exact)
+
+    def lookup_funds(
+        self, property_ref: str = "", fund_uid: str = "", owner_ref: str = "", description: str = ""
+    ):
+        return self.call("lookup_funds", property_ref, fund_uid, owner_ref, description)
+
+    def lookup_fund_headings(self, property_ref: str, fund_type: str):
+        return self.call("lookup_fund_headings", property_ref, fund_type)
+
+    def stats(self) -> QubePMPLHedgeStats:
+        delay = self.delay
+        with self._lock:
+            return QubePMPLHedgeStats(
+                calls=self._calls,
+                hedged=self._hedged,
+                hedge_wins=self._hedge_wins,
+                skipped=self._skipped,
+                delay=delay,
+            )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
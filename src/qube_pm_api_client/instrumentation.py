@@ -0,0 +1,300 @@
+import math
+import threading
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+
+##############################################
+# Per-call instrumentation for make_request
+##############################################
+
+# Hooks registered on a QubePMPLInstrumentation see every make_request of the clients and sessions
+# it is passed to (sessions from get_session, and so a session pool, share their client's).
+# Pre hooks run before the request is sent, post hooks after the response headers arrive or the
+# transport raises. Both receive the same QubePMPLCall.
+# With no hooks registered make_request skips all of this and calls the transport directly.
+
+# Everything recorded about one make_request call. Durations are seconds, sizes bytes.
+# operation: the QubeProcessName for QubeProcess-1ia calls, otherwise the last part of the SOAPAction.
+# connect / send / wait: time opening a connection (0.0 when a keep-alive one was reused), writing the
+# request, and waiting for the response headers. None when the transport can't tell: the default
+# transport only reports wait, taken from requests' Response.elapsed.
+# response_bytes: None for stream=True responses without a Content-Length.
+# error: the exception raised by the transport, if any.
+
+
+class QubePMPLCall:
+    __slots__ = (
+        "soap_action",
+        "process_name",
+        "request_bytes",
+        "response_bytes",
+        "status_code",
+        "connect",
+        "send",
+        "wait",
+        "duration",
+        "error",
+        "started_at",
+    )
+
+    def __init__(self, soap_action: str, process_name: str, request_bytes: int):
+        self.soap_action = soap_action
+        self.process_name = process_name
+        self.request_bytes = request_bytes
+        self.response_bytes: int | None = None
+        self.status_code: int | None = None
+        self.connect: float | None = None
+        self.send: float | None = None
+        self.wait: float | None = None
+        self.duration: float | None = None
+        self.error: BaseException | None = None
+        self.started_at = time.time()
+
+    @property
+    def operation(self) -> str:
+        return self.process_name or self.soap_action.rsplit("/", 1)[-1]
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        setattr(self, phase, (getattr(self, phase) or 0.0) + seconds)
+
+    def __repr__(self) -> str:
+        return (
+            f"QubePMPLCall({self.operation}, status={self.status_code}, duration={self.duration}, "
+            f"request_bytes={self.request_bytes}, response_bytes={self.response_bytes})"
+        )
+
+
+# The call in flight on this thread / asyncio task, for transports to record phases on.
+
+_CURRENT_CALL: ContextVar[QubePMPLCall | None] = ContextVar("qube_current_call", default=None)
+
+
+def current_call() -> QubePMPLCall | None:
+    return _CURRENT_CALL.get()
+
+
+_PROCESS_OPEN = "<web:QubeProcessName>"
+_PROCESS_CLOSE = "</web:QubeProcessName>"
+
+
+def process_name(body: str | bytes) -> str:
+    if isinstance(body, bytes):
+        start = body.find(_PROCESS_OPEN.encode())
+        if start < 0:
+            return ""
+        start += len(_PROCESS_OPEN)
+        return body[start : body.find(_PROCESS_CLOSE.encode(), start)].decode("utf-8").strip()
+    start = body.find(_PROCESS_OPEN)
+    if start < 0:
+        return ""
+    start += len(_PROCESS_OPEN)
+    return body[start : body.find(_PROCESS_CLOSE, start)].strip()
+
+
+def _response_bytes(response, stream: bool) -> int | None:
+    if not stream:
+        return len(response.content)
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+# Hook registry. Hooks are kept in tuples that are replaced on change, so registering or
+# removing a hook never blocks calls in flight.
+
+
+class QubePMPLInstrumentation:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pre_hooks: tuple[Callable[[QubePMPLCall], object], ...] = ()
+        self.post_hooks: tuple[Callable[[QubePMPLCall], object], ...] = ()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.pre_hooks or self.post_hooks)
+
+    def add_pre_hook(self, hook: Callable[[QubePMPLCall], object]) -> None:
+        with self._lock:
+            self.pre_hooks = self.pre_hooks + (hook,)
+
+    def add_post_hook(self, hook: Callable[[QubePMPLCall], object]) -> None:
+        with self._lock:
+            self.post_hooks = self.post_hooks + (hook,)
+
+    def remove_hook(self, hook: Callable[[QubePMPLCall], object]) -> None:
+        with self._lock:
+            self.pre_hooks = tuple(h for h in self.pre_hooks if h is not hook)
+            self.post_hooks = tuple(h for h in self.post_hooks if h is not hook)
+
+    def _start(self, soap_action: str, body: str | bytes) -> QubePMPLCall:
+        size = len(body.encode("utf-8")) if isinstance(body, str) else len(body)
+        call = QubePMPLCall(soap_action, process_name(body), size)
+        for hook in self.pre_hooks:
+            hook(call)
+        return call
+
+    def _finish(self, call: QubePMPLCall, response, stream: bool) -> None:
+        if response is not None:
+            call.status_code = response.status_code
+            call.response_bytes = _response_bytes(response, stream)
+            elapsed = getattr(response, "elapsed", None)
+            if call.wait is None and elapsed is not None:
+                call.wait = elapsed.total_seconds()
+        for hook in self.post_hooks:
+            hook(call)
+
+    # Run send() as an instrumented call.
+
+    def call(self, soap_action: str, body: str | bytes, send: Callable[[], object], stream: bool = False):
+        call = self._start(soap_action, body)
+        token = _CURRENT_CALL.set(call)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = send()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.duration = time.perf_counter() - start
+            _CURRENT_CALL.reset(token)
+            self._finish(call, response, stream)
+        return response
+
+    async def acall(self, soap_action: str, body: str | bytes, send: Callable[[], object]):
+        call = self._start(soap_action, body)
+        token = _CURRENT_CALL.set(call)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await send()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.duration = time.perf_counter() - start
+            _CURRENT_CALL.reset(token)
+            self._finish(call, response, False)
+        return response
+
+
+# Log-bucketed histogram. Values are counted in buckets growing by `growth` from `lowest`,
+# so percentiles are accurate to within one bucket (about 9% with the default growth) in O(1) memory
+# per distinct bucket. Values at or below `lowest` share the first bucket.
+
+
+class QubePMPLHistogram:
+    __slots__ = ("lowest", "_log_growth", "_buckets", "count", "total", "min", "max")
+
+    def __init__(self, lowest: float = 1e-6, growth: float = 2 ** 0.125):
+        if lowest <= 0 or growth <= 1:
+            raise ValueError("lowest must be positive and growth greater than 1.")
+        self.lowest = lowest
+        self._log_growth = math.log(growth)
+        self._buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        index = 0 if value <= self.lowest else math.ceil(math.log(value / self.lowest) / self._log_growth)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    # Upper bound of the bucket holding the q-th percentile (0-100), clamped to the observed range.
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                bound = self.lowest * math.exp(index * self._log_growth)
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else 0.0,
+        }
+
+
+_TIMINGS = ("duration", "connect", "send", "wait")
+_SIZES = ("request_bytes", "response_bytes")
+
+
+# Built-in post hook: per-operation histograms of duration, connect, send and wait (seconds) and
+# request / response size (bytes), plus counts by HTTP status and of transport errors.
+#   collector = QubePMPLMetricsCollector()
+#   instrumentation.add_post_hook(collector)
+#   collector.summary()["PUR:Invoice.ws"]["duration"]["p99"]
+
+
+class QubePMPLMetricsCollector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[str, dict[str, QubePMPLHistogram]] = {}
+        self._statuses: dict[str, dict[int, int]] = {}
+        self._errors: dict[str, int] = {}
+
+    def __call__(self, call: QubePMPLCall) -> None:
+        operation = call.operation
+        with self._lock:
+            metrics = self._metrics.get(operation)
+            if metrics is None:
+                metrics = self._metrics[operation] = {
+                    **{name: QubePMPLHistogram() for name in _TIMINGS},
+                    **{name: QubePMPLHistogram(lowest=1.0) for name in _SIZES},
+                }
+            for name in _TIMINGS + _SIZES:
+                value = getattr(call, name)
+                if value is not None:
+                    metrics[name].add(value)
+            if call.error is not None:
+                self._errors[operation] = self._errors.get(operation, 0) + 1
+            if call.status_code is not None:
+                statuses = self._statuses.setdefault(operation, {})
+                statuses[call.status_code] = statuses.get(call.status_code, 0) + 1
+
+    def operations(self) -> list[str]:
+        with self._lock:
+            return sorted(self._metrics)
+
+    def histogram(self, operation: str, metric: str) -> QubePMPLHistogram | None:
+        with self._lock:
+            return self._metrics.get(operation, {}).get(metric)
+
+    def summary(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                operation: {
+                    **{name: histogram.summary() for name, histogram in metrics.items()},
+                    "statuses": dict(self._statuses.get(operation, {})),
+                    "errors": self._errors.get(operation, 0),
+                }
+                for operation, metrics in self._metrics.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+            self._statuses.clear()
+            self._errors.clear()
@@ -0,0 +1,229 @@
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from typing import NamedTuple
+from .results import REPORT_OPEN_ERROR_CODES, QubePMPLStatus
+
+##############################################
+# Durable posting journal (SQLite)
+##############################################
+
+# Append-only local record of invoice postings, keyed by (supplier_ref, invoice_number), so a bulk run
+# that dies halfway can be restarted without re-posting invoices Qube already accepted.
+# Every post writes a "pending" entry before the request is sent, then one entry with its outcome:
+#   confirmed: Qube returned <success>true</success>.
+#   duplicate: Qube refused it with one of duplicate_codes: it already has the invoice, e.g. from an
+#              earlier attempt whose outcome was uncertain. None by default: pass the code your Qube
+#              returns for a duplicate invoice, as any other refusal taken for one is never retried.
+#   refused:   Qube turned the call away with one of refusal_codes (its report was still open) without
+#              running it, so nothing was posted.
+#   rejected:  Qube refused it with any other <status error-code>, so nothing was posted.
+#   uncertain: the call failed or the response couldn't be read; it may or may not have been posted.
+# The latest entry for a key is its state. A key still "pending" after a crash is as uncertain as one
+# recorded "uncertain". needs_post() is True only for invoices never journalled, refused and uncertain
+# ones, so a restarted run retries those and skips the rest; a rejected invoice has to be fixed and posted
+# again by hand.
+# record_intent() claims the key: it records nothing, and returns None, for an invoice that doesn't need
+# posting or that another post holds a claim on, so a key repeated within a run, or in runs sharing the
+# journal, is sent once. Claims are kept in the file with the journal instance that took them, and last
+# until that instance records the outcome or, if it never does (the process died), for claim_timeout
+# seconds. A key left pending by a crash is therefore retried once its claim has expired; keep
+# claim_timeout above the longest a post can take.
+# Entries are never updated or deleted. Lookups and appends go through one (supplier_ref, invoice_number,
+# seq) index, so both stay O(log n) with millions of entries.
+# synchronous: SQLite's synchronous setting. NORMAL (the default) survives a crash of the process;
+# FULL also survives power loss, at the cost of an fsync per entry.
+# Several processes can share one journal file (WAL mode, waiting up to `timeout` seconds for a lock).
+
+PENDING = "pending"
+CONFIRMED = "confirmed"
+DUPLICATE = "duplicate"
+REFUSED = "refused"
+REJECTED = "rejected"
+UNCERTAIN = "uncertain"
+
+# States whose key may (still) need posting.
+
+_RETRYABLE = (PENDING, REFUSED, UNCERTAIN)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY,
+    supplier_ref TEXT NOT NULL,
+    invoice_number TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error_code TEXT NOT NULL,
+    error_message TEXT NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_key ON entries (supplier_ref, invoice_number, seq);
+CREATE TABLE IF NOT EXISTS claims (
+    supplier_ref TEXT NOT NULL,
+    invoice_number TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (supplier_ref, invoice_number)
+);
+"""
+
+_COLUMNS = "supplier_ref, invoice_number, state, error_code, error_message, recorded_at"
+
+
+class QubePMPLJournalEntry(NamedTuple):
+    supplier_ref: str
+    invoice_number: str
+    state: str
+    error_code: str
+    error_message: str
+    recorded_at: float
+
+
+class QubePMPLPostingJournal:
+    def __init__(
+        self,
+        path: str,
+        synchronous: str = "NORMAL",
+        timeout: float = 30.0,
+        duplicate_codes: tuple[str, ...] = (),
+        refusal_codes: tuple[str, ...] = REPORT_OPEN_ERROR_CODES,
+        claim_timeout: float = 300.0,
+    ):
+        self.path = path
+        self.duplicate_codes = tuple(duplicate_codes)
+        self.refusal_codes = tuple(refusal_codes)
+        self.claim_timeout = claim_timeout
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Reading
+
+    def get(self, supplier_ref: str, invoice_number: str) -> QubePMPLJournalEntry | None:
+        with self._lock:
+            return self._latest(supplier_ref, invoice_number)
+
+    def _latest(self, supplier_ref: str, invoice_number: str) -> QubePMPLJournalEntry | None:
+        row = self._db.execute(
+            f"SELECT {_COLUMNS} FROM entries WHERE supplier_ref = ? AND invoice_number = ? "
+            "ORDER BY seq DESC LIMIT 1",
+            (supplier_ref, invoice_number),
+        ).fetchone()
+        return QubePMPLJournalEntry(*row) if row else None
+
+    def state(self, supplier_ref: str, invoice_number: str) -> str | None:
+        entry = self.get(supplier_ref, invoice_number)
+        return entry.state if entry is not None else None
+
+    def needs_post(self, supplier_ref: str, invoice_number: str) -> bool:
+        return self.state(supplier_ref, invoice_number) in (None, *_RETRYABLE)
+
+    # Latest entry per invoice, optionally only those in the given states, in the order first journalled.
+    # Reads the whole journal; meant for reports after a run, not for the posting path.
+
+    def entries(self, states: tuple[str, ...] | None = None) -> Iterator[QubePMPLJournalEntry]:
+        query = (
+            f"SELECT {_COLUMNS} FROM entries WHERE seq IN "
+            "(SELECT MAX(seq) FROM entries GROUP BY supplier_ref, invoice_number)"
+        )
+        args: tuple = ()
+        if states is not None:
+            query += f" AND state IN ({', '.join('?' * len(states))})"
+            args = tuple(states)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY seq", args).fetchall()
+        for row in rows:
+            yield QubePMPLJournalEntry(*row)
+
+    def uncertain(self) -> Iterator[QubePMPLJournalEntry]:
+        return self.entries((PENDING, UNCERTAIN))
+
+    # Writing. Each entry is committed before the call returns.
+
+    def append(
+        self,
+        supplier_ref: str,
+        invoice_number: str,
+        state: str,
+        error_code: str = "",
+        error_message: str = "",
+    ) -> QubePMPLJournalEntry:
+        entry = QubePMPLJournalEntry(
+            supplier_ref, invoice_number, state, error_code, error_message, time.time()
+        )
+        with self._lock:
+            self._db.execute(f"INSERT INTO entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", entry)
+            if state != PENDING:
+                self._db.execute(
+                    "DELETE FROM claims WHERE supplier_ref = ? AND invoice_number = ? AND owner = ?",
+                    (supplier_ref, invoice_number, self.owner),
+                )
+        return entry
+
+    # Check, claim and record in one transaction, so another process sharing the file can't settle or
+    # claim the key in between. A claim this instance holds is never taken over, even once expired.
+
+    def record_intent(self, supplier_ref: str, invoice_number: str) -> QubePMPLJournalEntry | None:
+        key = (supplier_ref, invoice_number)
+        entry = QubePMPLJournalEntry(supplier_ref, invoice_number, PENDING, "", "", time.time())
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                latest = self._latest(supplier_ref, invoice_number)
+                claim = self._db.execute(
+                    "SELECT owner, expires_at FROM claims WHERE supplier_ref = ? AND invoice_number = ?", key
+                ).fetchone()
+                if (latest is not None and latest.state not in _RETRYABLE) or (
+                    claim is not None and (claim[0] == self.owner or claim[1] > entry.recorded_at)
+                ):
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "INSERT OR REPLACE INTO claims (supplier_ref, invoice_number, owner, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (*key, self.owner, entry.recorded_at + self.claim_timeout),
+                )
+                self._db.execute(f"INSERT INTO entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", entry)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return entry
+
+    # Record a parsed post_invoice response. A refusal with a duplicate code means Qube already has the
+    # invoice, one with a refusal code that it ran nothing; with another error code it's a rejection. A
+    # failure without one (SOAP fault, unreadable body) leaves the outcome uncertain.
+
+    def record_result(
+        self, supplier_ref: str, invoice_number: str, result: QubePMPLStatus
+    ) -> QubePMPLJournalEntry:
+        if result.success:
+            state = CONFIRMED
+        elif result.error_code in self.duplicate_codes:
+            state = DUPLICATE
+        elif result.error_code in self.refusal_codes:
+            state = REFUSED
+        elif result.error_code:
+            state = REJECTED
+        else:
+            state = UNCERTAIN
+        return self.append(supplier_ref, invoice_number, state, result.error_code, result.error_message)
+
+    # Record a post whose call raised; the request may have reached Qube.
+
+    def record_error(self, supplier_ref: str, invoice_number: str, error_message: str) -> QubePMPLJournalEntry:
+        return self.append(supplier_ref, invoice_number, UNCERTAIN, "", error_message)
@@ -0,0 +1,150 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+##############################################
+# Deferred session logout
+##############################################
+
+# Logout calls handed off the caller's thread. Sessions dropped without an explicit logout (garbage
+# collected, evicted from a pool) queue their Logout here instead of making the HTTP call inline.
+# A single daemon thread works through the queue in order, each Logout over its session's own transport
+# (so a pooled transport's keep-alive connections are reused for the whole backlog).
+# The shared default worker is drained at interpreter exit, for at most DRAIN_TIMEOUT seconds;
+# logouts still queued after that are dropped (Qube expires the sessions on its own timeout).
+
+DRAIN_TIMEOUT = 5.0
+
+
+# Snapshot of worker counters. dropped: logouts refused after close or left unsent by the drain deadline.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLLogoutStats:
+    submitted: int
+    completed: int
+    failed: int
+    dropped: int
+    pending: int
+
+
+# max_pending: queued logouts kept before new ones are dropped.
+
+
+class QubePMPLLogoutWorker:
+    def __init__(self, max_pending: int = 10_000):
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._queue: deque[Callable[[], object]] = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+
+    # Queue send() (a Logout request) to run on the worker thread. Returns False if it was dropped.
+    # send must not hold a reference to the session being torn down.
+
+    def submit(self, send: Callable[[], object]) -> bool:
+        with self._cond:
+            if self._closed or len(self._queue) >= self.max_pending:
+                self._dropped += 1
+                return False
+            self._submitted += 1
+            self._queue.append(send)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="qube-logout", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                send = self._queue.popleft()
+                self._in_flight = 1
+            try:
+                send()
+                failed = False
+            except Exception:
+                failed = True
+            with self._cond:
+                self._in_flight = 0
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                self._cond.notify_all()
+
+    # Wait until every queued logout has been sent, or `timeout` seconds pass. Returns True if drained.
+
+    def drain(self, timeout: float | None = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # Stop accepting logouts, send what is queued within `timeout`, and drop the rest.
+
+    def close(self, timeout: float | None = DRAIN_TIMEOUT) -> bool:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        drained = self.drain(timeout)
+        with self._cond:
+            self._dropped += len(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        return drained
+
+    def stats(self) -> QubePMPLLogoutStats:
+        with self._cond:
+            return QubePMPLLogoutStats(
+                submitted=self._submitted,
+                completed=self._completed,
+                failed=self._failed,
+                dropped=self._dropped,
+                pending=len(self._queue) + self._in_flight,
+            )
+
+
+_default_worker: QubePMPLLogoutWorker | None = None
+_default_lock = threading.Lock()
+
+
+# The process wide worker used by sessions that aren't given one, created on first use.
+
+
+def default_logout_worker() -> QubePMPLLogoutWorker:
+    global _default_worker
+    with _default_lock:
+        if _default_worker is None:
+            _default_worker = QubePMPLLogoutWorker()
+            atexit.register(_default_worker.close, DRAIN_TIMEOUT)
+        return _default_worker
+
+
+# A forked child gets a copy of the parent's worker without its thread; start afresh there.
+
+
+def _reset_after_fork() -> None:
+    global _default_worker, _default_lock
+    _default_worker = None
+    _default_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
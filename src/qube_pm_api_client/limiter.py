@@ -0,0 +1,165 @@
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from .deadline import current_deadline
+
+##############################################
+# Adaptive concurrency limit for parallel calls
+##############################################
+
+# Longest a caller waiting for a slot under a deadline goes without checking it for cancellation.
+
+CANCEL_POLL = 0.05
+
+
+# Snapshot of limiter metrics.
+# limit: calls currently allowed in flight. baseline: the unloaded latency the limiter compares against
+# (None until a call succeeds). decreases: times the limit was cut.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLLimiterStats:
+    limit: int
+    in_flight: int
+    successes: int
+    errors: int
+    decreases: int
+    baseline: float | None
+    last_latency: float | None
+
+
+# AIMD limit on the number of calls in flight, shared by the parallel paths that take one
+# (QubePMPLBulkPoster, QubePMPLShardedLookup, QubePMPLRoutingResolver).
+# Every call holds a slot while it runs and reports how it went:
+#   success within tolerance x baseline latency: the limit grows by 1 / limit (about +1 per full window).
+#   error (exception, SOAP fault, <status error-message>) or latency above tolerance x baseline: the limit
+#   is multiplied by backoff, at most once per window (only calls started after the last cut can cut it).
+# baseline tracks the unloaded latency: it drops to any faster call at once and creeps up by `smoothing`
+# of the difference otherwise, so it follows a server that gets slower for good.
+# The limit stays between min_limit and max_limit. Callers wait in acquire while the limit is reached.
+
+
+class QubePMPLAdaptiveLimiter:
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.7,
+        tolerance: float = 2.0,
+        smoothing: float = 0.05,
+    ):
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("Limits must satisfy 1 <= min_limit <= initial <= max_limit.")
+        if not 0.0 < backoff < 1.0 or tolerance <= 1.0:
+            raise ValueError("backoff must be between 0 and 1, and tolerance above 1.")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._cond = threading.Condition()
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._successes = 0
+        self._errors = 0
+        self._decreases = 0
+        self._baseline: float | None = None
+        self._last_latency: float | None = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    # Wait for a free slot. Returns the start time to pass back to release.
+    # A QubePMPLDeadline in force bounds the wait: QubePMPLDeadlineExceeded once it has passed or been
+    # cancelled (cancellation is noticed within CANCEL_POLL seconds).
+
+    def acquire(self) -> float:
+        deadline = current_deadline()
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                left = deadline.check()
+                self._cond.wait(CANCEL_POLL if left is None else min(left, CANCEL_POLL))
+            if deadline is not None:
+                deadline.check()
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, error: bool = False) -> None:
+        latency = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            self._last_latency = latency
+            if error:
+                self._errors += 1
+                self._decrease(started)
+            else:
+                self._successes += 1
+                baseline = self._baseline
+                if baseline is None or latency < baseline:
+                    self._baseline = latency
+                else:
+                    self._baseline = baseline + self.smoothing * (latency - baseline)
+                if baseline is not None and latency > self.tolerance * baseline:
+                    self._decrease(started)
+                else:
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def _decrease(self, started: float) -> None:
+        if started < self._last_decrease:
+            return
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._last_decrease = time.monotonic()
+        self._decreases += 1
+
+    # Hold a slot for the block. Call slot.fail() for an unsuccessful outcome; an exception counts as one.
+
+    @contextmanager
+    def slot(self):
+        slot = _Slot()
+        started = self.acquire()
+        try:
+            yield slot
+        except BaseException:
+            slot.failed = True
+            raise
+        finally:
+            self.release(started, slot.failed)
+
+    def stats(self) -> QubePMPLLimiterStats:
+        with self._cond:
+            return QubePMPLLimiterStats(
+                limit=int(self._limit),
+                in_flight=self._in_flight,
+                successes=self._successes,
+                errors=self._errors,
+                decreases=self._decreases,
+                baseline=self._baseline,
+                last_latency=self._last_latency,
+            )
+
+
+class _Slot:
+    __slots__ = ("failed",)
+
+    def __init__(self):
+        self.failed = False
+
+    def fail(self) -> None:
+        self.failed = True
+
+
+# limiter.slot(), or a slot that limits nothing when limiter is None.
+
+
+def limiter_slot(limiter: QubePMPLAdaptiveLimiter | None):
+    if limiter is None:
+        return nullcontext(_Slot())
+    return limiter.slot()
@@ -1,13 +1,58 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
+import re
+import sys
 import uuid
 import requests
 import xml.etree.ElementTree as ET
+from .builder import QubePMPLRequestBuilder
+from .cache import QubePMPLLookupCache
+from .coalesce import QubePMPLCoalescer
+from .deadline import QubePMPLTimeout, request_timeout
+from .instrumentation import QubePMPLInstrumentation
+from .lifecycle import QubePMPLLogoutWorker, default_logout_worker
+from .records import QubePMPLRecord, iter_response_records
+from .results import (
+    REPORT_OPEN_ERROR_CODES,
+    QubePMPLFund,
+    QubePMPLFundHeading,
+    QubePMPLLookupResult,
+    QubePMPLPostJournalResult,
+    QubePMPLProperty,
+    QubePMPLUser,
+    parse_lookup_response,
+    parse_post_journal,
+)
+from .transport import QubePMPLTransport
 
 ##############################################
 # SOAP client for Qube PM Purchase Ledger API
 ##############################################
 
+# One detail line of an invoice: its share of the totals, VAT code, property and fund heading.
+# property_ref / fund_heading_uid left blank take the values passed to post_invoice.
+
+
+@dataclass(slots=True)
+class QubePMPLInvoiceLine:
+    nett: float
+    vat: float
+    gross: float
+    vat_code: str
+    property_ref: str = ""
+    fund_heading_uid: str = ""
+    line_type: str = "Property expenditure"
+
+
+def _pence(amount: float) -> int:
+    return round(amount * 100)
+
+
 # Data class representing an invoice to be posted.
+# lines: optional detail lines, posted together in one journal. Without them the invoice is posted as a
+# single line carrying the header totals and vat_code.
 
 @dataclass
 class QubePMPLInvoice:
@@ -25,6 +70,7 @@ class QubePMPLInvoice:
         payment_due: str,
         vat_code: str,
         invoice_link: str = "",
+        lines: list[QubePMPLInvoiceLine] | None = None,
     ):
         self.supplier_ref = supplier_ref
         self.invoice_number = invoice_number
@@ -38,13 +84,51 @@ class QubePMPLInvoice:
         self.vat = vat
         self.gross = gross
         self.vat_code = vat_code
-
-# Common base class for client and session, holds shared methods and attributes.
-
-
-class QubePMPLAPICommon:
-    def __init__(self, base_url: str = ""):
+        self.lines = lines
+
+    # The detail lines to post, with blank property_ref / fund_heading_uid filled from the arguments.
+    # Raises ValueError if a line has no property or heading, or the lines' nett, VAT and gross
+    # don't add up to the header totals (compared in pence).
+
+    def detail_lines(self, property_ref: str = "", fund_heading_uid: str = "") -> list[QubePMPLInvoiceLine]:
+        if not self.lines:
+            return [
+                QubePMPLInvoiceLine(
+                    self.nett, self.vat, self.gross, self.vat_code, property_ref, fund_heading_uid
+                )
+            ]
+        lines = []
+        for number, line in enumerate(self.lines, start=1):
+            line_property = line.property_ref or property_ref
+            line_heading = line.fund_heading_uid or fund_heading_uid
+            if not line_property or not line_heading:
+                raise ValueError(
+                    f"Detail line {number} of invoice {self.invoice_number} needs a property_ref and fund_heading_uid."
+                )
+            lines.append(
+                QubePMPLInvoiceLine(
+                    line.nett, line.vat, line.gross, line.vat_code, line_property, line_heading, line.line_type
+                )
+            )
+        for name in ("nett", "vat", "gross"):
+            total = sum(_pence(getattr(line, name)) for line in lines)
+            expected = _pence(getattr(self, name))
+            if total != expected:
+                raise ValueError(
+                    f"Detail lines of invoice {self.invoice_number} total {name} {total / 100:.2f}, "
+                    f"header {name} is {expected / 100:.2f}."
+                )
+        return lines
+
+# Base class for sync and async clients/sessions. Holds the endpoint, default headers and envelope handling.
+# request_builder: optional QubePMPLRequestBuilder. When set, requests are rendered from its pre-compiled,
+# XML-escaped byte templates instead of the f-string templates below.
+
+
+class QubePMPLAPIBase:
+    def __init__(self, base_url: str = "", request_builder: QubePMPLRequestBuilder | None = None):
         self.base_url = base_url
+        self.request_builder = request_builder
         self.headers = {
             "Content-Type": "text/xml; charset=utf-8",
             "xmlns": "http://qube.qubeglobal.com/ns/webservice",
@@ -59,59 +143,89 @@ class QubePMPLAPICommon:
 </soapenv:Envelope>"""
         return envelope
 
-    def make_request(self, soap_action: str, body: str) -> requests.Response:
+    def soap_headers(self, soap_action: str) -> dict:
         headers = self.headers.copy()
         headers["SOAPAction"] = soap_action
-        response = requests.post(self.base_url, data=body, headers=headers)
-        return response
+        return headers
 
 
-# Session class, holds the client session key and has methods that require a valid session.
-# Defaults to partner portal base URL, which is our sandbox/test environment.
-
+# Common base class for client and session, holds shared methods and attributes.
+# transport: sends the requests. Defaults to a plain QubePMPLTransport (a new connection per call),
+# pass a QubePMPLPooledTransport to reuse keep-alive connections.
+# instrumentation: optional QubePMPLInstrumentation whose hooks see every make_request.
+# timeout: default QubePMPLTimeout(connect, read) for every request, None to wait indefinitely.
+# See deadline.py for per-call overrides (call_timeout) and whole-operation budgets (QubePMPLDeadline).
 
-class QubePMPLAPISession(QubePMPLAPICommon):
 
+class QubePMPLAPICommon(QubePMPLAPIBase):
     def __init__(
         self,
-        client_session_key: str = str(uuid.uuid4()),
-        base_url: str = "https://partner-portals.qubeglobalcloud.com/qubews/",
+        base_url: str = "",
+        transport: QubePMPLTransport | None = None,
+        request_builder: QubePMPLRequestBuilder | None = None,
+        instrumentation: QubePMPLInstrumentation | None = None,
+        timeout: QubePMPLTimeout | tuple | None = None,
     ):
-        self.client_session_key: str = client_session_key
-        super().__init__(base_url=base_url)
+        super().__init__(base_url=base_url, request_builder=request_builder)
+        self.transport = transport if transport is not None else QubePMPLTransport()
+        self.instrumentation = instrumentation
+        self.timeout = QubePMPLTimeout(*timeout) if timeout is not None else None
+
+    # timeout: overrides the timeouts for this request only.
+    # Raises QubePMPLDeadlineExceeded without sending if the deadline in force has passed,
+    # and requests.Timeout if the server doesn't connect or answer in time.
+    def make_request(
+        self,
+        soap_action: str,
+        body: str | bytes,
+        stream: bool = False,
+        timeout: QubePMPLTimeout | None = None,
+    ) -> requests.Response:
+        headers = self.soap_headers(soap_action)
+        timeout = request_timeout(self.timeout, timeout)
+        if timeout is None:
+            send = lambda: self.transport.post(self.base_url, data=body, headers=headers, stream=stream)
+        else:
+            send = lambda: self.transport.post(
+                self.base_url, data=body, headers=headers, stream=stream, timeout=timeout
+            )
+        instrumentation = self.instrumentation
+        if instrumentation is None or not instrumentation.active:
+            return send()
+        return instrumentation.call(soap_action, body, send, stream)
 
-    # destructor, calls logout on deletion
-    def __del__(self):
-        self.logout()
 
-    # Ends the session by calling the Logout API method.
-    def logout(self) -> requests.Response:
+# Request builders for session methods, shared by the sync and async sessions.
+# Each returns a (SOAPAction, envelope) pair ready for make_request.
+# Expects self.client_session_key and self.add_soap_envelope.
+
+
+class QubePMPLAPISessionRequests:
+    client_session_key: str
+    request_builder: QubePMPLRequestBuilder | None
+
+    def logout_request(self) -> tuple[str, str | bytes]:
+        if self.request_builder is not None:
+            return self.request_builder.logout(self.client_session_key)
         body = f"""<web:Logout>
     <!--Optional:-->
     <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
 </web:Logout>"""
         data = self.add_soap_envelope(body)
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/Logout", data
-        )
-        return response
+        return "http://qube.qubeglobal.com/ns/webservice/Logout", data
 
-    # Close the current report. Must be called before making another lookups call, or posting a new transaction.
-    # If not called, subsequent calls will fail. And the session may need to be thrown away and restarted.
-    def close_report(self) -> requests.Response:
+    def close_report_request(self) -> tuple[str, str | bytes]:
+        if self.request_builder is not None:
+            return self.request_builder.close_report(self.client_session_key)
         body = f"""<web:CloseReport>
     <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
 </web:CloseReport>"""
         data = self.add_soap_envelope(body)
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/CloseReport", data
-        )
-        return response
+        return "http://qube.qubeglobal.com/ns/webservice/CloseReport", data
 
-    # User lookup method. Looks up users by reference.
-    # ref: reference to look up, exact: whether to match exactly or not.
-    # Calling without args returns all users.
-    def get_users(self, ref: str = "?", exact: bool = False) -> requests.Response:
+    def get_users_request(self, ref: str = "?", exact: bool = False) -> tuple[str, str | bytes]:
+        if self.request_builder is not None:
+            return self.request_builder.get_users(self.client_session_key, ref, exact)
         exact_str = "true" if exact else "false"
         body = f"""<web:QubeProcess-1ia>
 <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
@@ -125,16 +239,11 @@ class QubePMPLAPISession(QubePMPLAPICommon):
     </web:Data>
     </web:QubeProcess-1ia>"""
         data = self.add_soap_envelope(body)
+        return "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
 
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
-        )
-        return response
-
-    # Property lookup method. Looks up properties by reference.
-    # ref: reference to look up, exact: whether to match exactly or not.
-    # Calling without args returns all properties. '?' is a wildcard character.
-    def get_properties(self, ref: str = "?", exact: bool = False) -> requests.Response:
+    def get_properties_request(self, ref: str = "?", exact: bool = False) -> tuple[str, str | bytes]:
+        if self.request_builder is not None:
+            return self.request_builder.get_properties(self.client_session_key, ref, exact)
         exact_str = "true" if exact else "false"
         body = f"""<web:QubeProcess-1ia>
 <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
@@ -148,27 +257,26 @@ class QubePMPLAPISession(QubePMPLAPICommon):
     </web:Data>
     </web:QubeProcess-1ia>"""
         data = self.add_soap_envelope(body)
+        return "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
 
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
-        )
-        return response
-
-    # Fund lookup method. Looks up funds by various parameters.
     # At least one ref/uid parameter should be provided to the lookup.
 
-    def get_fund(
+    def get_fund_request(
         self,
         property_ref: str = "",
         fund_uid: str = "",
         owner_ref: str = "",
         description: str = "",
-    ) -> requests.Response:
+    ) -> tuple[str, str | bytes]:
 
         if not (property_ref or fund_uid or owner_ref):
             raise ValueError(
                 "You must provide at least one of property_ref, fund_uid, or owner_ref to lookup a fund."
             )
+        if self.request_builder is not None:
+            return self.request_builder.get_fund(
+                self.client_session_key, property_ref, fund_uid, owner_ref, description
+            )
 
         body = f"""<web:QubeProcess-1ia>
 <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
@@ -186,14 +294,11 @@ class QubePMPLAPISession(QubePMPLAPICommon):
     </web:QubeProcess-1ia>"""
 
         data = self.add_soap_envelope(body)
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
-        )
-        return response
+        return "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
 
-    def get_fund_heading(
-        self, property_ref: str, fund_type: str
-    ) -> requests.Response:
+    def get_fund_heading_request(self, property_ref: str, fund_type: str) -> tuple[str, str | bytes]:
+        if self.request_builder is not None:
+            return self.request_builder.get_fund_heading(self.client_session_key, property_ref, fund_type)
         body = f"""<web:QubeProcess-1ia>
     <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
     <web:QubeProcessName>PURAPI:webAPI</web:QubeProcessName>
@@ -207,30 +312,41 @@ class QubePMPLAPISession(QubePMPLAPICommon):
     </web:Data>
 </web:QubeProcess-1ia>"""
         data = self.add_soap_envelope(body)
+        return "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
 
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
-        )
-        return response
-
-    # Invoice docs cannot be posted directly.
-    # Invoice docs need to be hosted on a web server accessible by Qube and a link passed via this method.
-    # Invoices will always be posted to the draft register for manual review.
-    # Only supports header level details. A single line item contains the invoice totals.
-
-    def post_invoice(
+    def post_invoice_request(
         self,
         invoice: QubePMPLInvoice,
         property_ref: str,
         user_id: str,
         fund_heading_uid: str,
-    ) -> requests.Response:
-        
+    ) -> tuple[str, str | bytes]:
+        # Validated before anything is built, so a bad split never reaches Qube.
+        lines = invoice.detail_lines(property_ref, fund_heading_uid) if invoice.lines else None
+        if self.request_builder is not None:
+            return self.request_builder.post_invoice(
+                self.client_session_key, invoice, property_ref, user_id, fund_heading_uid, lines
+            )
+
         if invoice.invoice_link:
             document_string = f"<document shortcut=\"false\" saveas=\"{invoice.invoice_number}\">{invoice.invoice_link}</document>"
         else:
             document_string = f"<!-- document -->"
 
+        details = "".join(
+            f"""
+                <detail>
+                    <line-type>{line.line_type}</line-type>
+                    <vat-code>{line.vat_code}</vat-code>
+                    <nett>{line.nett:.2f}</nett>
+                    <vat>{line.vat:.2f}</vat>
+                    <gross>{line.gross:.2f}</gross>
+                    <property-reference>{line.property_ref}</property-reference>
+                    <heading-unique-id>{line.fund_heading_uid}</heading-unique-id>
+                </detail>"""
+            for line in lines or invoice.detail_lines(property_ref, fund_heading_uid)
+        )
+
         body = f"""<web:QubeProcess-1ia>
     <web:ClientSessionKey>{self.client_session_key}</web:ClientSessionKey>
     <web:QubeProcessName>PUR:Invoice.ws</web:QubeProcessName>
@@ -254,47 +370,414 @@ class QubePMPLAPISession(QubePMPLAPICommon):
                 <nett>{invoice.nett:.2f}</nett>
                 <vat>{invoice.vat:.2f}</vat>
                 <gross>{invoice.gross:.2f}</gross>
-                <vat-on-pay>false</vat-on-pay>
-                <detail>
-                    <line-type>Property expenditure</line-type>
-                    <vat-code>{invoice.vat_code}</vat-code>
-                    <nett>{invoice.nett:.2f}</nett>
-                    <vat>{invoice.vat:.2f}</vat>
-                    <gross>{invoice.gross:.2f}</gross>
-                    <property-reference>{property_ref}</property-reference>
-                    <heading-unique-id>{fund_heading_uid}</heading-unique-id>
-                </detail>
+                <vat-on-pay>false</vat-on-pay>{details}
             </post-journal>
         </request-to-qube>
     </web:Data>
 </web:QubeProcess-1ia>"""
         data = self.add_soap_envelope(body)
+        return "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
 
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/QubeProcess-1ia", data
-        )
-        return response
 
+# Cacheability checks: only successful lookups are worth keeping.
+
+
+def _lookup_succeeded(kind: str):
+    marker = f'<{kind}-lookup success="true"'.encode()
+    return lambda response: response.status_code == 200 and marker in response.content
+
+
+def _result_succeeded(result: QubePMPLLookupResult) -> bool:
+    return result.success
+
+
+# Recognise Qube's "report already open" refusal (a <status> with one of REPORT_OPEN_ERROR_CODES), in a
+# raw response or a parsed result. Only the code counts, never the message text: a refused post_invoice
+# is sent again, so nothing else may be taken for a refusal.
+
+_STATUS_CODE = re.compile(rb"<status\b[^>]*?\berror-code=([\"'])(.*?)\1")
+
+
+def _response_refused(response: requests.Response) -> bool:
+    content = response.content
+    if not isinstance(content, bytes):
+        return False
+    match = _STATUS_CODE.search(content)
+    return match is not None and match[2].decode("utf-8", "replace") in REPORT_OPEN_ERROR_CODES
+
+
+def _result_refused(result) -> bool:
+    return not result.success and result.error_code in REPORT_OPEN_ERROR_CODES
 
-# Client authenticates and generates a session
 
+_UNSHARED: ContextVar[bool] = ContextVar("qube_unshared_lookups", default=False)
+
+
+# Within this block, get_* and lookup_* calls skip the session's lookup cache and coalescer and always
+# send their own request (their results aren't stored either). Used for hedged requests, which must not
+# join, or be answered by, the very call they are racing.
+
+
+@contextmanager
+def unshared_lookups():
+    token = _UNSHARED.set(True)
+    try:
+        yield
+    finally:
+        _UNSHARED.reset(token)
+
+
+# Session class, holds the client session key and has methods that require a valid session.
+# Defaults to partner portal base URL, which is our sandbox/test environment.
+# cache: optional QubePMPLLookupCache. When set, successful get_* and lookup_* results are served
+# from it until they expire; a cached call sends no request, so it opens no report.
+# coalescer: optional QubePMPLCoalescer. When set, get_* and lookup_* calls identical to one already in
+# flight (on any session sharing the coalescer) wait for it and share its result instead of sending their own.
+# report_open: whether Qube holds an open report for the session, from the calls made on it. True after
+# any lookup or post (even a failed one, or one that timed out, which Qube may still be running) until a
+# CloseReport succeeds, False after login or logout, None when unknown (a session built from an existing key).
+# A Logout that times out leaves logged_in True, so the session is still logged out later.
+# auto_close_report: close an open report before the next lookup or post, and when the server refuses
+# one because a report is still open, close it and resend once. Explicit close_report() calls are then
+# only needed to release the report at the end of a batch (or use ensure_report_closed()).
+# Qube opens a report for every lookup or post, so one CloseReport per call is still sent; what this saves
+# is the defensive CloseReports sent when no report is open (e.g. before every call as well as after it).
+# logged_in: whether the session still needs a Logout. Set by QubePMPLAPIClient.get_session; pass
+# logged_in=True for a key logged in elsewhere. Only logged in sessions are logged out when dropped.
+# logout_worker: QubePMPLLogoutWorker for deferred logouts, defaults to the process wide one.
+# Use the session as a context manager (or call logout()) to log out deterministically; a session that
+# is garbage collected while logged in queues its Logout on the worker instead of blocking the collector.
+
+
+class QubePMPLAPISession(QubePMPLAPISessionRequests, QubePMPLAPICommon):
 
-class QubePMPLAPIClient(QubePMPLAPICommon):
     def __init__(
         self,
-        base_url: str,
-        username: str,
-        password: str,
-        group: str,
+        client_session_key: str | None = None,
+        base_url: str = "https://partner-portals.qubeglobalcloud.com/qubews/",
+        transport: QubePMPLTransport | None = None,
+        cache: QubePMPLLookupCache | None = None,
+        request_builder: QubePMPLRequestBuilder | None = None,
+        instrumentation: QubePMPLInstrumentation | None = None,
+        auto_close_report: bool = False,
+        logged_in: bool = False,
+        coalescer: QubePMPLCoalescer | None = None,
+        logout_worker: QubePMPLLogoutWorker | None = None,
+        timeout: QubePMPLTimeout | tuple | None = None,
     ):
-        self.username = username
-        self.password = password
-        self.group = group
-        super().__init__(base_url=base_url)
+        self.client_session_key: str = client_session_key or str(uuid.uuid4())
+        self.logged_in = logged_in
+        self.logout_worker = logout_worker
+        self.cache = cache
+        self.coalescer = coalescer
+        self.auto_close_report = auto_close_report
+        self.report_open: bool | None = None
+        super().__init__(
+            base_url=base_url,
+            transport=transport,
+            request_builder=request_builder,
+            instrumentation=instrumentation,
+            timeout=timeout,
+        )
 
-    # Login method, authenticates and returns a session object.
+    # Serve a lookup from the cache when one is configured. Only successful results are stored.
+    # Cache misses go through the coalescer, if any, so identical concurrent misses send one request.
+    # Neither applies inside unshared_lookups().
+    def _cached(self, operation: str, args: tuple, load, cacheable):
+        if _UNSHARED.get():
+            return load()
+        key = (self.base_url, operation, args)
+        if self.coalescer is not None:
+            send = load
+            load = lambda: self.coalescer.call(key, send)
+        if self.cache is None:
+            return load()
+        return self.cache.get_or_load(key, load, cacheable)
+
+    # Send a lookup or post, tracking the report it opens.
+    # refused(result): whether the server turned it away because a report was still open.
+    def _report_call(self, send, refused=None):
+        if self.auto_close_report and self.report_open is not False:
+            self.close_report()
+        try:
+            result = send()
+        finally:
+            self.report_open = True
+        if self.auto_close_report and refused is not None and refused(result):
+            self.close_report()
+            try:
+                result = send()
+            finally:
+                self.report_open = True
+        return result
+
+    # Close the report only if one may be open. Returns the CloseReport response, or None if no call was needed.
+    def ensure_report_closed(self) -> requests.Response | None:
+        if self.report_open is False:
+            return None
+        return self.close_report()
+
+    # destructor, queues a logout for sessions still logged in. Never makes a network call itself.
+    def __del__(self):
+        if not getattr(self, "logged_in", False) or sys.is_finalizing():
+            return
+        try:
+            self.logout_later()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.logged_in:
+            self.logout()
+
+    # Ends the session by calling the Logout API method.
+    def logout(self) -> requests.Response:
+        response = self.make_request(*self.logout_request())
+        self.logged_in = False
+        self.report_open = False
+        return response
+
+    # Hand the Logout to the logout worker and return at once. Returns False if the worker dropped it.
+    def logout_later(self) -> bool:
+        if not self.logged_in:
+            return True
+        self.logged_in = False
+        self.report_open = False
+        soap_action, body = self.logout_request()
+        headers = self.soap_headers(soap_action)
+        transport, base_url, timeout = self.transport, self.base_url, self.timeout
+        worker = self.logout_worker if self.logout_worker is not None else default_logout_worker()
+        if timeout is None:
+            return worker.submit(lambda: transport.post(base_url, data=body, headers=headers))
+        return worker.submit(lambda: transport.post(base_url, data=body, headers=headers, timeout=timeout))
+
+    # Close the current report. Must be called before making another lookups call, or posting a new transaction.
+    # If not called, subsequent calls will fail. And the session may need to be thrown away and restarted.
+    # Always sends the request; see ensure_report_closed and auto_close_report to skip redundant ones.
+    def close_report(self) -> requests.Response:
+        response = self.make_request(*self.close_report_request())
+        if response.ok:
+            self.report_open = False
+        return response
+
+    # User lookup method. Looks up users by reference.
+    # ref: reference to look up, exact: whether to match exactly or not.
+    # Calling without args returns all users.
+    def get_users(self, ref: str = "?", exact: bool = False) -> requests.Response:
+        return self._cached(
+            "get_users",
+            (ref, exact),
+            lambda: self._report_call(lambda: self.make_request(*self.get_users_request(ref, exact)), _response_refused),
+            _lookup_succeeded("user"),
+        )
+
+    # Property lookup method. Looks up properties by reference.
+    # ref: reference to look up, exact: whether to match exactly or not.
+    # Calling without args returns all properties. '?' is a wildcard character.
+    def get_properties(self, ref: str = "?", exact: bool = False) -> requests.Response:
+        return self._cached(
+            "get_properties",
+            (ref, exact),
+            lambda: self._report_call(lambda: self.make_request(*self.get_properties_request(ref, exact)), _response_refused),
+            _lookup_succeeded("property"),
+        )
+
+    # Fund lookup method. Looks up funds by various parameters.
+    # At least one ref/uid parameter should be provided to the lookup.
+
+    def get_fund(
+        self,
+        property_ref: str = "",
+        fund_uid: str = "",
+        owner_ref: str = "",
+        description: str = "",
+    ) -> requests.Response:
+        return self._cached(
+            "get_fund",
+            (property_ref, fund_uid, owner_ref, description),
+            lambda: self._report_call(
+                lambda: self.make_request(
+                    *self.get_fund_request(property_ref, fund_uid, owner_ref, description)
+                ),
+                _response_refused,
+            ),
+            _lookup_succeeded("fund"),
+        )
+
+    def get_fund_heading(
+        self, property_ref: str, fund_type: str
+    ) -> requests.Response:
+        return self._cached(
+            "get_fund_heading",
+            (property_ref, fund_type),
+            lambda: self._report_call(lambda: self.make_request(*self.get_fund_heading_request(property_ref, fund_type)), _response_refused),
+            _lookup_succeeded("heading"),
+        )
+
+    # Streaming lookups. Same requests as the get_* methods, but the response body is read
+    # incrementally and parsed as it arrives, yielding one typed record (QubePMPLUser, QubePMPLProperty,
+    # QubePMPLFund or QubePMPLFundHeading) per <user>, <property>, <fund> or <heading> element.
+    # Peak memory stays flat however large the result set is.
+    # The request is sent immediately; close_report is still required after the records are consumed.
+    # Refusals can't be seen before the body is read, so these are never resent.
+
+    def iter_users(self, ref: str = "?", exact: bool = False) -> Iterator[QubePMPLRecord]:
+        response = self._report_call(
+            lambda: self.make_request(*self.get_users_request(ref, exact), stream=True)
+        )
+        return iter_response_records(response, "user", QubePMPLUser)
+
+    def iter_properties(self, ref: str = "?", exact: bool = False) -> Iterator[QubePMPLRecord]:
+        response = self._report_call(
+            lambda: self.make_request(*self.get_properties_request(ref, exact), stream=True)
+        )
+        return iter_response_records(response, "property", QubePMPLProperty)
+
+    def iter_funds(
+        self,
+        property_ref: str = "",
+        fund_uid: str = "",
+        owner_ref: str = "",
+        description: str = "",
+    ) -> Iterator[QubePMPLRecord]:
+        response = self._report_call(
+            lambda: self.make_request(
+                *self.get_fund_request(property_ref, fund_uid, owner_ref, description), stream=True
+            )
+        )
+        return iter_response_records(response, "fund", QubePMPLFund)
+
+    def iter_fund_headings(self, property_ref: str, fund_type: str) -> Iterator[QubePMPLRecord]:
+        response = self._report_call(
+            lambda: self.make_request(
+                *self.get_fund_heading_request(property_ref, fund_type), stream=True
+            )
+        )
+        return iter_response_records(response, "heading", QubePMPLFundHeading)
+
+    # Parsed lookups. Same requests as the get_* methods, parsed once into a QubePMPLLookupResult
+    # holding the success/error status and compact typed records.
+
+    def lookup_users(self, ref: str = "?", exact: bool = False) -> QubePMPLLookupResult:
+        return self._cached(
+            "lookup_users",
+            (ref, exact),
+            lambda: self._report_call(
+                lambda: parse_lookup_response(
+                    self.make_request(*self.get_users_request(ref, exact), stream=True), "user"
+                ),
+                _result_refused,
+            ),
+            _result_succeeded,
+        )
+
+    def lookup_properties(self, ref: str = "?", exact: bool = False) -> QubePMPLLookupResult:
+        return self._cached(
+            "lookup_properties",
+            (ref, exact),
+            lambda: self._report_call(
+                lambda: parse_lookup_response(
+                    self.make_request(*self.get_properties_request(ref, exact), stream=True),
+                    "property",
+                ),
+                _result_refused,
+            ),
+            _result_succeeded,
+        )
+
+    def lookup_funds(
+        self,
+        property_ref: str = "",
+        fund_uid: str = "",
+        owner_ref: str = "",
+        description: str = "",
+    ) -> QubePMPLLookupResult:
+        return self._cached(
+            "lookup_funds",
+            (property_ref, fund_uid, owner_ref, description),
+            lambda: self._report_call(
+                lambda: parse_lookup_response(
+                    self.make_request(
+                        *self.get_fund_request(property_ref, fund_uid, owner_ref, description),
+                        stream=True,
+                    ),
+                    "fund",
+                ),
+                _result_refused,
+            ),
+            _result_succeeded,
+        )
+
+    def lookup_fund_headings(self, property_ref: str, fund_type: str) -> QubePMPLLookupResult:
+        return self._cached(
+            "lookup_fund_headings",
+            (property_ref, fund_type),
+            lambda: self._report_call(
+                lambda: parse_lookup_response(
+                    self.make_request(
+                        *self.get_fund_heading_request(property_ref, fund_type), stream=True
+                    ),
+                    "heading",
+                ),
+                _result_refused,
+            ),
+            _result_succeeded,
+        )
+
+    # Invoice docs cannot be posted directly.
+    # Invoice docs need to be hosted on a web server accessible by Qube and a link passed via this method.
+    # Invoices will always be posted to the draft register for manual review.
+    # An invoice without lines is posted as a single line item containing the invoice totals, against
+    # property_ref and fund_heading_uid. An invoice with lines posts them all in one journal; property_ref
+    # and fund_heading_uid then only fill lines that leave them blank (pass "" otherwise).
+    # Raises ValueError, without sending anything, if the lines don't add up to the header totals.
 
-    def login(self, client_session_key: str = str(uuid.uuid4())):
+    def post_invoice(
+        self,
+        invoice: QubePMPLInvoice,
+        property_ref: str,
+        user_id: str,
+        fund_heading_uid: str,
+    ) -> requests.Response:
+        return self._report_call(
+            lambda: self.make_request(
+                *self.post_invoice_request(invoice, property_ref, user_id, fund_heading_uid)
+            ),
+            _response_refused,
+        )
+
+    # post_invoice, with the response parsed into a QubePMPLPostJournalResult (<success> flag and status).
+
+    def post_journal(
+        self,
+        invoice: QubePMPLInvoice,
+        property_ref: str,
+        user_id: str,
+        fund_heading_uid: str,
+    ) -> QubePMPLPostJournalResult:
+        response = self.post_invoice(invoice, property_ref, user_id, fund_heading_uid)
+        return parse_post_journal(response.content)
+
+
+# Request builder and login response check for clients, shared by the sync and async clients.
+# Expects self.username, self.password, self.group and self.add_soap_envelope.
+
+
+class QubePMPLAPIClientRequests:
+    username: str
+    password: str
+    group: str
+
+    request_builder: QubePMPLRequestBuilder | None
+
+    def login_request(self, client_session_key: str) -> tuple[str, str | bytes]:
+        if self.request_builder is not None:
+            return self.request_builder.login(
+                client_session_key, self.username, self.password, self.group
+            )
         body: str = f"""<web:Login-Overload-4>
     <!--Optional:-->
     <web:LoginData>
@@ -310,23 +793,77 @@ class QubePMPLAPIClient(QubePMPLAPICommon):
 </web:Login-Overload-4>"""
 
         data = self.add_soap_envelope(body)
+        return "http://qube.qubeglobal.com/ns/webservice/Login-Overload-4", data
 
-        response = self.make_request(
-            "http://qube.qubeglobal.com/ns/webservice/Login-Overload-4", data
-        )
-        return response
+    # Check response xml for <status error-message=""> & raise exception if login failed
 
-    def get_session(self) -> QubePMPLAPISession:
-        client_session_key = str(uuid.uuid4())
-        login_response = self.login(client_session_key=client_session_key)
-        # Check response xml for <status error-message=""> & raise exception if login failed
-        root = ET.fromstring(login_response.content)
+    def check_login_response(self, content: bytes) -> None:
+        root = ET.fromstring(content)
         status = root.find(".//status")
         if status is not None and status.get("error-message"):
             raise Exception(
                 f"Session creation failed: ErrorCode[{status.get('error-code')}] {status.get('error-message')}"
             )
+
+
+# Client authenticates and generates a session
+# Sessions created by get_session share the client's transport (and so its connection pool),
+# lookup cache, coalescer, request builder, instrumentation, auto_close_report setting, logout worker
+# and timeout.
+
+
+class QubePMPLAPIClient(QubePMPLAPIClientRequests, QubePMPLAPICommon):
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        group: str,
+        transport: QubePMPLTransport | None = None,
+        cache: QubePMPLLookupCache | None = None,
+        request_builder: QubePMPLRequestBuilder | None = None,
+        instrumentation: QubePMPLInstrumentation | None = None,
+        auto_close_report: bool = False,
+        logout_worker: QubePMPLLogoutWorker | None = None,
+        coalescer: QubePMPLCoalescer | None = None,
+        timeout: QubePMPLTimeout | tuple | None = None,
+    ):
+        self.logout_worker = logout_worker
+        self.username = username
+        self.password = password
+        self.group = group
+        self.cache = cache
+        self.coalescer = coalescer
+        self.auto_close_report = auto_close_report
+        super().__init__(
+            base_url=base_url,
+            transport=transport,
+            request_builder=request_builder,
+            instrumentation=instrumentation,
+            timeout=timeout,
+        )
+
+    # Login method, authenticates and returns a session object.
+
+    def login(self, client_session_key: str | None = None):
+        return self.make_request(*self.login_request(client_session_key or str(uuid.uuid4())))
+
+    def get_session(self) -> QubePMPLAPISession:
+        client_session_key = str(uuid.uuid4())
+        login_response = self.login(client_session_key=client_session_key)
+        self.check_login_response(login_response.content)
         session = QubePMPLAPISession(
-            client_session_key=client_session_key, base_url=self.base_url
+            client_session_key=client_session_key,
+            base_url=self.base_url,
+            transport=self.transport,
+            cache=self.cache,
+            request_builder=self.request_builder,
+            instrumentation=self.instrumentation,
+            auto_close_report=self.auto_close_report,
+            logout_worker=self.logout_worker,
+            coalescer=self.coalescer,
+            timeout=self.timeout,
         )
+        session.report_open = False
+        session.logged_in = True
         return session
@@ -0,0 +1,259 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from .deadline import TIMEOUT_ERRORS, current_deadline
+from .main import QubePMPLAPIClient, QubePMPLAPISession
+from .results import parse_status
+
+##############################################
+# Session pool for Qube PM Purchase Ledger API
+##############################################
+
+# Snapshot of pool metrics.
+# lease_wait_total / lease_wait_max: seconds callers spent waiting in acquire (including any login it triggered).
+# logins: sessions created via Login-Overload-4. evictions: sessions dropped as expired or unhealthy.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLSessionPoolStats:
+    size: int
+    open: int
+    idle: int
+    leased: int
+    leases: int
+    lease_wait_total: float
+    lease_wait_max: float
+    logins: int
+    login_failures: int
+    evictions: int
+
+    @property
+    def lease_wait_mean(self) -> float:
+        return self.lease_wait_total / self.leases if self.leases else 0.0
+
+
+class _PooledSession:
+    __slots__ = ("session", "created_at", "last_used")
+
+    def __init__(self, session: QubePMPLAPISession):
+        self.session = session
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+# Raised by acquire when no session becomes available before the timeout.
+
+
+class QubePMPLSessionPoolTimeout(Exception):
+    pass
+
+
+# Keeps up to `size` authenticated sessions and leases them out one caller at a time.
+# Every session goes back to the pool with no open report: close_report is sent on release unless
+# the session's report tracking shows none is open.
+# Sessions whose CloseReport fails, or older than max_age / idle longer than max_idle seconds, are evicted
+# and replaced by a fresh login on the next lease.
+# warm: log in all `size` sessions up front instead of on first use.
+
+
+class QubePMPLSessionPool:
+    def __init__(
+        self,
+        client: QubePMPLAPIClient,
+        size: int = 4,
+        max_age: float | None = 3600.0,
+        max_idle: float | None = 600.0,
+        warm: bool = True,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self.client = client
+        self.size = size
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self._cond = threading.Condition()
+        self._idle: list[_PooledSession] = []
+        self._leased: dict[int, _PooledSession] = {}
+        self._open = 0
+        self._closed = False
+        self._leases = 0
+        self._lease_wait_total = 0.0
+        self._lease_wait_max = 0.0
+        self._logins = 0
+        self._login_failures = 0
+        self._evictions = 0
+        if warm:
+            self.warm()
+
+    # Log in sessions until the pool holds `size` of them.
+
+    def warm(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed or self._open >= self.size:
+                    return
+                self._open += 1
+            entry = self._login()
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def _login(self) -> _PooledSession:
+        try:
+            session = self.client.get_session()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._login_failures += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._logins += 1
+        return _PooledSession(session)
+
+    def _expired(self, entry: _PooledSession, now: float) -> bool:
+        if self.max_age is not None and now - entry.created_at > self.max_age:
+            return True
+        if self.max_idle is not None and now - entry.last_used > self.max_idle:
+            return True
+        return False
+
+    # Evicted sessions are logged out on the logout worker, so the caller never waits on the Logout.
+
+    def _evict(self, entry: _PooledSession) -> None:
+        self._open -= 1
+        self._evictions += 1
+        self._cond.notify()
+        self._logout(entry)
+
+    def _logout(self, entry: _PooledSession) -> None:
+        try:
+            entry.session.logout_later()
+        except Exception:
+            pass
+
+    # Lease a session, blocking up to `timeout` seconds (forever if None) for one to become free.
+    # A QubePMPLDeadline in force caps the wait at the time it has left.
+    # Must be handed back with release().
+
+    def acquire(self, timeout: float | None = None) -> QubePMPLAPISession:
+        operation = current_deadline()
+        if operation is not None:
+            left = operation.check()
+            if left is not None and (timeout is None or left < timeout):
+                timeout = left
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        entry = None
+        with self._cond:
+            while entry is None:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed.")
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._expired(candidate, now):
+                        self._evict(candidate)
+                    else:
+                        entry = candidate
+                        break
+                if entry is not None:
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    raise QubePMPLSessionPoolTimeout(
+                        f"No pooled session became available within {timeout} seconds."
+                    )
+                self._cond.wait(remaining)
+        if entry is None:
+            entry = self._login()
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._leases += 1
+            self._lease_wait_total += waited
+            self._lease_wait_max = max(self._lease_wait_max, waited)
+            self._leased[id(entry.session)] = entry
+        return entry.session
+
+    # Return a leased session. Its report is closed first if open; if that fails, or discard is set,
+    # the session is evicted instead of going back into the pool.
+
+    def release(self, session: QubePMPLAPISession, discard: bool = False) -> None:
+        with self._cond:
+            entry = self._leased.pop(id(session), None)
+        if entry is None:
+            raise ValueError("Session was not leased from this pool.")
+        healthy = not discard and self._close_report(session)
+        with self._cond:
+            if not healthy:
+                self._evict(entry)
+            elif self._closed:
+                self._open -= 1
+                self._logout(entry)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def _close_report(self, session: QubePMPLAPISession) -> bool:
+        if getattr(session, "report_open", None) is False:
+            return True
+        try:
+            response = session.close_report()
+        except Exception:
+            return False
+        if response.status_code >= 400:
+            return False
+        return parse_status(response.content).success
+
+    # Context manager form of acquire/release.
+    # A session whose call timed out is evicted rather than reused: Qube may still be running the call.
+
+    @contextmanager
+    def lease(self, timeout: float | None = None):
+        session = self.acquire(timeout=timeout)
+        discard = False
+        try:
+            yield session
+        except TIMEOUT_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.release(session, discard=discard)
+
+    def stats(self) -> QubePMPLSessionPoolStats:
+        with self._cond:
+            return QubePMPLSessionPoolStats(
+                size=self.size,
+                open=self._open,
+                idle=len(self._idle),
+                leased=len(self._leased),
+                leases=self._leases,
+                lease_wait_total=self._lease_wait_total,
+                lease_wait_max=self._lease_wait_max,
+                logins=self._logins,
+                login_failures=self._login_failures,
+                evictions=self._evictions,
+            )
+
+    # Log out idle sessions and stop leasing. Leased sessions are logged out when released.
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._open -= len(self._idle)
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for entry in idle:
+            self._logout(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
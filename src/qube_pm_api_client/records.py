@@ -0,0 +1,175 @@
+import xml.etree.ElementTree as ET
+from collections.abc import Iterable, Iterator
+import requests
+
+##############################################
+# Lookup records and streaming response parsing
+##############################################
+
+# Raised when a lookup response carries a <status error-message="...">.
+
+
+class QubePMPLAPIError(Exception):
+    def __init__(self, error_code: str, error_message: str):
+        self.error_code = error_code
+        self.error_message = error_message
+        super().__init__(f"ErrorCode[{error_code}] {error_message}")
+
+
+# One record from a lookup response (a <user>, <property>, <fund> or <heading> element).
+# Field names are the record's attributes and child element tags, values their text.
+# Records of the same shape share one names tuple, so each record costs one object and one values tuple.
+# Fields are read with record["unique-id"], record.get("unique-id") or record.unique_id.
+
+
+class QubePMPLRecord:
+    __slots__ = ("kind", "names", "values")
+
+    def __init__(self, kind: str, names: tuple[str, ...], values: tuple[str, ...]):
+        self.kind = kind
+        self.names = names
+        self.values = values
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        try:
+            return self.values[self.names.index(name)]
+        except ValueError:
+            return default
+
+    def __getitem__(self, name: str) -> str:
+        try:
+            return self.values[self.names.index(name)]
+        except ValueError:
+            raise KeyError(name) from None
+
+    def __getattr__(self, name: str) -> str:
+        if name in QubePMPLRecord.__slots__:
+            raise AttributeError(name)
+        value = self.get(name.replace("_", "-"))
+        if value is None:
+            value = self.get(name)
+        if value is None:
+            raise AttributeError(f"{self.kind} record has no field {name!r}")
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, QubePMPLRecord):
+            return NotImplemented
+        return (self.kind, self.names, self.values) == (other.kind, other.names, other.values)
+
+    def __hash__(self) -> int:
+        return hash((self.kind, self.names, self.values))
+
+    def as_dict(self) -> dict[str, str]:
+        return dict(zip(self.names, self.values))
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{n}={v!r}" for n, v in zip(self.names, self.values))
+        return f"{type(self).__name__}({self.kind}: {fields})"
+
+
+def _local_name(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+# Field names and values of a fully parsed record element. names_cache interns the names tuple per record shape.
+
+
+def element_fields(
+    element: ET.Element, names_cache: dict | None = None
+) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    names = list(element.attrib)
+    values = list(element.attrib.values())
+    for child in element:
+        names.append(_local_name(child.tag))
+        values.append((child.text or "").strip())
+    names = tuple(names)
+    if names_cache is not None:
+        names = names_cache.setdefault(names, names)
+    return names, tuple(values)
+
+
+# Incrementally parse an XML byte stream and yield (names, values) for each `tag` element.
+# Each element is detached from the tree once its fields are read, so memory use stays flat
+# however many records the response holds.
+# status: object with success / error_code / error_message attributes to fill in from the
+# <{tag}-lookup success="..."> container, <status> element or SOAP fault. If None, an error
+# <status> raises QubePMPLAPIError instead.
+
+
+def iter_rows(
+    chunks: Iterable[bytes], tag: str, status=None
+) -> Iterator[tuple[tuple[str, ...], tuple[str, ...]]]:
+    parser = ET.XMLPullParser(events=("start", "end"))
+    names_cache: dict = {}
+    stack: list[ET.Element] = []
+    container = f"{tag}-lookup"
+    seen_container = False
+    record_depth = 0
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            name = _local_name(element.tag)
+            if event == "start":
+                stack.append(element)
+                if name == tag:
+                    record_depth += 1
+                continue
+            stack.pop()
+            if name == tag:
+                record_depth -= 1
+                if record_depth:
+                    continue
+                row = element_fields(element, names_cache)
+                if stack:
+                    stack[-1].remove(element)
+                element.clear()
+                yield row
+            elif record_depth:
+                continue
+            elif name == "status" and element.get("error-message"):
+                if status is None:
+                    raise QubePMPLAPIError(element.get("error-code", ""), element.get("error-message"))
+                status.success = False
+                status.error_code = element.get("error-code", "")
+                status.error_message = element.get("error-message")
+            elif status is None:
+                continue
+            elif name == container:
+                seen_container = True
+                if element.get("success", "true").lower() != "true":
+                    status.success = False
+            elif name == "faultstring":
+                status.success = False
+                status.error_message = status.error_message or (element.text or "").strip()
+    parser.close()
+    if status is not None and not seen_container and status.success:
+        status.success = False
+        status.error_message = f"No <{container}> element in response."
+
+
+# Incrementally parse an XML byte stream and yield one record per `tag` element.
+# Raises QubePMPLAPIError if the response carries a <status error-message="...">.
+
+
+def iter_records(
+    chunks: Iterable[bytes], tag: str, record_type: type = QubePMPLRecord
+) -> Iterator[QubePMPLRecord]:
+    for names, values in iter_rows(chunks, tag):
+        yield record_type(tag, names, values)
+
+
+# Stream records out of a response sent with stream=True, closing it when done.
+
+
+def iter_response_records(
+    response: requests.Response,
+    tag: str,
+    record_type: type = QubePMPLRecord,
+    chunk_size: int = 64 * 1024,
+) -> Iterator[QubePMPLRecord]:
+    with response:
+        yield from iter_records(response.iter_content(chunk_size=chunk_size), tag, record_type)
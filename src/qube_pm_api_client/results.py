@@ -0,0 +1,266 @@
+import xml.etree.ElementTree as ET
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+import requests
+from .records import QubePMPLAPIError, QubePMPLRecord, iter_rows
+
+##############################################
+# Parsed results for Qube PM Purchase Ledger API responses
+##############################################
+
+# Success / error status shared by every parsed result.
+# success: the lookup's success attribute, the post-journal <success> flag, or no error <status>.
+# error_code / error_message: from <status error-code="" error-message=""> (or the SOAP fault string).
+
+
+class QubePMPLStatus:
+    __slots__ = ("success", "error_code", "error_message")
+
+    def __init__(self, success: bool = True, error_code: str = "", error_message: str = ""):
+        self.success = success
+        self.error_code = error_code
+        self.error_message = error_message
+
+    def raise_for_status(self) -> None:
+        if not self.success or self.error_message:
+            raise QubePMPLAPIError(self.error_code, self.error_message or "Request was not successful.")
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(success={self.success}, error_code={self.error_code!r}, "
+            f"error_message={self.error_message!r})"
+        )
+
+
+# <status error-code> values for a call Qube turned away because the session's report was still open: it
+# ran nothing, so the call can be sent again once the report is closed. "12" is the code the stand-in uses.
+
+REPORT_OPEN_ERROR_CODES = ("12",)
+
+
+# Typed lookup records. No per-instance storage beyond QubePMPLRecord; the properties
+# read the common fields, anything else is available via record["field"].
+
+
+class QubePMPLUser(QubePMPLRecord):
+    __slots__ = ()
+
+    @property
+    def reference(self) -> str:
+        return self.get("reference", "")
+
+    @property
+    def name(self) -> str:
+        return self.get("name", "")
+
+
+class QubePMPLProperty(QubePMPLRecord):
+    __slots__ = ()
+
+    @property
+    def reference(self) -> str:
+        return self.get("reference", "")
+
+    @property
+    def unique_id(self) -> str:
+        return self.get("unique-id", "")
+
+    @property
+    def name(self) -> str:
+        return self.get("name", "")
+
+
+class QubePMPLFund(QubePMPLRecord):
+    __slots__ = ()
+
+    @property
+    def unique_id(self) -> str:
+        return self.get("unique-id", "")
+
+    @property
+    def property_reference(self) -> str:
+        return self.get("property-reference", "")
+
+    @property
+    def owner_reference(self) -> str:
+        return self.get("owner-reference", "")
+
+    @property
+    def fund_type(self) -> str:
+        return self.get("fund-type", "")
+
+    @property
+    def description(self) -> str:
+        return self.get("description", "")
+
+
+class QubePMPLFundHeading(QubePMPLRecord):
+    __slots__ = ()
+
+    @property
+    def unique_id(self) -> str:
+        return self.get("unique-id", "")
+
+    @property
+    def description(self) -> str:
+        return self.get("description", "")
+
+
+RECORD_TYPES: dict[str, type] = {
+    "user": QubePMPLUser,
+    "property": QubePMPLProperty,
+    "fund": QubePMPLFund,
+    "heading": QubePMPLFundHeading,
+}
+
+
+# Parsed lookup response: status plus a read-only sequence of typed records.
+# Rows are kept as value tuples with one shared names tuple per record shape (indexed by an array),
+# and record objects are only created when accessed, so large result sets stay compact.
+
+
+class QubePMPLLookupResult(QubePMPLStatus, Sequence):
+    __slots__ = ("kind", "record_type", "_shapes", "_shape_ids", "_row_shapes", "_values")
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+        self.record_type = RECORD_TYPES.get(kind, QubePMPLRecord)
+        self._shapes: list[tuple[str, ...]] = []
+        self._shape_ids: dict[tuple[str, ...], int] = {}
+        self._row_shapes = array("H")
+        self._values: list[tuple[str, ...]] = []
+
+    def append_row(self, names: tuple[str, ...], values: tuple[str, ...]) -> None:
+        shape = self._shape_ids.get(names)
+        if shape is None:
+            shape = self._shape_ids[names] = len(self._shapes)
+            self._shapes.append(names)
+        self._row_shapes.append(shape)
+        self._values.append(values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        values = self._values[index]
+        names = self._shapes[self._row_shapes[index]]
+        return self.record_type(self.kind, names, values)
+
+    def __iter__(self) -> Iterator[QubePMPLRecord]:
+        record_type, kind, shapes = self.record_type, self.kind, self._shapes
+        for shape, values in zip(self._row_shapes, self._values):
+            yield record_type(kind, shapes[shape], values)
+
+    # All values of one field, in record order ("" where a record lacks the field).
+
+    def column(self, name: str) -> list[str]:
+        positions = [names.index(name) if name in names else None for names in self._shapes]
+        return [
+            values[positions[shape]] if positions[shape] is not None else ""
+            for shape, values in zip(self._row_shapes, self._values)
+        ]
+
+    # First record whose field equals value, or None.
+
+    def find(self, name: str, value: str) -> QubePMPLRecord | None:
+        for index, field_value in enumerate(self.column(name)):
+            if field_value == value:
+                return self[index]
+        return None
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}({self.kind}, records={len(self)}, success={self.success}, "
+            f"error_message={self.error_message!r})"
+        )
+
+
+# Parsed post-journal response.
+
+
+class QubePMPLPostJournalResult(QubePMPLStatus):
+    __slots__ = ()
+
+
+def _chunks(content: bytes | Iterable[bytes]) -> Iterable[bytes]:
+    return (content,) if isinstance(content, (bytes, bytearray)) else content
+
+
+# Parse a lookup response (bytes, or an iterable of byte chunks) in one incremental pass.
+# kind: "user", "property", "fund" or "heading".
+
+
+def parse_lookup(content: bytes | Iterable[bytes], kind: str) -> QubePMPLLookupResult:
+    result = QubePMPLLookupResult(kind)
+    try:
+        for names, values in iter_rows(_chunks(content), kind, status=result):
+            result.append_row(names, values)
+    except ET.ParseError as e:
+        result.success = False
+        result.error_message = f"Unreadable response: {e}"
+    return result
+
+
+def parse_user_lookup(content: bytes | Iterable[bytes]) -> QubePMPLLookupResult:
+    return parse_lookup(content, "user")
+
+
+def parse_property_lookup(content: bytes | Iterable[bytes]) -> QubePMPLLookupResult:
+    return parse_lookup(content, "property")
+
+
+def parse_fund_lookup(content: bytes | Iterable[bytes]) -> QubePMPLLookupResult:
+    return parse_lookup(content, "fund")
+
+
+def parse_heading_lookup(content: bytes | Iterable[bytes]) -> QubePMPLLookupResult:
+    return parse_lookup(content, "heading")
+
+
+# Read the <success> flag and any <status error-message> from a post_invoice response.
+
+
+def parse_post_journal(content: bytes) -> QubePMPLPostJournalResult:
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError as e:
+        return QubePMPLPostJournalResult(False, "", f"Unreadable response: {e}")
+    success = root.find(".//success")
+    status = root.find(".//status")
+    fault = root.find(".//faultstring")
+    error_code = status.get("error-code", "") if status is not None else ""
+    error_message = status.get("error-message", "") if status is not None else ""
+    if not error_message and fault is not None:
+        error_message = (fault.text or "").strip()
+    ok = success is not None and (success.text or "").strip().lower() == "true"
+    return QubePMPLPostJournalResult(ok, error_code, error_message)
+
+
+# Status of a response without records (Login, Logout, CloseReport).
+
+
+def parse_status(content: bytes) -> QubePMPLStatus:
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError as e:
+        return QubePMPLStatus(False, "", f"Unreadable response: {e}")
+    for status in root.iter("status"):
+        if status.get("error-message"):
+            return QubePMPLStatus(False, status.get("error-code", ""), status.get("error-message"))
+    fault = root.find(".//faultstring")
+    if fault is not None:
+        return QubePMPLStatus(False, "", (fault.text or "").strip())
+    return QubePMPLStatus()
+
+
+# Parse a lookup response sent with stream=True as it is read, closing it when done.
+
+
+def parse_lookup_response(
+    response: requests.Response, kind: str, chunk_size: int = 64 * 1024
+) -> QubePMPLLookupResult:
+    with response:
+        return parse_lookup(response.iter_content(chunk_size=chunk_size), kind)
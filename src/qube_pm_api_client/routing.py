@@ -0,0 +1,193 @@
+import contextvars
+import threading
+from collections.abc import Callable, Hashable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import NamedTuple
+from .bulk import QubePMPLPostJob
+from .hedge import QubePMPLHedgedLookup
+from .limiter import QubePMPLAdaptiveLimiter, limiter_slot
+from .main import QubePMPLInvoice
+from .pool import QubePMPLSessionPool
+from .records import QubePMPLRecord
+from .results import QubePMPLLookupResult
+
+##############################################
+# Batched invoice routing: property / owner -> fund -> heading
+##############################################
+
+# Where an invoice should be posted. Give property_ref, or owner_ref to find the property through the
+# owner's fund of fund_type. The heading is fund_heading_uid if known, else the heading of fund_type
+# whose description is `heading`.
+
+
+class QubePMPLRoute(NamedTuple):
+    invoice: QubePMPLInvoice
+    user_id: str
+    property_ref: str = ""
+    fund_type: str = ""
+    heading: str = ""
+    fund_heading_uid: str = ""
+    owner_ref: str = ""
+
+
+# Outcome of routing one invoice. index is the route's position in the batch.
+# job: arguments ready for post_invoice / QubePMPLBulkPoster, or None with error_code / error_message set.
+
+
+@dataclass(slots=True)
+class QubePMPLRoutedInvoice:
+    index: int
+    route: QubePMPLRoute
+    job: QubePMPLPostJob | None
+    error_code: str = ""
+    error_message: str = ""
+
+    @property
+    def success(self) -> bool:
+        return self.job is not None
+
+
+# Resolves a batch of routes with as few lookups as possible. Each step is memoized for the resolver's
+# lifetime, keyed by its own inputs:
+#   property exists:     lookup_properties(property_ref, exact=True)   per property_ref
+#   owner's funds:       lookup_funds(owner_ref=owner_ref)             per owner_ref
+#   headings of a fund:  lookup_fund_headings(property_ref, fund_type) per (property_ref, fund_type)
+# The distinct keys of a batch are resolved concurrently on sessions leased from the pool; routes sharing
+# a key wait on the same lookup. A failed lookup fails the rest of its batch too, and is retried by the
+# next batch.
+# concurrency: lookups in flight at once (defaults to the pool size).
+# limiter: optional QubePMPLAdaptiveLimiter to adapt that number, below concurrency, to latency and errors.
+# hedger: optional QubePMPLHedgedLookup (on the same pool) to send the lookups through, hedging slow ones.
+
+
+class QubePMPLRoutingResolver:
+    def __init__(
+        self,
+        pool: QubePMPLSessionPool,
+        concurrency: int | None = None,
+        limiter: QubePMPLAdaptiveLimiter | None = None,
+        hedger: QubePMPLHedgedLookup | None = None,
+    ):
+        self.pool = pool
+        self.concurrency = concurrency or pool.size
+        self.limiter = limiter
+        self.hedger = hedger
+        self._lock = threading.Lock()
+        self._properties: dict[Hashable, Future] = {}
+        self._owner_funds: dict[Hashable, Future] = {}
+        self._headings: dict[Hashable, Future] = {}
+
+    # Run load once per key, sharing its result with concurrent and later callers.
+
+    def _memo(self, table: dict, key: Hashable, load: Callable):
+        with self._lock:
+            future = table.get(key)
+            owner = future is None
+            if owner:
+                future = table[key] = Future()
+        if owner:
+            try:
+                future.set_result(load())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def _forget_failures(self) -> None:
+        with self._lock:
+            for table in (self._properties, self._owner_funds, self._headings):
+                for key in [k for k, f in table.items() if f.done() and f.exception() is not None]:
+                    del table[key]
+
+    def _lookup(self, method: str, *args, **kwargs) -> QubePMPLLookupResult:
+        if self.hedger is not None:
+            # The hedger leases its own sessions, so here the slot also covers the wait for one.
+            with limiter_slot(self.limiter) as slot:
+                result = self.hedger.call(method, *args, **kwargs)
+                if not result.success or result.error_message:
+                    slot.fail()
+        else:
+            with self.pool.lease() as session:
+                with limiter_slot(self.limiter) as slot:
+                    result = getattr(session, method)(*args, **kwargs)
+                    if not result.success or result.error_message:
+                        slot.fail()
+        result.raise_for_status()
+        return result
+
+    def _check_property(self, property_ref: str) -> None:
+        found = self._memo(
+            self._properties,
+            property_ref,
+            lambda: len(self._lookup("lookup_properties", property_ref, exact=True)) > 0,
+        )
+        if not found:
+            raise ValueError(f"Unknown property {property_ref}")
+
+    def _owner_property(self, owner_ref: str, fund_type: str) -> str:
+        funds = self._memo(
+            self._owner_funds, owner_ref, lambda: self._lookup("lookup_funds", owner_ref=owner_ref)
+        )
+        fund = funds.find("fund-type", fund_type)
+        if fund is None:
+            raise ValueError(f"No {fund_type!r} fund for owner {owner_ref}")
+        return fund.property_reference
+
+    def _heading(self, property_ref: str, fund_type: str, description: str) -> QubePMPLRecord:
+        headings = self._memo(
+            self._headings,
+            (property_ref, fund_type),
+            lambda: self._lookup("lookup_fund_headings", property_ref, fund_type),
+        )
+        found = headings.find("description", description)
+        if found is None:
+            raise ValueError(f"No heading {description!r} in {fund_type!r} for property {property_ref}")
+        return found
+
+    def _resolve(self, index: int, route: QubePMPLRoute) -> QubePMPLRoutedInvoice:
+        try:
+            property_ref = route.property_ref
+            if not property_ref:
+                if not route.owner_ref or not route.fund_type:
+                    raise ValueError("Route needs a property_ref, or an owner_ref and fund_type")
+                property_ref = self._owner_property(route.owner_ref, route.fund_type)
+            self._check_property(property_ref)
+            heading_uid = route.fund_heading_uid
+            if not heading_uid:
+                if not route.fund_type or not route.heading:
+                    raise ValueError("Route needs a fund_heading_uid, or a fund_type and heading")
+                heading_uid = self._heading(property_ref, route.fund_type, route.heading).unique_id
+        except Exception as e:
+            return QubePMPLRoutedInvoice(
+                index, route, None, getattr(e, "error_code", ""), str(e)
+            )
+        return QubePMPLRoutedInvoice(
+            index, route, QubePMPLPostJob(route.invoice, property_ref, route.user_id, heading_uid)
+        )
+
+    # Route every invoice in the batch. Returns one QubePMPLRoutedInvoice per route, in input order.
+
+    def resolve(self, routes: Iterable) -> list[QubePMPLRoutedInvoice]:
+        routes = [QubePMPLRoute(*route) for route in routes]
+        if not routes:
+            return []
+        self._forget_failures()
+        # Resolve one route per distinct first step, so each key's lookups start in parallel and the
+        # remaining routes find them memoized or in flight.
+        first: dict[Hashable, int] = {}
+        for index, route in enumerate(routes):
+            first.setdefault((route.property_ref or route.owner_ref, route.fund_type), index)
+        results: list[QubePMPLRoutedInvoice | None] = [None] * len(routes)
+        contexts = [contextvars.copy_context() for _ in first]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for index, result in zip(
+                first.values(),
+                executor.map(
+                    lambda i, context: context.run(self._resolve, i, routes[i]), first.values(), contexts
+                ),
+            ):
+                results[index] = result
+        for index, route in enumerate(routes):
+            if results[index] is None:
+                results[index] = self._resolve(index, route)
+        return results
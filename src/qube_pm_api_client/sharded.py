@@ -0,0 +1,196 @@
+import contextvars
+import string
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from .hedge import QubePMPLHedgedLookup
+from .limiter import QubePMPLAdaptiveLimiter, limiter_slot
+from .pool import QubePMPLSessionPool
+from .records import QubePMPLRecord
+from .results import QubePMPLLookupResult
+
+##############################################
+# Prefix-sharded wildcard lookups across pooled sessions
+##############################################
+
+# Splits a wildcard user or property lookup ("?", or "<prefix>?") into one lookup per reference prefix,
+# "<prefix>0?", "<prefix>1?", ..., and runs them in parallel on sessions leased from the pool.
+# Records are yielded as each partition completes, de-duplicated on (reference, unique-id).
+# A partition returning split_threshold records or more may have been cut short by the server, so it is
+# re-split one character deeper (plus an exact lookup of the prefix itself, which no child covers), up to
+# max_depth characters. Its records are still yielded; the children's copies are dropped as duplicates.
+# alphabet: the characters references can start (and continue) with. No partition covers a reference with a
+# character outside it at a split position, so pass the real one if references use lower case, spaces or other punctuation.
+# The lookup raises QubePMPLShardedLookupIncomplete, after yielding what it found, if partitions were still
+# split_threshold or larger at max_depth (the server may have cut them short, so records may be missing).
+# verify=True adds a debugging check for the alphabet: once every partition is in, the unsplit lookup
+# (prefix + "?") is sent as well, any of its records the partitions missed are yielded, and the lookup
+# raises if there were any. It costs a full unsharded lookup on top of the partitions, and is itself cut
+# short on a large enough result, so leave it off outside of checking an alphabet against a server.
+# concurrency: lookups in flight at once (defaults to the pool size).
+# limiter: optional QubePMPLAdaptiveLimiter to adapt that number, below concurrency, to latency and errors.
+# hedger: optional QubePMPLHedgedLookup (on the same pool) to send the lookups through, hedging slow ones.
+
+DEFAULT_ALPHABET = string.digits + string.ascii_uppercase + "-./"
+
+_LOOKUPS = {
+    "user": "lookup_users",
+    "property": "lookup_properties",
+}
+
+
+# Counters for the last sharded lookup.
+# partitions: lookups sent (including any coverage check). splits: partitions re-split for being too large.
+# duplicates: records dropped. truncated: partitions too large at max_depth. missing: records only the
+# verify=True coverage check found.
+
+
+@dataclass(slots=True)
+class QubePMPLShardedLookupStats:
+    partitions: int = 0
+    splits: int = 0
+    records: int = 0
+    duplicates: int = 0
+    truncated: int = 0
+    missing: int = 0
+
+
+# Raised, after every record found has been yielded, by a sharded lookup that can't vouch for its result.
+# truncated: shards ("<prefix>?") still too large at max_depth. missing: references only the coverage check
+# returned. characters: the characters, outside the alphabet, those references had at a split position.
+
+
+class QubePMPLShardedLookupIncomplete(LookupError):
+    def __init__(self, truncated: list[str], missing: list[str], characters: str):
+        self.truncated = truncated
+        self.missing = missing
+        self.characters = characters
+        problems = []
+        if missing:
+            hint = f" (add {characters!r} to the alphabet)" if characters else ""
+            problems.append(f"{len(missing)} records missed by the partitions{hint}")
+        if truncated:
+            problems.append(
+                f"{len(truncated)} partitions still too large at max_depth ({', '.join(truncated[:5])})"
+            )
+        super().__init__("Sharded lookup is incomplete: " + "; ".join(problems) + ".")
+
+
+class QubePMPLShardedLookup:
+    def __init__(
+        self,
+        pool: QubePMPLSessionPool,
+        alphabet: str = DEFAULT_ALPHABET,
+        split_threshold: int = 1000,
+        max_depth: int = 4,
+        concurrency: int | None = None,
+        limiter: QubePMPLAdaptiveLimiter | None = None,
+        hedger: QubePMPLHedgedLookup | None = None,
+        verify: bool = False,
+    ):
+        if not alphabet:
+            raise ValueError("The shard alphabet must not be empty.")
+        self.pool = pool
+        self.alphabet = alphabet
+        self.split_threshold = split_threshold
+        self.max_depth = max_depth
+        self.concurrency = concurrency or pool.size
+        self.limiter = limiter
+        self.hedger = hedger
+        self.verify = verify
+        self.stats = QubePMPLShardedLookupStats()
+
+    def _fetch(self, kind: str, ref: str, exact: bool) -> QubePMPLLookupResult:
+        if self.hedger is not None:
+            # The hedger leases its own sessions, so here the slot also covers the wait for one.
+            with limiter_slot(self.limiter) as slot:
+                result = self.hedger.call(_LOOKUPS[kind], ref, exact)
+                if not result.success or result.error_message:
+                    slot.fail()
+        else:
+            with self.pool.lease() as session:
+                with limiter_slot(self.limiter) as slot:
+                    result = getattr(session, _LOOKUPS[kind])(ref, exact)
+                    if not result.success or result.error_message:
+                        slot.fail()
+        result.raise_for_status()
+        return result
+
+    # Every record whose reference starts with prefix ("" for all of them), in completion order.
+    # kind: "user" or "property". Raises QubePMPLAPIError if a partition's lookup fails, and
+    # QubePMPLShardedLookupIncomplete at the end if the result may be incomplete.
+
+    def lookup(self, kind: str, prefix: str = "") -> Iterator[QubePMPLRecord]:
+        if kind not in _LOOKUPS:
+            raise ValueError(f"Sharded lookups support {', '.join(_LOOKUPS)}, not {kind!r}.")
+        self.stats = stats = QubePMPLShardedLookupStats()
+        seen: set[tuple[str | None, str | None]] = set()
+        truncated: list[str] = []
+        pending: dict[Future, tuple[str, bool, int]] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+
+            def submit(shard: str, exact: bool, depth: int) -> None:
+                ref = shard if exact else shard + "?"
+                context = contextvars.copy_context()
+                pending[executor.submit(context.run, self._fetch, kind, ref, exact)] = (shard, exact, depth)
+                stats.partitions += 1
+
+            def split(shard: str, depth: int) -> None:
+                if shard:
+                    submit(shard, True, depth)
+                for character in self.alphabet:
+                    submit(shard + character, False, depth + 1)
+
+            split(prefix, len(prefix))
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        shard, exact, depth = pending.pop(future)
+                        result = future.result()
+                        if not exact and len(result) >= self.split_threshold:
+                            if depth < self.max_depth:
+                                stats.splits += 1
+                                split(shard, depth)
+                            else:
+                                stats.truncated += 1
+                                truncated.append(shard + "?")
+                        for record in result:
+                            key = (record.get("reference"), record.get("unique-id"))
+                            if key in seen:
+                                stats.duplicates += 1
+                                continue
+                            seen.add(key)
+                            stats.records += 1
+                            yield record
+            finally:
+                for future in pending:
+                    future.cancel()
+        missing = []
+        if self.verify:
+            stats.partitions += 1
+            for record in self._fetch(kind, prefix + "?", False):
+                key = (record.get("reference"), record.get("unique-id"))
+                if key not in seen:
+                    seen.add(key)
+                    stats.missing += 1
+                    stats.records += 1
+                    missing.append(record.get("reference") or "")
+                    yield record
+        if missing or truncated:
+            raise QubePMPLShardedLookupIncomplete(truncated, missing, self._outside(prefix, missing))
+
+    # Characters of the references that fall outside the alphabet, past the prefix.
+    def _outside(self, prefix: str, references: list[str]) -> str:
+        characters = []
+        for reference in references:
+            for character in reference[len(prefix) : len(prefix) + self.max_depth]:
+                if character not in self.alphabet and character not in characters:
+                    characters.append(character)
+        return "".join(characters)
+
+    def users(self, prefix: str = "") -> Iterator[QubePMPLRecord]:
+        return self.lookup("user", prefix)
+
+    def properties(self, prefix: str = "") -> Iterator[QubePMPLRecord]:
+        return self.lookup("property", prefix)
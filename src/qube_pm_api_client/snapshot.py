@@ -0,0 +1,269 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from .records import QubePMPLRecord
+from .results import RECORD_TYPES, QubePMPLLookupResult, parse_lookup_response
+
+##############################################
+# On-disk reference-data snapshot (SQLite)
+##############################################
+
+# Local copy of users, properties, funds and fund headings so workers can start without
+# wildcard lookups against Qube.
+# Records are stored per scope, the query that produced them:
+#   user / property: "?" (the full wildcard lookup)
+#   fund: the property reference looked up
+#   heading: "<property_ref>|<fund_type>"
+# Each scope remembers when it was last fetched; refresh_stale re-queries only scopes older than max_age.
+# Records are indexed by (kind, reference) and (kind, unique_id).
+# source for refreshes: a QubePMPLSessionPool (a session is leased per lookup) or a single QubePMPLAPISession.
+# Refreshes bypass any lookup cache on the session.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    kind TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    unique_id TEXT NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_scope ON records (kind, scope);
+CREATE INDEX IF NOT EXISTS records_reference ON records (kind, reference);
+CREATE INDEX IF NOT EXISTS records_unique_id ON records (kind, unique_id);
+CREATE TABLE IF NOT EXISTS scopes (
+    kind TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (kind, scope)
+);
+"""
+
+
+class QubePMPLSnapshot:
+    def __init__(self, path: str, max_age: float = 24 * 3600.0):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._names_cache: dict = {}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Reading
+
+    def _record(self, kind: str, fields: str) -> QubePMPLRecord:
+        names, values = json.loads(fields)
+        names = tuple(names)
+        names = self._names_cache.setdefault(names, names)
+        return RECORD_TYPES[kind](kind, names, tuple(values))
+
+    def _query(self, kind: str, where: str, args: tuple) -> list[QubePMPLRecord]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT fields FROM records WHERE kind = ? AND {where} ORDER BY rowid",
+                (kind, *args),
+            ).fetchall()
+        return [self._record(kind, fields) for (fields,) in rows]
+
+    def records(self, kind: str, scope: str | None = None) -> list[QubePMPLRecord]:
+        if scope is None:
+            return self._query(kind, "1", ())
+        return self._query(kind, "scope = ?", (scope,))
+
+    def find(
+        self, kind: str, reference: str | None = None, unique_id: str | None = None
+    ) -> QubePMPLRecord | None:
+        if reference is not None:
+            found = self._query(kind, "reference = ?", (reference,))
+        elif unique_id is not None:
+            found = self._query(kind, "unique_id = ?", (unique_id,))
+        else:
+            raise ValueError("Provide a reference or unique_id to find.")
+        return found[0] if found else None
+
+    def users(self) -> list[QubePMPLRecord]:
+        return self.records("user")
+
+    def user(self, reference: str) -> QubePMPLRecord | None:
+        return self.find("user", reference=reference)
+
+    def properties(self) -> list[QubePMPLRecord]:
+        return self.records("property")
+
+    def property(self, reference: str) -> QubePMPLRecord | None:
+        return self.find("property", reference=reference)
+
+    def funds(self, property_ref: str) -> list[QubePMPLRecord]:
+        return self.records("fund", property_ref)
+
+    def fund(self, fund_uid: str) -> QubePMPLRecord | None:
+        return self.find("fund", unique_id=fund_uid)
+
+    def fund_headings(self, property_ref: str, fund_type: str) -> list[QubePMPLRecord]:
+        return self.records("heading", f"{property_ref}|{fund_type}")
+
+    def heading(self, heading_uid: str) -> QubePMPLRecord | None:
+        return self.find("heading", unique_id=heading_uid)
+
+    # Freshness
+
+    def refreshed_at(self, kind: str, scope: str) -> float | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT refreshed_at FROM scopes WHERE kind = ? AND scope = ?", (kind, scope)
+            ).fetchone()
+        return row[0] if row else None
+
+    def stale_scopes(self, max_age: float | None = None) -> list[tuple[str, str]]:
+        cutoff = time.time() - (self.max_age if max_age is None else max_age)
+        with self._lock:
+            return self._db.execute(
+                "SELECT kind, scope FROM scopes WHERE refreshed_at < ? ORDER BY refreshed_at",
+                (cutoff,),
+            ).fetchall()
+
+    # Writing
+
+    def store(self, kind: str, scope: str, result: QubePMPLLookupResult) -> int:
+        result.raise_for_status()
+        rows = []
+        for record in result:
+            reference = record.get("reference") or record.get("property-reference") or ""
+            if kind == "heading":
+                reference = scope.partition("|")[0]
+            rows.append(
+                (kind, scope, reference, record.get("unique-id", ""), json.dumps([record.names, record.values]))
+            )
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM records WHERE kind = ? AND scope = ?", (kind, scope))
+                self._db.executemany(
+                    "INSERT INTO records (kind, scope, reference, unique_id, fields) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO scopes (kind, scope, refreshed_at) VALUES (?, ?, ?)",
+                    (kind, scope, time.time()),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    # Refreshing from Qube
+
+    @contextmanager
+    def _session(self, source):
+        if hasattr(source, "lease"):
+            with source.lease() as session:
+                yield session
+        else:
+            try:
+                yield source
+            finally:
+                source.close_report()
+
+    def _fetch(self, source, kind: str, build_request) -> QubePMPLLookupResult:
+        with self._session(source) as session:
+            try:
+                response = session.make_request(*build_request(session), stream=True)
+            finally:
+                # Sent directly, so record the report it opens for the session's tracking.
+                session.report_open = True
+            return parse_lookup_response(response, kind)
+
+    def refresh_users(self, source) -> int:
+        result = self._fetch(source, "user", lambda s: s.get_users_request("?", False))
+        return self.store("user", "?", result)
+
+    def refresh_properties(self, source) -> int:
+        result = self._fetch(source, "property", lambda s: s.get_properties_request("?", False))
+        return self.store("property", "?", result)
+
+    def refresh_funds(self, source, property_ref: str) -> int:
+        result = self._fetch(source, "fund", lambda s: s.get_fund_request(property_ref=property_ref))
+        return self.store("fund", property_ref, result)
+
+    def refresh_fund_headings(self, source, property_ref: str, fund_type: str) -> int:
+        result = self._fetch(
+            source, "heading", lambda s: s.get_fund_heading_request(property_ref, fund_type)
+        )
+        return self.store("heading", f"{property_ref}|{fund_type}", result)
+
+    def refresh_scope(self, source, kind: str, scope: str) -> int:
+        if kind == "user":
+            return self.refresh_users(source)
+        if kind == "property":
+            return self.refresh_properties(source)
+        if kind == "fund":
+            return self.refresh_funds(source, scope)
+        if kind == "heading":
+            property_ref, _, fund_type = scope.partition("|")
+            return self.refresh_fund_headings(source, property_ref, fund_type)
+        raise ValueError(f"Unknown record kind {kind!r}.")
+
+    # Re-query every scope older than max_age. Returns the number of scopes refreshed.
+    # A scope whose lookup fails keeps its old records and stays stale.
+
+    def refresh_stale(self, source, max_age: float | None = None) -> int:
+        refreshed = 0
+        for kind, scope in self.stale_scopes(max_age):
+            try:
+                self.refresh_scope(source, kind, scope)
+            except Exception:
+                continue
+            refreshed += 1
+        return refreshed
+
+
+# Background thread that calls snapshot.refresh_stale(source) every `interval` seconds.
+
+
+class QubePMPLSnapshotRefresher:
+    def __init__(self, snapshot: QubePMPLSnapshot, source, interval: float = 300.0):
+        self.snapshot = snapshot
+        self.source = source
+        self.interval = interval
+        self.refreshes = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "QubePMPLSnapshotRefresher":
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="qube-snapshot-refresh", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.refreshes += self.snapshot.refresh_stale(self.source)
+            self._stop.wait(self.interval)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,491 @@
+import argparse
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape, quoteattr
+
+##############################################
+# Local stand-in for the Qube SOAP web service
+##############################################
+
+# Offline replacement for a Qube tenant, for load and latency testing of the pool, async and bulk paths.
+# Implements Login-Overload-4, Logout, CloseReport and QubeProcess-1ia with PURAPI:webAPI
+# (user / property / fund / heading lookups) and PUR:Invoice.ws (post-journal).
+# Every QubeProcess-1ia call opens a report on the session; a second one before CloseReport is
+# refused with a "Report already open" status, as Qube does.
+# Reference lookups: exact="true" matches the reference exactly, otherwise "?" is a wildcard for any
+# run of characters and a reference without one matches as a prefix ("?" alone returns everything).
+
+_SOAP_NS = "{http://schemas.xmlsoap.org/soap/envelope/}"
+_WEB_NS = "{http://qube.qubeglobal.com/ns/webservice/}"
+
+ERROR_INVALID_SESSION = "1"
+ERROR_LOGIN_FAILED = "2"
+ERROR_REPORT_OPEN = "12"
+ERROR_BAD_REQUEST = "20"
+ERROR_UNKNOWN_REFERENCE = "30"
+ERROR_TOTALS = "40"
+ERROR_DUPLICATE = "42"
+
+FUND_TYPES = ("Service Charge", "Admin Charge", "Reserve Fund")
+HEADING_NAMES = ("Cleaning", "Gardening", "Repairs", "Insurance", "Utilities", "Management")
+
+
+# Snapshot of stand-in counters.
+# report_conflicts: QubeProcess calls refused because the session already had a report open.
+# injected_faults: requests answered with a SOAP fault because of error_rate.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLStandInStats:
+    requests: int
+    logins: int
+    logouts: int
+    close_reports: int
+    lookups: int
+    posts: int
+    report_conflicts: int
+    injected_faults: int
+    sessions: int
+
+
+def _envelope(response: str, inner: str | bytes) -> bytes:
+    if isinstance(inner, str):
+        inner = inner.encode("utf-8")
+    return b"".join(
+        (
+            b'<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body>',
+            f"<{response}>".encode(),
+            inner,
+            f"</{response}></soapenv:Body></soapenv:Envelope>".encode(),
+        )
+    )
+
+
+def _status(error_code: str = "", error_message: str = "") -> str:
+    return f"<status error-code={quoteattr(error_code)} error-message={quoteattr(error_message)}/>"
+
+
+def _fault(message: str) -> bytes:
+    return _envelope("soapenv:Fault", f"<faultcode>soapenv:Server</faultcode><faultstring>{escape(message)}</faultstring>")
+
+
+def _record(tag: str, fields: dict) -> bytes:
+    inner = "".join(f"<{name}>{escape(value)}</{name}>" for name, value in fields.items())
+    return f"<{tag}>{inner}</{tag}>".encode("utf-8")
+
+
+def _text(element: ET.Element | None, path: str) -> str:
+    if element is None:
+        return ""
+    found = element.find(path)
+    return (found.text or "").strip() if found is not None else ""
+
+
+def _matches(reference: str, pattern: str, exact: bool) -> bool:
+    if exact:
+        return reference == pattern
+    if "?" in pattern:
+        return fnmatchcase(reference, pattern.replace("*", "[*]").replace("?", "*"))
+    return reference.startswith(pattern)
+
+
+# Generated reference data. Fund and heading unique ids are numbered across the whole dataset.
+
+
+class QubePMPLStandInDataset:
+    def __init__(
+        self,
+        users: int = 25,
+        properties: int = 100,
+        funds_per_property: int = 3,
+        headings_per_fund: int = 4,
+    ):
+        self.users = [
+            {"reference": f"USER{i:04d}", "name": f"User {i}"} for i in range(1, users + 1)
+        ]
+        self.properties = []
+        self.funds = []
+        self.headings: dict[tuple[str, str], list[dict]] = {}
+        self.heading_properties: dict[str, str] = {}
+        next_fund = 1
+        next_heading = 1000
+        for i in range(1, properties + 1):
+            property_ref = f"{i:03d}/01"
+            self.properties.append(
+                {"reference": property_ref, "unique-id": str(i), "name": f"Property {i}"}
+            )
+            for f in range(funds_per_property):
+                fund_type = FUND_TYPES[f % len(FUND_TYPES)]
+                if f >= len(FUND_TYPES):
+                    fund_type = f"{fund_type} {f // len(FUND_TYPES) + 1}"
+                self.funds.append(
+                    {
+                        "unique-id": str(next_fund),
+                        "property-reference": property_ref,
+                        "owner-reference": f"OWN{i:03d}",
+                        "fund-type": fund_type,
+                        "description": f"{fund_type} {property_ref}",
+                    }
+                )
+                next_fund += 1
+                headings = self.headings.setdefault((property_ref, fund_type), [])
+                for h in range(headings_per_fund):
+                    heading_uid = str(next_heading)
+                    headings.append(
+                        {
+                            "unique-id": heading_uid,
+                            "description": HEADING_NAMES[h % len(HEADING_NAMES)],
+                        }
+                    )
+                    self.heading_properties[heading_uid] = property_ref
+                    next_heading += 1
+        self.property_refs = {p["reference"] for p in self.properties}
+        # Records are rendered once; lookups only join the matching ones.
+        self._user_xml = [_record("user", u) for u in self.users]
+        self._property_xml = [_record("property", p) for p in self.properties]
+        self._fund_xml = [_record("fund", f) for f in self.funds]
+        self._heading_xml = {
+            key: [_record("heading", h) for h in headings] for key, headings in self.headings.items()
+        }
+
+    def users_xml(self, ref: str, exact: bool) -> list[bytes]:
+        return [x for u, x in zip(self.users, self._user_xml) if _matches(u["reference"], ref, exact)]
+
+    def properties_xml(self, ref: str, exact: bool) -> list[bytes]:
+        return [
+            x for p, x in zip(self.properties, self._property_xml) if _matches(p["reference"], ref, exact)
+        ]
+
+    def funds_xml(self, property_ref: str, fund_uid: str, owner_ref: str, description: str) -> list[bytes]:
+        return [
+            x
+            for f, x in zip(self.funds, self._fund_xml)
+            if (not property_ref or f["property-reference"] == property_ref)
+            and (not fund_uid or f["unique-id"] == fund_uid)
+            and (not owner_ref or f["owner-reference"] == owner_ref)
+            and (not description or description.lower() in f["description"].lower())
+        ]
+
+    def headings_xml(self, property_ref: str, fund_type: str) -> list[bytes]:
+        return self._heading_xml.get((property_ref, fund_type), [])
+
+
+class _Session:
+    __slots__ = ("report_open",)
+
+    def __init__(self):
+        self.report_open = False
+
+
+# The stand-in server. port=0 picks a free port; read it back from `url`.
+# latency / jitter: seconds added to every response (latency + uniform(0, jitter)).
+# error_rate: fraction of requests answered with HTTP 500 and a SOAP fault, without touching session state.
+# username / password: if set, Login rejects other credentials.
+# seed: makes fault injection repeatable.
+
+
+class QubePMPLStandInServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dataset: QubePMPLStandInDataset | None = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        username: str | None = None,
+        password: str | None = None,
+        seed: int | None = None,
+    ):
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0 and 1.")
+        self.dataset = dataset if dataset is not None else QubePMPLStandInDataset()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.username = username
+        self.password = password
+        self.posted: dict[tuple[str, str], str] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sessions: dict[str, _Session] = {}
+        self._counts = dict.fromkeys(
+            ("requests", "logins", "logouts", "close_reports", "lookups", "posts", "report_conflicts", "injected_faults"),
+            0,
+        )
+        self._httpd = _StandInHTTPServer((host, port), _StandInHandler)
+        self._httpd.standin = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/qubews/"
+
+    def start(self) -> "QubePMPLStandInServer":
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._httpd.serve_forever, args=(0.05,), name="qube-standin", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self) -> QubePMPLStandInStats:
+        with self._lock:
+            return QubePMPLStandInStats(sessions=len(self._sessions), **self._counts)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    # Request handling. Returns (http status, response body).
+
+    def handle(self, body: bytes) -> tuple[int, bytes]:
+        self._count("requests")
+        delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self._count("injected_faults")
+            return 500, _fault("Stand-in injected fault")
+        try:
+            root = ET.fromstring(body)
+        except ET.ParseError as e:
+            return 500, _fault(f"Unreadable request: {e}")
+        operation = root.find(f"{_SOAP_NS}Body/*")
+        if operation is None:
+            return 500, _fault("Empty SOAP body")
+        name = operation.tag.removeprefix(_WEB_NS)
+        if name == "Login-Overload-4":
+            return 200, self._login(operation)
+        key = _text(operation, f"{_WEB_NS}ClientSessionKey")
+        if name == "Logout":
+            return 200, self._logout(key)
+        if name == "CloseReport":
+            return 200, self._close_report(key)
+        if name == "QubeProcess-1ia":
+            return 200, self._process(key, operation)
+        return 500, _fault(f"Unknown operation {name}")
+
+    def _login(self, operation: ET.Element) -> bytes:
+        data = operation.find(f"{_WEB_NS}LoginData/logondata")
+        key = _text(data, "clientsessionkey")
+        if not key:
+            return _envelope("Login-Overload-4Response", _status(ERROR_BAD_REQUEST, "Missing client session key"))
+        if (self.username is not None and _text(data, "username") != self.username) or (
+            self.password is not None and _text(data, "password") != self.password
+        ):
+            return _envelope("Login-Overload-4Response", _status(ERROR_LOGIN_FAILED, "Invalid username or password"))
+        with self._lock:
+            self._sessions[key] = _Session()
+            self._counts["logins"] += 1
+        return _envelope("Login-Overload-4Response", _status())
+
+    def _logout(self, key: str) -> bytes:
+        with self._lock:
+            known = self._sessions.pop(key, None) is not None
+            self._counts["logouts"] += 1
+        if not known:
+            return _envelope("LogoutResponse", _status(ERROR_INVALID_SESSION, "Invalid client session key"))
+        return _envelope("LogoutResponse", _status())
+
+    def _close_report(self, key: str) -> bytes:
+        with self._lock:
+            session = self._sessions.get(key)
+            self._counts["close_reports"] += 1
+            if session is not None:
+                session.report_open = False
+        if session is None:
+            return _envelope("CloseReportResponse", _status(ERROR_INVALID_SESSION, "Invalid client session key"))
+        return _envelope("CloseReportResponse", "")
+
+    def _process(self, key: str, operation: ET.Element) -> bytes:
+        process = _text(operation, f"{_WEB_NS}QubeProcessName")
+        request = operation.find(f"{_WEB_NS}Data/request-to-qube")
+        if request is None or not len(request):
+            return _envelope("QubeProcess-1iaResponse", _status(ERROR_BAD_REQUEST, "Missing request-to-qube"))
+        if process == "PUR:Invoice.ws":
+            journal = request.find("post-journal")
+            kind = "post-journal"
+        else:
+            journal = None
+            kind = request[0].tag
+        with self._lock:
+            session = self._sessions.get(key)
+            error = None
+            if session is None:
+                error = (ERROR_INVALID_SESSION, "Invalid client session key")
+            elif session.report_open:
+                error = (ERROR_REPORT_OPEN, "Report already open")
+                self._counts["report_conflicts"] += 1
+            else:
+                session.report_open = True
+            self._counts["posts" if journal is not None else "lookups"] += 1
+        if error is not None:
+            return self._failure(kind, *error)
+        if process == "PUR:Invoice.ws":
+            if journal is None:
+                return self._failure(kind, ERROR_BAD_REQUEST, "Missing post-journal")
+            return self._post_journal(journal)
+        if process != "PURAPI:webAPI":
+            return self._failure(kind, ERROR_BAD_REQUEST, f"Unknown process {process}")
+        return self._lookup(request[0])
+
+    def _failure(self, kind: str, error_code: str, error_message: str) -> bytes:
+        status = _status(error_code, error_message)
+        if kind == "post-journal":
+            return _envelope("QubeProcess-1iaResponse", f"<post-journal><success>false</success>{status}</post-journal>")
+        return _envelope("QubeProcess-1iaResponse", f'<{kind} success="false">{status}</{kind}>')
+
+    def _lookup(self, lookup: ET.Element) -> bytes:
+        kind = lookup.tag
+        dataset = self.dataset
+        if kind in ("user-lookup", "property-lookup"):
+            reference = lookup.find("reference")
+            ref = (reference.text or "").strip() if reference is not None else ""
+            exact = reference is not None and reference.get("exact", "false").lower() == "true"
+            if kind == "user-lookup":
+                records = dataset.users_xml(ref, exact)
+            else:
+                records = dataset.properties_xml(ref, exact)
+        elif kind == "fund-lookup":
+            args = [_text(lookup, n) for n in ("property-reference", "unique-id", "owner-reference", "description")]
+            if not any(args[:3]):
+                return self._failure(kind, ERROR_BAD_REQUEST, "A property reference, fund unique id or owner reference is required")
+            records = dataset.funds_xml(*args)
+        elif kind == "heading-lookup":
+            records = dataset.headings_xml(_text(lookup, "property-reference"), _text(lookup, "fund-type"))
+        else:
+            return self._failure(kind, ERROR_BAD_REQUEST, f"Unknown lookup {kind}")
+        return _envelope(
+            "QubeProcess-1iaResponse",
+            f'<{kind} success="true">'.encode() + b"".join(records) + f"</{kind}>".encode(),
+        )
+
+    def _post_journal(self, journal: ET.Element) -> bytes:
+        supplier_ref = _text(journal, "supplier-reference")
+        invoice_number = _text(journal, "invoice-number")
+        details = journal.findall("detail")
+        try:
+            nett, vat, gross = (round(float(_text(journal, n)) * 100) for n in ("nett", "vat", "gross"))
+            lines = [
+                tuple(round(float(_text(d, n)) * 100) for n in ("nett", "vat", "gross")) for d in details
+            ]
+        except ValueError:
+            return self._failure("post-journal", ERROR_BAD_REQUEST, "Amounts must be numbers")
+        if not supplier_ref or not invoice_number or not details:
+            return self._failure(
+                "post-journal", ERROR_BAD_REQUEST, "supplier-reference, invoice-number and a detail line are required"
+            )
+        if nett + vat != gross or any(n + v != g for n, v, g in lines):
+            return self._failure("post-journal", ERROR_TOTALS, "Gross does not equal nett plus VAT")
+        if tuple(map(sum, zip(*lines))) != (nett, vat, gross):
+            return self._failure("post-journal", ERROR_TOTALS, "Detail lines do not add up to the invoice totals")
+        for detail in details:
+            property_ref = _text(detail, "property-reference")
+            heading_uid = _text(detail, "heading-unique-id")
+            if property_ref not in self.dataset.property_refs:
+                return self._failure("post-journal", ERROR_UNKNOWN_REFERENCE, f"Unknown property {property_ref}")
+            if self.dataset.heading_properties.get(heading_uid) != property_ref:
+                return self._failure(
+                    "post-journal", ERROR_UNKNOWN_REFERENCE, f"Unknown heading {heading_uid} for property {property_ref}"
+                )
+        with self._lock:
+            if (supplier_ref, invoice_number) in self.posted:
+                duplicate = True
+            else:
+                duplicate = False
+                journal_number = str(len(self.posted) + 1)
+                self.posted[(supplier_ref, invoice_number)] = journal_number
+        if duplicate:
+            return self._failure("post-journal", ERROR_DUPLICATE, "Duplicate invoice")
+        return _envelope(
+            "QubeProcess-1iaResponse",
+            f"<post-journal><success>true</success><journal-number>{journal_number}</journal-number></post-journal>",
+        )
+
+
+class _StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    standin: QubePMPLStandInServer
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: _StandInHTTPServer
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, content = self.server.standin.handle(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# python -m src.qube_pm_api_client.standin --port 8080 --latency 0.02 --error-rate 0.01
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Local Qube SOAP stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--users", type=int, default=25)
+    parser.add_argument("--properties", type=int, default=100)
+    parser.add_argument("--funds-per-property", type=int, default=3)
+    parser.add_argument("--headings-per-fund", type=int, default=4)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    dataset = QubePMPLStandInDataset(
+        args.users, args.properties, args.funds_per_property, args.headings_per_fund
+    )
+    server = QubePMPLStandInServer(
+        args.host,
+        args.port,
+        dataset=dataset,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(f"Qube stand-in listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import threading
+import time
+from dataclasses import dataclass
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from .instrumentation import current_call
+
+##############################################
+# HTTP transports for the Qube PM API client
+##############################################
+
+# Base transport. Posts each SOAP request with the module level requests.post,
+# so every call opens (and tears down) its own TCP/TLS connection.
+# stream: leave the body unread so it can be consumed incrementally with iter_content.
+# timeout: (connect, read) seconds as taken by requests, None to wait indefinitely.
+
+
+class QubePMPLTransport:
+    def post(self, url: str, data, headers: dict, stream: bool = False, timeout=None) -> requests.Response:
+        if timeout is None:
+            return requests.post(url, data=data, headers=headers, stream=stream)
+        return requests.post(url, data=data, headers=headers, stream=stream, timeout=timeout)
+
+    def close(self) -> None:
+        pass
+
+
+# Snapshot of connection usage for a pooled transport.
+# connections_reused counts requests that were served on an already open keep-alive connection.
+
+
+@dataclass(frozen=True, slots=True)
+class QubePMPLTransportStats:
+    requests: int
+    connections_opened: int
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_opened, 0)
+
+    @property
+    def reuse_ratio(self) -> float:
+        if not self.requests:
+            return 0.0
+        return self.connections_reused / self.requests
+
+
+# Thread safe counters behind QubePMPLTransportStats.
+
+
+class _TransportCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def request_sent(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def connection_opened(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self) -> QubePMPLTransportStats:
+        with self._lock:
+            return QubePMPLTransportStats(
+                requests=self.requests, connections_opened=self.connections_opened
+            )
+
+
+# Connection that records connect / send / wait phases on the instrumented call in flight, if any.
+# send excludes a connect that happens lazily inside request(); connect is 0.0 on a reused connection.
+
+
+def _timed_connection_class(base: type) -> type:
+    class TimedConnection(base):
+        def connect(self):
+            call = current_call()
+            if call is None:
+                return super().connect()
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                call.add_phase("connect", time.perf_counter() - start)
+
+        def request(self, *args, **kwargs):
+            call = current_call()
+            if call is None:
+                return super().request(*args, **kwargs)
+            connected = call.connect or 0.0
+            start = time.perf_counter()
+            try:
+                return super().request(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                call.add_phase("send", elapsed - ((call.connect or 0.0) - connected))
+                if call.connect is None:
+                    call.connect = 0.0
+
+        def getresponse(self, *args, **kwargs):
+            call = current_call()
+            if call is None:
+                return super().getresponse(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return super().getresponse(*args, **kwargs)
+            finally:
+                call.add_phase("wait", time.perf_counter() - start)
+
+    return TimedConnection
+
+
+def _counting_pool_class(base: type, counters: _TransportCounters) -> type:
+    class CountingConnectionPool(base):
+        ConnectionCls = _timed_connection_class(base.ConnectionCls)
+
+        def _new_conn(self):
+            counters.connection_opened()
+            return super()._new_conn()
+
+    return CountingConnectionPool
+
+
+# Adapter that swaps urllib3's connection pools for ones that count new connections
+# and time request phases.
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    def __init__(self, counters: _TransportCounters, **kwargs):
+        self.counters = counters
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.counters),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.counters),
+        }
+
+
+# Pooled keep-alive transport. Share one instance between a client and all of its sessions
+# so Login, lookups, CloseReport and posting reuse the same open connections.
+# max_hosts: number of per-host pools kept open.
+# max_connections_per_host: keep-alive connections kept per host (and the in-flight cap when block=True).
+# block: wait for a free connection instead of opening a throwaway one when the host pool is exhausted.
+
+
+class QubePMPLPooledTransport(QubePMPLTransport):
+    def __init__(
+        self,
+        max_hosts: int = 4,
+        max_connections_per_host: int = 10,
+        block: bool = False,
+    ):
+        if max_hosts < 1 or max_connections_per_host < 1:
+            raise ValueError("max_hosts and max_connections_per_host must be at least 1.")
+        self.max_hosts = max_hosts
+        self.max_connections_per_host = max_connections_per_host
+        self.block = block
+        self._counters = _TransportCounters()
+        adapter = _CountingHTTPAdapter(
+            self._counters,
+            pool_connections=max_hosts,
+            pool_maxsize=max_connections_per_host,
+            pool_block=block,
+        )
+        self.http = requests.Session()
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    def post(self, url: str, data, headers: dict, stream: bool = False, timeout=None) -> requests.Response:
+        self._counters.request_sent()
+        return self.http.post(url, data=data, headers=headers, stream=stream, timeout=timeout)
+
+    def stats(self) -> QubePMPLTransportStats:
+        return self._counters.snapshot()
+
+    def close(self) -> None:
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,99 @@
+import pytest
+
+from conftest import make_invoice
+from src.qube_pm_api_client.lifecycle import default_logout_worker
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLInvoiceLine
+from src.qube_pm_api_client.pool import QubePMPLSessionPool
+from src.qube_pm_api_client.bulk import QubePMPLBulkPoster
+from src.qube_pm_api_client.standin import QubePMPLStandInDataset
+from src.qube_pm_api_client.transport import QubePMPLPooledTransport
+
+
+pytestmark = pytest.mark.standin(
+    dataset=QubePMPLStandInDataset(users=5, properties=12, funds_per_property=2, headings_per_fund=2),
+    username="user",
+    password="secret",
+)
+
+
+@pytest.fixture
+def client(standin):
+    transport = QubePMPLPooledTransport()
+    yield QubePMPLAPIClient(standin.url, "user", "secret", "group", transport=transport)
+    transport.close()
+
+
+def test_standin_login_checks_credentials(standin):
+    bad = QubePMPLAPIClient(standin.url, "user", "wrong", "group")
+    with pytest.raises(Exception, match="Invalid username or password"):
+        bad.get_session()
+
+
+def test_standin_lookups_and_one_open_report_rule(client):
+    session = client.get_session()
+    properties = session.lookup_properties()
+    assert len(properties) == 12
+    again = session.lookup_properties()
+    assert not again.success
+    assert again.error_message == "Report already open"
+    session.close_report()
+    assert [p.reference for p in session.lookup_properties("01?")] == [f"{i:03d}/01" for i in range(10, 13)]
+    session.close_report()
+    funds = session.lookup_funds(property_ref="003/01")
+    assert [f.fund_type for f in funds] == ["Service Charge", "Admin Charge"]
+    session.close_report()
+    headings = session.lookup_fund_headings("003/01", "Admin Charge")
+    assert len(headings) == 2
+    session.close_report()
+    assert len(session.lookup_users("USER0003", exact=True)) == 1
+
+
+def test_standin_post_journal_validates_and_rejects_duplicates(client, standin):
+    session = client.get_session()
+    headings = session.lookup_fund_headings("001/01", "Service Charge")
+    session.close_report()
+    heading_uid = headings[0].unique_id
+    assert session.post_journal(make_invoice("INV-1"), "001/01", "USER0001", heading_uid).success
+    session.close_report()
+    duplicate = session.post_journal(make_invoice("INV-1"), "001/01", "USER0001", heading_uid)
+    assert duplicate.error_message == "Duplicate invoice"
+    session.close_report()
+    totals = session.post_journal(make_invoice("INV-2", gross=121.0), "001/01", "USER0001", heading_uid)
+    assert totals.error_code == "40"
+    session.close_report()
+    wrong = session.post_journal(make_invoice("INV-3"), "002/01", "USER0001", heading_uid)
+    assert not wrong.success
+    assert list(standin.posted) == [("SUP1", "INV-1")]
+
+
+def test_standin_accepts_a_multi_line_journal(client, standin):
+    first = standin.dataset.headings[("001/01", "Service Charge")][0]["unique-id"]
+    second = standin.dataset.headings[("002/01", "Admin Charge")][1]["unique-id"]
+    invoice = make_invoice("INV-split")
+    invoice.lines = [
+        QubePMPLInvoiceLine(75.0, 15.0, 90.0, "1", "001/01", first),
+        QubePMPLInvoiceLine(25.0, 5.0, 30.0, "2", "002/01", second),
+    ]
+    session = client.get_session()
+    assert session.post_journal(invoice, "", "USER0001", "").success
+    assert list(standin.posted) == [("SUP1", "INV-split")]
+    assert standin.stats().posts == 1
+
+
+def test_standin_injects_faults_and_drives_bulk_poster(standin, client):
+    headings = standin.dataset.headings[("001/01", "Service Charge")]
+    with QubePMPLSessionPool(client, size=3) as pool:
+        jobs = [(make_invoice(f"INV-{i}"), "001/01", "USER0001", headings[0]["unique-id"]) for i in range(30)]
+        results = list(QubePMPLBulkPoster(pool, concurrency=3).post(jobs))
+    assert all(r.success for r in results)
+    assert default_logout_worker().drain(timeout=5)
+    stats = standin.stats()
+    assert stats.posts == 30
+    assert stats.report_conflicts == 0
+    assert stats.logins == 3
+    assert stats.logouts == 3
+
+    standin.error_rate = 1.0
+    response = client.login()
+    assert response.status_code == 500
+    assert standin.stats().injected_faults == 1
@@ -0,0 +1,77 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from unittest.mock import patch, MagicMock
+
+from conftest import LOGIN_OK
+from src.qube_pm_api_client.main import QubePMPLAPIClient, QubePMPLAPISession
+from src.qube_pm_api_client.transport import (
+    QubePMPLTransport,
+    QubePMPLPooledTransport,
+)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(LOGIN_OK)))
+        self.end_headers()
+        self.wfile.write(LOGIN_OK)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/qubews/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_default_transport_uses_requests_post():
+    session = QubePMPLAPISession(client_session_key="s1", base_url="https://api.test/")
+    assert type(session.transport) is QubePMPLTransport
+    with patch("src.qube_pm_api_client.transport.requests.post") as mock_post:
+        mock_post.return_value = MagicMock()
+        session.close_report()
+    mock_post.assert_called_once()
+
+
+def test_pooled_transport_reuses_connections(local_url):
+    with QubePMPLPooledTransport(max_connections_per_host=2) as transport:
+        session = QubePMPLAPISession(
+            client_session_key="s1", base_url=local_url, transport=transport
+        )
+        for _ in range(5):
+            assert session.get_users().status_code == 200
+        stats = transport.stats()
+    assert stats.requests == 5
+    assert stats.connections_opened == 1
+    assert stats.connections_reused == 4
+    assert stats.reuse_ratio == pytest.approx(0.8)
+
+
+def test_client_sessions_share_transport(local_url):
+    transport = QubePMPLPooledTransport()
+    client = QubePMPLAPIClient(
+        base_url=local_url, username="u", password="p", group="g", transport=transport
+    )
+    session = client.get_session()
+    assert session.transport is transport
+    session.close_report()
+    assert transport.stats().connections_opened == 1
+    transport.close()
+
+
+def test_pooled_transport_rejects_bad_limits():
+    with pytest.raises(ValueError):
+        QubePMPLPooledTransport(max_connections_per_host=0)